@@ -3,7 +3,7 @@ import json
 import logging
 import re
 import time
-from typing import Set
+from typing import Optional, Set
 
 import httpx
 import i18n
@@ -12,6 +12,7 @@ from httpx import HTTPError
 
 from folio_migration_tools.helper import Helper
 from folio_migration_tools.migration_report import MigrationReport
+from folio_migration_tools.rate_limiter import RateLimiters
 from folio_migration_tools.transaction_migration.legacy_loan import LegacyLoan
 from folio_migration_tools.transaction_migration.legacy_request import LegacyRequest
 from folio_migration_tools.transaction_migration.transaction_result import (
@@ -27,8 +28,13 @@ class CirculationHelper:
         folio_client: FolioClient,
         service_point_id,
         migration_report: MigrationReport,
+        rate_limiters: Optional[RateLimiters] = None,
+        http_client: Optional[httpx.Client] = None,
     ):
         self.folio_client = folio_client
+        self.rate_limiters = rate_limiters or RateLimiters()
+        # Owned by the caller. Without one, a client is borrowed for each request
+        self.http_client = http_client
         self.service_point_id = service_point_id
         self.missing_patron_barcodes: Set[str] = set()
         self.missing_item_barcodes: Set[str] = set()
@@ -147,7 +153,9 @@ class CirculationHelper:
                     f"Item Barcode:{legacy_loan.item_barcode}"
                 )
                 return TransactionResult(False, False, "", error_message, error_message)
-            req = httpx.post(url, headers=self.folio_client.okapi_headers, json=data, timeout=None)
+            with Helper.borrow_http_client(self.folio_client, self.http_client) as client:
+                with self.rate_limiters.limit(url):
+                    req = client.post(url, headers=self.folio_client.okapi_headers, json=data)
             if req.status_code == 422:
                 error_message_from_folio = json.loads(req.text)["errors"][0]["message"]
                 stat_message = error_message_from_folio
@@ -245,7 +253,11 @@ class CirculationHelper:
 
     @staticmethod
     def create_request(
-        folio_client: FolioClient, legacy_request: LegacyRequest, migration_report: MigrationReport
+        folio_client: FolioClient,
+        legacy_request: LegacyRequest,
+        migration_report: MigrationReport,
+        rate_limiters: Optional[RateLimiters] = None,
+        http_client: Optional[httpx.Client] = None,
     ):
         try:
             path = "/circulation/requests"
@@ -261,7 +273,9 @@ class CirculationHelper:
                     "comment": "Migrated from legacy system",
                 }
             }
-            req = httpx.post(url, headers=folio_client.okapi_headers, json=data, timeout=None)
+            with Helper.borrow_http_client(folio_client, http_client) as client:
+                with (rate_limiters or RateLimiters()).limit(url):
+                    req = client.post(url, headers=folio_client.okapi_headers, json=data)
             logging.debug(f"POST {req.status_code}\t{url}\t{json.dumps(data)}")
             if str(req.status_code) == "422":
                 message = json.loads(req.text)["errors"][0]["message"]
@@ -307,7 +321,13 @@ class CirculationHelper:
             logging.info("Loaded %s barcodes from items", len(item_barcodes))
 
     @staticmethod
-    def extend_open_loan(folio_client: FolioClient, loan, extension_due_date, extend_out_date):
+    def extend_open_loan(
+        folio_client: FolioClient,
+        loan,
+        extension_due_date,
+        extend_out_date,
+        http_client: Optional[httpx.Client] = None,
+    ):
         try:
             loan_to_put = copy.deepcopy(loan)
             del loan_to_put["metadata"]
@@ -315,9 +335,8 @@ class CirculationHelper:
             loan_to_put["loanDate"] = extend_out_date.isoformat()
             url = f"{folio_client.okapi_url}/circulation/loans/{loan_to_put['id']}"
 
-            req = httpx.put(
-                url, headers=folio_client.okapi_headers, json=loan_to_put, timeout=None
-            )
+            with Helper.borrow_http_client(folio_client, http_client) as client:
+                req = client.put(url, headers=folio_client.okapi_headers, json=loan_to_put)
             logging.info(
                 "%s\tPUT Extend loan %s to %s\t %s",
                 req.status_code,
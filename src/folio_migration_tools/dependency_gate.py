@@ -0,0 +1,107 @@
+import threading
+from typing import Iterable, Optional
+
+
+class DependencyGate:
+    """Keeps track of the records posted by BatchPosters running at the same time, so
+    that records can wait for the records they refer to.
+
+    A poster tells the gate which records it has dispatched, and which of them were
+    acknowledged by FOLIO or failed. A record referring to one of them is ready to post
+    once the record it refers to is acknowledged or failed. A record referring to a
+    record the poster has not dispatched is ready once that poster is finished, since
+    the record is not part of the load and may already be in FOLIO. When a poster
+    finishes, its records still in flight are counted as failed.
+
+    Records that failed before their ids were known, like rows that could not be read,
+    and the rest of the rows of a poster that halted, are never dispatched. Once such a
+    poster finishes, every record of its object type not acknowledged counts as failed.
+
+    The gate is safe to share between threads.
+    """
+
+    def __init__(self):
+        self.dispatched: dict = {}
+        self.acknowledged: dict = {}
+        self.failed: dict = {}
+        self.finished: set = set()
+        self.incomplete: set = set()
+        self.condition = threading.Condition()
+
+    def dispatch(self, object_type: str, ids: Iterable[str]):
+        with self.condition:
+            self.dispatched.setdefault(object_type, set()).update(ids)
+
+    def acknowledge(self, object_type: str, ids: Iterable[str]):
+        with self.condition:
+            self.settle(object_type, ids, self.acknowledged)
+
+    def fail(self, object_type: str, ids: Iterable[str]):
+        with self.condition:
+            self.settle(object_type, ids, self.failed)
+
+    def fail_unidentified(self, object_type: str):
+        """Records that records of the object type failed before their ids were known"""
+        with self.condition:
+            self.incomplete.add(object_type)
+
+    def settle(self, object_type: str, ids: Iterable[str], outcome: dict):
+        """Records the outcome. A record posted again, like in a rerun of the failed
+        records, only keeps its latest outcome"""
+        dispatched = self.dispatched.setdefault(object_type, set())
+        settled = outcome.setdefault(object_type, set())
+        other_outcome = self.failed if outcome is self.acknowledged else self.acknowledged
+        unsettled = other_outcome.setdefault(object_type, set())
+        for record_id in ids:
+            dispatched.discard(record_id)
+            unsettled.discard(record_id)
+            settled.add(record_id)
+        self.condition.notify_all()
+
+    def finish(self, object_type: str, complete: bool = True):
+        """Marks the poster of the object type as done
+
+        Args:
+            object_type (str): The object type of the poster
+            complete (bool): Whether the poster got through all of its rows. Defaults
+                to True
+        """
+        with self.condition:
+            if not complete:
+                self.incomplete.add(object_type)
+            self.failed.setdefault(object_type, set()).update(
+                self.dispatched.pop(object_type, set())
+            )
+            self.finished.add(object_type)
+            self.condition.notify_all()
+
+    def is_ready(self, object_type: str, ids: Iterable[str]) -> bool:
+        if object_type in self.finished:
+            return True
+        acknowledged = self.acknowledged.get(object_type, set())
+        failed = self.failed.get(object_type, set())
+        return all(record_id in acknowledged or record_id in failed for record_id in ids)
+
+    def wait(self, object_type: str, ids: set, timeout: Optional[float] = None) -> bool:
+        """Waits until the records of the object type with these ids are posted or failed
+
+        Args:
+            object_type (str): The object type of the records waited for
+            ids (set): The ids of the records
+            timeout (Optional[float]): The longest wait, in seconds. Waits until the
+                records are ready if None
+
+        Returns:
+            bool: Whether the records are ready
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: self.is_ready(object_type, ids), timeout)
+
+    def get_failed(self, object_type: str, ids: Iterable[str]) -> set:
+        """Returns the ids that failed to post"""
+        with self.condition:
+            if object_type in self.incomplete:
+                acknowledged = self.acknowledged.get(object_type, set())
+                return {record_id for record_id in ids if record_id not in acknowledged}
+            failed = self.failed.get(object_type, set())
+            return {record_id for record_id in ids if record_id in failed}
@@ -97,6 +97,12 @@ class FolderStructure:
         )
 
         self.migration_reports_file = self.reports_folder / f"report{self.file_template}.md"
+        self.request_metrics_path = (
+            self.reports_folder / f"request_metrics{self.file_template}.json"
+        )
+        self.progress_journal_path = (
+            self.results_folder / f"progress_journal_{self.migration_task_name}.json"
+        )
 
         self.srs_records_path = (
             self.results_folder / f"folio_srs_{object_type_string}{self.file_template}.json"
@@ -0,0 +1,124 @@
+import logging
+import threading
+import time
+from typing import Callable, List
+
+import httpx
+
+# Responses that tell that the gateway, rather than the FOLIO module, is in trouble
+GATEWAY_ERROR_STATUS_CODES = {502, 503, 504}
+
+
+class GatewayPool:
+    """Spreads requests over several equivalent Okapi or Kong gateway URLs.
+
+    The gateways are chosen round-robin. A gateway that fails eject_after_failures
+    times in a row, with a connection error or a 502, 503 or 504 response, is ejected
+    from the pool for eject_seconds. After that it gets requests again, and is ejected
+    again on its first failure. If all gateways are ejected, the one that is due back
+    first is used.
+
+    The canonical URL, the okapi_url of the library configuration, is only used to
+    recognise the requests to rewrite. It stays the URL that deterministic UUIDs are
+    generated from. The pool is safe to share between threads.
+    """
+
+    def __init__(
+        self,
+        base_urls: List[str],
+        canonical_url: str,
+        eject_after_failures: int = 3,
+        eject_seconds: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if not base_urls:
+            raise ValueError("A gateway pool needs at least one base URL")
+        self.base_urls = [base_url.rstrip("/") for base_url in base_urls]
+        self.canonical_url = canonical_url.rstrip("/")
+        self.eject_after_failures = eject_after_failures
+        self.eject_seconds = eject_seconds
+        self.clock = clock
+        self.failures = {base_url: 0 for base_url in self.base_urls}
+        self.ejected_until = {base_url: 0.0 for base_url in self.base_urls}
+        self.stats = {
+            base_url: {"requests": 0, "failures": 0, "ejections": 0} for base_url in self.base_urls
+        }
+        self.next_index = 0
+        self.lock = threading.Lock()
+
+    def choose(self) -> str:
+        """Returns the base URL of the gateway to send the next request to"""
+        with self.lock:
+            now = self.clock()
+            for _ in range(len(self.base_urls)):
+                base_url = self.base_urls[self.next_index % len(self.base_urls)]
+                self.next_index += 1
+                if self.ejected_until[base_url] <= now:
+                    break
+            else:
+                base_url = min(self.base_urls, key=lambda url: self.ejected_until[url])
+            self.stats[base_url]["requests"] += 1
+            return base_url
+
+    def report(self, base_url: str, ok: bool):
+        """Records the outcome of a request sent to the gateway"""
+        with self.lock:
+            if ok:
+                if self.failures[base_url] >= self.eject_after_failures:
+                    logging.info("Gateway %s is back in the pool", base_url)
+                self.failures[base_url] = 0
+                return
+            self.stats[base_url]["failures"] += 1
+            self.failures[base_url] += 1
+            if self.failures[base_url] >= self.eject_after_failures:
+                self.ejected_until[base_url] = self.clock() + self.eject_seconds
+                self.stats[base_url]["ejections"] += 1
+                logging.warning(
+                    "Gateway %s failed %s times in a row. Ejected for %ss",
+                    base_url,
+                    self.failures[base_url],
+                    self.eject_seconds,
+                )
+
+    def rewrite(self, url: str, base_url: str) -> str:
+        """Returns the url with the canonical URL swapped for the base URL.
+
+        URLs that do not start with the canonical URL are returned as they are.
+        """
+        if url.startswith(self.canonical_url):
+            return base_url + url[len(self.canonical_url) :]
+        return url
+
+
+class GatewayTransport(httpx.BaseTransport):
+    """An httpx transport that sends each request to a gateway chosen by the pool"""
+
+    def __init__(self, pool: GatewayPool, transport: httpx.BaseTransport):
+        self.pool = pool
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        url = str(request.url)
+        if not url.startswith(self.pool.canonical_url):
+            return self.transport.handle_request(request)
+        base_url = self.pool.choose()
+        request.url = httpx.URL(self.pool.rewrite(url, base_url))
+        request.headers["Host"] = request.url.netloc.decode("ascii")
+        try:
+            response = self.transport.handle_request(request)
+        except httpx.TransportError:
+            self.pool.report(base_url, False)
+            raise
+        self.pool.report(base_url, response.status_code not in GATEWAY_ERROR_STATUS_CODES)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+def merge_gateway_stats(stats: dict, other: dict):
+    """Adds the gateway stats of another pool, like the one of a worker process"""
+    for base_url, counts in other.items():
+        merged = stats.setdefault(base_url, {"requests": 0, "failures": 0, "ejections": 0})
+        for key, count in counts.items():
+            merged[key] += count
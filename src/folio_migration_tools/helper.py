@@ -1,5 +1,9 @@
 import json
 import logging
+from contextlib import contextmanager
+from typing import Optional
+
+import httpx
 import i18n
 
 
@@ -53,6 +57,16 @@ class Helper:
             )
         report_file.write(details_end)
 
+    @staticmethod
+    @contextmanager
+    def borrow_http_client(folio_client, http_client: Optional[httpx.Client] = None):
+        """Yields the given client, or a client of its own that is closed after use"""
+        if http_client:
+            yield http_client
+        else:
+            with folio_client.get_folio_http_client() as own_http_client:
+                yield own_http_client
+
     @staticmethod
     def log_data_issue(index_or_id, message, legacy_value):
         logging.log(26, "DATA ISSUE\t%s\t%s\t%s", index_or_id, message, legacy_value)
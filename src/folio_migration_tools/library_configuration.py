@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import Annotated, Optional
+from typing import Annotated, List, Optional
 
 from pydantic import BaseModel, Field
 from pydantic.types import DirectoryPath
@@ -19,6 +19,20 @@ class HridHandling(str, Enum):
     preserve001 = "preserve001"
 
 
+class MarcFileFormat(str, Enum):
+    """Enum determining how a MARC file is read.
+        - marc21: Binary MARC21 (ISO 2709)
+        - marcxml: MARCXML, read one record at a time
+
+    Args:
+        str (_type_): _description_
+        Enum (_type_): _description_
+    """
+
+    marc21 = "marc21"
+    marcxml = "marcxml"
+
+
 class FileDefinition(BaseModel):
     file_name: Annotated[
         str,
@@ -44,6 +58,122 @@ class FileDefinition(BaseModel):
             ),
         ),
     ] = True
+    marc_file_format: Annotated[
+        MarcFileFormat,
+        Field(
+            title="MARC file format",
+            description=(
+                "The format of the file, marc21 (binary MARC21) or marcxml. MARCXML files "
+                "are read one record at a time, so they can be of any size. "
+                "Only applied for MARC-based transformations."
+            ),
+        ),
+    ] = MarcFileFormat.marc21
+    first_record: Annotated[
+        int,
+        Field(
+            title="First record",
+            description=(
+                "The first record of the file to read, counting from 0, for example to "
+                "resume after a crash. The record is found in the index of the file, "
+                "without reading the records before it. "
+                "Only applied for MARC21-based transformations."
+            ),
+            ge=0,
+        ),
+    ] = 0
+    number_of_records: Annotated[
+        Optional[int],
+        Field(
+            title="Number of records",
+            description=(
+                "The number of records of the file to read, from the first record. "
+                "Reads to the end of the file if not set. "
+                "Only applied for MARC21-based transformations."
+            ),
+            ge=1,
+        ),
+    ] = None
+
+
+class RateLimit(BaseModel):
+    requests_per_second: Annotated[
+        float,
+        Field(
+            title="Requests per second",
+            description="The number of requests per second to send. 0 means no limit",
+            ge=0,
+        ),
+    ] = 0
+    records_per_second: Annotated[
+        float,
+        Field(
+            title="Records per second",
+            description="The number of records per second to send. 0 means no limit",
+            ge=0,
+        ),
+    ] = 0
+    max_concurrent_requests: Annotated[
+        int,
+        Field(
+            title="Max concurrent requests",
+            description="The number of requests to have in flight at once. 0 means no limit",
+            ge=0,
+        ),
+    ] = 0
+
+
+class HttpClientConfiguration(BaseModel):
+    max_connections: Annotated[
+        int,
+        Field(
+            title="Max connections",
+            description="The number of connections to FOLIO to keep open at most",
+            ge=1,
+        ),
+    ] = 100
+    max_keepalive_connections: Annotated[
+        int,
+        Field(
+            title="Max keep-alive connections",
+            description="The number of idle connections to keep open for reuse",
+            ge=0,
+        ),
+    ] = 20
+    keepalive_expiry: Annotated[
+        float,
+        Field(
+            title="Keep-alive expiry",
+            description="Seconds an idle connection is kept open for reuse",
+            ge=0,
+        ),
+    ] = 5.0
+    connect_timeout: Annotated[
+        Optional[float],
+        Field(
+            title="Connect timeout",
+            description="Seconds to wait for a connection. Leave out to wait indefinitely",
+            gt=0,
+        ),
+    ] = None
+    read_timeout: Annotated[
+        Optional[float],
+        Field(
+            title="Read timeout",
+            description="Seconds to wait for a response. Leave out to wait indefinitely",
+            gt=0,
+        ),
+    ] = None
+    http2: Annotated[
+        bool,
+        Field(
+            title="HTTP/2",
+            description=(
+                "If set to true, requests are sent over HTTP/2 where FOLIO supports it. "
+                "Needs the h2 package, and falls back to HTTP/1.1 without it"
+            ),
+        ),
+    ] = False
 
 
 class IlsFlavour(str, Enum):
@@ -74,6 +204,28 @@ class FolioRelease(str, Enum):
 
 class LibraryConfiguration(BaseModel):
     okapi_url: str
+    gateway_urls: Annotated[
+        List[str],
+        Field(
+            title="Gateway URLs",
+            description=(
+                "Base URLs of Okapi or Kong gateways that are equivalent to the okapi_url. "
+                "Requests sent by the tasks are spread across them, and a gateway that "
+                "keeps failing is left out for a while. The okapi_url is still used for "
+                "generating deterministic UUIDs, and is only sent requests if it is listed"
+            ),
+        ),
+    ] = []
+    http_client: Annotated[
+        Optional[HttpClientConfiguration],
+        Field(
+            title="HTTP client",
+            description=(
+                "Connection pool limits, timeouts and HTTP/2 for the connections to FOLIO, "
+                "shared by all requests of a task. Leave out to use the FolioClient defaults"
+            ),
+        ),
+    ] = None
     tenant_id: str
     ecs_tenant_id: Annotated[
         str,
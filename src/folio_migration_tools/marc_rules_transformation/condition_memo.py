@@ -0,0 +1,106 @@
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Tuple
+
+import i18n
+
+from folio_migration_tools.custom_exceptions import TransformationProcessError
+
+# Conditions whose result only depends on the value and the parameter. Some of them add to
+# the migration report, and those additions are replayed when a result is taken from the memo.
+# Conditions that read the MARC field (tag, indicators or other subfields), log data issues
+# or depend on the legacy id are left out.
+MEMOIZABLE_CONDITIONS = frozenset(
+    [
+        "capitalize",
+        "char_select",
+        "clean_isbn",
+        "remove_ending_punc",
+        "remove_substring",
+        "set_alternative_title_type_id",
+        "set_authority_note_type_id",
+        "set_classification_type_id",
+        "set_holdings_note_type_id",
+        "set_holdings_type_id",
+        "set_instance_format_id",
+        "set_issuance_mode_id",
+        "set_permanent_location_id",
+        "set_receipt_status",
+        "trim",
+        "trim_period",
+        "trim_punctuation",
+    ]
+)
+
+
+class RecordingMigrationReport:
+    """Stands in for the migration report while a memoized condition runs, passing the
+    additions on to the report and keeping them, so that they can be replayed"""
+
+    def __init__(self, migration_report):
+        self.migration_report = migration_report
+        self.additions: List[Tuple] = []
+
+    def add(self, blurb_id, measure_to_add, number=1):
+        self.additions.append((blurb_id, measure_to_add, number))
+        self.migration_report.add(blurb_id, measure_to_add, number)
+
+    def __getattr__(self, name):
+        return getattr(self.migration_report, name)
+
+
+class ConditionMemo:
+    """Remembers the results of the conditions chosen in the task configuration, keyed on
+    the value and the parameter, so that values that repeat across records are only
+    mapped once. Each condition keeps at most max_size results, and the least recently
+    used result is forgotten first. Hits and misses are counted in the migration report.
+    """
+
+    def __init__(self, mapper, condition_names: Iterable[str], max_size: int):
+        self.condition_names = set(condition_names)
+        if not_memoizable := sorted(self.condition_names - MEMOIZABLE_CONDITIONS):
+            raise TransformationProcessError(
+                "",
+                "These conditions can not be memoized. Remove them from memoizedConditions",
+                ", ".join(not_memoizable),
+            )
+        self.mapper = mapper
+        self.max_size = max_size
+        self.memoized: Dict[str, Callable] = {}
+
+    def get(self, name: str, condition: Callable) -> Callable:
+        """The condition function, memoized if the condition was chosen"""
+        if name not in self.condition_names:
+            return condition
+        if name not in self.memoized:
+            self.memoized[name] = self.memoize(name, condition)
+        return self.memoized[name]
+
+    def memoize(self, name: str, condition: Callable) -> Callable:
+        results: OrderedDict = OrderedDict()
+        hits = i18n.t("%{condition} hits", condition=name)
+        misses = i18n.t("%{condition} misses", condition=name)
+
+        def memoized_condition(legacy_id, value, parameter, marc_field):
+            key = (value, repr(parameter) if parameter else "")
+            migration_report = self.mapper.migration_report
+            if key in results:
+                results.move_to_end(key)
+                result, additions = results[key]
+                for addition in additions:
+                    migration_report.add(*addition)
+                migration_report.add("ConditionMemoization", hits)
+                return result
+            recorder = RecordingMigrationReport(migration_report)
+            self.mapper.migration_report = recorder
+            try:
+                result = condition(legacy_id, value, parameter, marc_field)
+            finally:
+                self.mapper.migration_report = migration_report
+            # Conditions that raise are not memoized, so the errors are raised for every record
+            results[key] = (result, recorder.additions)
+            if len(results) > self.max_size:
+                results.popitem(last=False)
+            migration_report.add("ConditionMemoization", misses)
+            return result
+
+        return memoized_condition
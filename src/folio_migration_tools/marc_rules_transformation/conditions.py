@@ -1,5 +1,6 @@
 import logging
 import re
+from typing import Optional
 
 import i18n
 import pymarc
@@ -13,6 +14,9 @@ from folio_migration_tools.custom_exceptions import (
 )
 from folio_migration_tools.helper import Helper
 from folio_migration_tools.library_configuration import FolioRelease
+from folio_migration_tools.marc_rules_transformation.condition_memo import (
+    ConditionMemo,
+)
 from folio_migration_tools.marc_rules_transformation.rules_mapper_base import (
     RulesMapperBase,
 )
@@ -53,6 +57,7 @@ class Conditions:
             self.setup_reference_data_for_all()
             self.setup_reference_data_for_items_and_holdings(default_call_number_type_name)
         self.condition_cache: dict = {}
+        self.condition_memo: Optional[ConditionMemo] = None
 
     def setup_reference_data_for_bibs(self):
         logging.info("Setting up reference data for bib transformation")
@@ -160,10 +165,21 @@ class Conditions:
         # Exception should only handle the missing condition from the cache.
         # All other exceptions should propagate up
         except Exception:
-            attr = getattr(self, "condition_" + str(name))
+            attr = self.get_condition_function(str(name))
             self.condition_cache[name] = attr
             return attr(legacy_id, value, parameter, marc_field)
 
+    def get_condition_function(self, name: str):
+        """The function for a condition, memoized if the task configuration asks for it"""
+        condition = getattr(self, f"condition_{name}")
+        if self.condition_memo:
+            return self.condition_memo.get(name, condition)
+        return condition
+
+    def memoize_conditions(self, condition_names, max_size: int):
+        self.condition_memo = ConditionMemo(self.mapper, condition_names, max_size)
+        self.condition_cache = {}
+
     def condition_trim_punctuation(self, legacy_id, value, parameter, marc_field: field.Field):
         """
         Strip leading and trailing whitespace, as well as any trailing commas or periods, unless
@@ -1,6 +1,6 @@
 import json
 import logging
-from typing import Set
+from typing import Optional, Set
 
 import httpx
 import i18n
@@ -23,7 +23,9 @@ class HRIDHandler:
         handling: HridHandling,
         migration_report: MigrationReport,
         deactivate035_from001: bool,
+        http_client: Optional[httpx.Client] = None,
     ):
+        self.http_client = http_client
         self.unique_001s: Set[str] = set()
         self.deactivate035_from001: bool = deactivate035_from001
         self.hrid_path = "/hrid-settings-storage/hrid-settings"
@@ -163,11 +165,12 @@ class HRIDHandler:
             self.hrid_settings["holdings"]["startNumber"] = self.holdings_hrid_counter
             self.hrid_settings["items"]["startNumber"] = self.items_hrid_counter
             url = self.folio_client.okapi_url + self.hrid_path
-            resp = httpx.put(
-                url,
-                json=self.hrid_settings,
-                headers=self.folio_client.okapi_headers,
-            )
+            with Helper.borrow_http_client(self.folio_client, self.http_client) as http_client:
+                resp = http_client.put(
+                    url,
+                    json=self.hrid_settings,
+                    headers=self.folio_client.okapi_headers,
+                )
             resp.raise_for_status()
             logging.info("%s Successfully set HRID settings.", resp.status_code)
             a = self.folio_client.folio_get_single_object(self.hrid_path)
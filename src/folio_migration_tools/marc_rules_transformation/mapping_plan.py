@@ -0,0 +1,136 @@
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pymarc
+
+from folio_migration_tools.custom_exceptions import TransformationProcessError
+
+
+class CompiledRule:
+    """The parts of one mapping from the mapping rules that are the same for every MARC
+    field it is applied to, resolved once: the condition functions, their parameter and
+    the subfields to read, grouped by the delimiter to join them with."""
+
+    def __init__(self, mapping: dict, conditions: List[Tuple[str, Callable]]):
+        self.mapping = mapping
+        self.conditions = conditions
+        condition = get_condition(mapping)
+        self.parameter: dict = condition.get("parameter", {}) if condition else {}
+        self.subfields: List[str] = mapping.get("subfield", [])
+        self.apply_rules_on_concatenated_data = bool(
+            mapping.get("applyRulesOnConcatenatedData", "")
+        )
+        self.delimiter_groups: Optional[List[Tuple[str, List[str]]]] = None
+        if self.subfields and (custom_delimiters := mapping.get("subFieldDelimiter")):
+            delimiter_map = {sub_f: " " for sub_f in self.subfields}
+            for custom_delimiter in custom_delimiters:
+                delimiter_map.update(
+                    {sub_f: custom_delimiter["value"] for sub_f in custom_delimiter["subfields"]}
+                )
+            self.delimiter_groups = [
+                (
+                    custom_delimiter["value"],
+                    [
+                        sub_f
+                        for sub_f in self.subfields
+                        if custom_delimiter["subfields"]
+                        and delimiter_map[sub_f] == custom_delimiter["value"]
+                    ],
+                )
+                for custom_delimiter in custom_delimiters
+            ]
+
+    def apply_conditions(self, legacy_id: str, value, marc_field: pymarc.Field):
+        for condition_type, condition in self.conditions:
+            try:
+                value = condition(legacy_id, value, self.parameter, marc_field)
+            except AttributeError as attr_error:
+                raise TransformationProcessError(
+                    legacy_id, attr_error, condition_type
+                ) from attr_error
+        return value
+
+    def get_subfield_values(
+        self, legacy_id: str, marc_field: pymarc.Field, with_conditions: bool
+    ) -> List[str]:
+        """Same as RulesMapperBase.handle_sub_field_delimiters"""
+        if self.delimiter_groups is None:
+            return marc_field.get_subfields(*self.subfields) if self.subfields else []
+        values: List[str] = []
+        for delimiter, subfields in self.delimiter_groups:
+            subfield_values = marc_field.get_subfields(*subfields)
+            if self.apply_rules_on_concatenated_data:
+                values.extend(subfield_values)
+            elif with_conditions:
+                values.extend(
+                    dict.fromkeys(
+                        [self.apply_conditions(legacy_id, x, marc_field) for x in subfield_values]
+                    )
+                )
+            else:
+                values.extend(dict.fromkeys(subfield_values))
+            values = [delimiter.join(values)]
+        return values
+
+    def get_value(self, legacy_id: str, marc_field: pymarc.Field):
+        """Same as RulesMapperBase.get_value_from_condition"""
+        if self.subfields:
+            values = self.get_subfield_values(legacy_id, marc_field, True)
+        else:
+            values = [marc_field.format_field() if marc_field else ""]
+        if not self.apply_rules_on_concatenated_data and self.subfields:
+            return " ".join(
+                dict.fromkeys([self.apply_conditions(legacy_id, x, marc_field) for x in values])
+            )
+        return self.apply_conditions(legacy_id, " ".join(values), marc_field)
+
+
+class MappingPlan:
+    """The mapping rules of a MARC rules mapper, compiled once when the rules are loaded,
+    so that mapping a field does not split condition strings, look up condition functions
+    or build delimiter maps again.
+
+    The plan holds a CompiledRule for every mapping, entity mapping and alternative
+    mapping in the rules, looked up by the mapping itself. Mappings that are not in the
+    plan, or whose conditions are not all known, are left to the interpreter in
+    RulesMapperBase. The plan has to be compiled again if the rules are changed in place.
+    """
+
+    def __init__(self, mappings: dict, conditions):
+        self.rules: Dict[int, CompiledRule] = {}
+        for tag_mappings in mappings.values():
+            if isinstance(tag_mappings, list):
+                for mapping in tag_mappings:
+                    self.compile(mapping, conditions)
+
+    def compile(self, mapping: dict, conditions):
+        if not isinstance(mapping, dict):
+            return
+        condition = get_condition(mapping)
+        condition_functions = []
+        if condition:
+            for condition_type in (c.strip() for c in condition.get("type", "").split(",")):
+                if not hasattr(conditions, f"condition_{condition_type}"):
+                    # Unknown conditions are reported by the interpreter, record by record
+                    condition_functions = None
+                    break
+                condition_functions.append(
+                    (condition_type, conditions.get_condition_function(condition_type))
+                )
+        if condition_functions is not None:
+            self.rules[id(mapping)] = CompiledRule(mapping, condition_functions)
+        for entity_mapping in mapping.get("entity", []):
+            self.compile(entity_mapping, conditions)
+            self.compile(entity_mapping.get("alternativeMapping"), conditions)
+
+    def get(self, mapping: dict) -> Optional[CompiledRule]:
+        rule = self.rules.get(id(mapping))
+        # The rules hold on to their mappings, so the id of a mapping in the plan is not reused
+        return rule if rule is not None and rule.mapping is mapping else None
+
+
+def get_condition(mapping: dict) -> Optional[dict]:
+    """The first condition of the first rule of a mapping, that the mapping applies"""
+    rules = mapping.get("rules", [])
+    if rules and (conditions := rules[0].get("conditions", [])):
+        return conditions[0]
+    return None
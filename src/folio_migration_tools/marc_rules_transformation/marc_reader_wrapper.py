@@ -1,19 +1,29 @@
+import json
 import logging
+import os
 import sys
 from io import IOBase
 from pathlib import Path
+from typing import List, Optional, Tuple
 
 import i18n
-from pymarc import Leader, MARCReader, Record
+from defusedxml.ElementTree import iterparse, tostring
+from pymarc import Field, Indicators, Leader, MARCReader, Record
 
 from folio_migration_tools.custom_exceptions import (
     TransformationProcessError,
     TransformationRecordFailedError,
 )
 from folio_migration_tools.folder_structure import FolderStructure
-from folio_migration_tools.library_configuration import FileDefinition
+from folio_migration_tools.library_configuration import (
+    FileDefinition,
+    MarcFileFormat,
+)
 from folio_migration_tools.migration_report import MigrationReport
 
+MARC_INDEX_SUFFIX = ".idx"
+MARCXML_NAMESPACE = "http://www.loc.gov/MARC21/slim"
+
 
 class MARCReaderWrapper:
     @staticmethod
@@ -22,19 +32,43 @@ class MARCReaderWrapper:
         processor,
         failed_records_path: Path,
         folder_structure: FolderStructure,
+        part: Optional[dict] = None,
     ):
+        """Reads and processes the records of a MARC21 file, or of one part of it
+
+        Args:
+            file_def (FileDefinition): The file to read
+            processor: The MarcFileProcessor to process the records with
+            failed_records_path (Path): File to append records that fail parsing to
+            folder_structure (FolderStructure): The folder structure of the task
+            part (Optional[dict]): A part of the file, from get_record_aligned_ranges.
+                Defaults to None (the whole file)
+        """
         try:
             with open(failed_records_path, "ab") as failed_marc_records_file:
                 with open(
                     folder_structure.legacy_records_folder / file_def.file_name,
                     "rb",
                 ) as marc_file:
-                    reader = MARCReader(marc_file, to_unicode=True, permissive=True)
-                    reader.hide_utf8_warnings = True
-                    reader.force_utf8 = False
+                    first_index = part["first_index"] if part else 0
+                    end = None
+                    if file_def.marc_file_format == MarcFileFormat.marcxml:
+                        # MARCXML files are not split, so a part of one is the whole file
+                        reader = MARCXMLReader(marc_file)
+                    else:
+                        end = part["end"] if part else None
+                        marc_file.seek(part["start"] if part else 0)
+                        reader = MARCReader(marc_file, to_unicode=True, permissive=True)
+                        reader.hide_utf8_warnings = True
+                        reader.force_utf8 = False
                     logging.info("Running %s", file_def.file_name)
                     MARCReaderWrapper.read_records(
-                        reader, file_def, failed_marc_records_file, processor
+                        reader,
+                        file_def,
+                        failed_marc_records_file,
+                        processor,
+                        first_index,
+                        end,
                     )
         except TransformationProcessError as tpe:
             logging.critical(tpe)
@@ -48,8 +82,12 @@ class MARCReaderWrapper:
         source_file: FileDefinition,
         failed_records_file: IOBase,
         processor,
+        first_index: int = 0,
+        end: Optional[int] = None,
     ):
-        for idx, record in enumerate(reader):
+        idx = first_index - 1
+        records = reader if end is None else MARCReaderWrapper.read_until(reader, end)
+        for idx, record in enumerate(records, first_index):
             processor.mapper.migration_report.add_general_statistics(
                 i18n.t("Records in file before parsing")
             )
@@ -77,7 +115,16 @@ class MARCReaderWrapper:
                 )
             except ValueError as error:
                 logging.error(error)
-        logging.info("Done reading %s records from file", idx + 1)
+        logging.info("Done reading %s records from file", idx + 1 - first_index)
+
+    @staticmethod
+    def read_until(reader, end: int):
+        """Yields the records of the reader that start before the byte offset end"""
+        while reader.file_handle.tell() < end:
+            try:
+                yield next(reader)
+            except StopIteration:
+                return
 
     @staticmethod
     def set_leader(marc_record: Record, migration_report: MigrationReport):
@@ -119,6 +166,298 @@ class MARCReaderWrapper:
             marc_record.leader = Leader(f"{marc_record.leader[:11]}2{marc_record.leader[12:]}")
 
 
+class MARCXMLReader:
+    """Reads the records of a MARCXML file one at a time, like MARCReader does for MARC21.
+    The file is parsed incrementally, and every element is cleared and dropped from the
+    tree once it is read, so files of any size are read in constant memory.
+
+    Records are record elements in the MARCXML namespace, or in no namespace, anywhere in
+    the file, so records wrapped in other XML, like OAI-PMH responses, are read too. A
+    record that can not be read is yielded as None, with the record element in
+    current_chunk and the error in current_exception, as MARCReader does.
+    """
+
+    def __init__(self, file_handle):
+        self.file_handle = file_handle
+        self.current_chunk = b""
+        self.current_exception: Optional[Exception] = None
+
+    def __iter__(self):
+        open_elements: list = []
+        open_records = 0
+        for event, element in iterparse(self.file_handle, events=("start", "end")):
+            is_record = element.tag in ("record", f"{{{MARCXML_NAMESPACE}}}record")
+            if event == "start":
+                open_elements.append(element)
+                open_records += is_record
+                continue
+            open_elements.pop()
+            if is_record:
+                open_records -= 1
+                yield self.get_record(element)
+            if not open_records:
+                element.clear()
+                if open_elements:
+                    open_elements[-1].remove(element)
+
+    def get_record(self, record_element) -> Optional[Record]:
+        try:
+            record = Record()
+            for field_element in record_element:
+                element_name = field_element.tag.rsplit("}", 1)[-1]
+                if element_name == "leader":
+                    record.leader = Leader(field_element.text or "")
+                elif element_name == "controlfield":
+                    record.add_field(
+                        Field(field_element.attrib["tag"], data=field_element.text or "")
+                    )
+                elif element_name == "datafield":
+                    marc_field = Field(
+                        field_element.attrib["tag"],
+                        Indicators(field_element.get("ind1", " "), field_element.get("ind2", " ")),
+                    )
+                    for subfield in field_element:
+                        marc_field.add_subfield(subfield.attrib["code"], subfield.text or "")
+                    record.add_field(marc_field)
+            self.current_chunk, self.current_exception = b"", None
+            return record
+        except Exception as error:
+            self.current_chunk = tostring(record_element)
+            self.current_exception = error
+            return None
+
+
+class MarcFileIndex:
+    """The byte offset, length and 001 of each record in a MARC21 file, in file order, so
+    that records can be reached and files split without reading them from the start.
+
+    The index is built in one pass, walking the records by the record lengths in their
+    leaders, and can be kept in a sidecar next to the file, named after the file with
+    MARC_INDEX_SUFFIX added. The sidecar holds a line per record, with the ordinal, offset,
+    length and 001 (as JSON) of the record. Its first line holds the size and modification
+    time of the file, and a sidecar that does not match the file is not used.
+
+    If a record length is not valid, the rest of the file can not be walked. The index
+    then ends with the last valid record, and the bytes after it are unparsed_bytes.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        size: int,
+        mtime_ns: int,
+        records: List[Tuple[int, int, Optional[str]]],
+        unparsed_bytes: int = 0,
+    ):
+        self.path = Path(path)
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.records = records
+        self.unparsed_bytes = unparsed_bytes
+
+    @staticmethod
+    def get_sidecar_path(path) -> Path:
+        return Path(f"{path}{MARC_INDEX_SUFFIX}")
+
+    @classmethod
+    def get(cls, path, write_index: bool = False) -> "MarcFileIndex":
+        """The index of the file from its sidecar, or built if the sidecar is missing or out
+        of date. A built index is written to the sidecar if write_index is set"""
+        if marc_index := cls.load(path):
+            return marc_index
+        marc_index = cls.build(path)
+        if write_index:
+            marc_index.save()
+        return marc_index
+
+    @classmethod
+    def build(cls, path) -> "MarcFileIndex":
+        stat = os.stat(path)
+        records: List[Tuple[int, int, Optional[str]]] = []
+        unparsed_bytes = 0
+        with open(path, "rb") as marc_file:
+            offset = 0
+            while offset < stat.st_size:
+                leader = marc_file.read(24)
+                length = int(leader[:5]) if leader[:5].isdigit() else 0
+                if length < 24 or offset + length > stat.st_size:
+                    logging.warning(
+                        "Record length not valid at byte %s of %s. The rest of the file "
+                        "can not be indexed",
+                        offset,
+                        path,
+                    )
+                    unparsed_bytes = stat.st_size - offset
+                    break
+                records.append((offset, length, get_001(leader + marc_file.read(length - 24))))
+                offset += length
+        logging.info("Indexed %s records in %s", len(records), path)
+        return cls(path, stat.st_size, stat.st_mtime_ns, records, unparsed_bytes)
+
+    @classmethod
+    def load(cls, path) -> Optional["MarcFileIndex"]:
+        sidecar_path = cls.get_sidecar_path(path)
+        if not sidecar_path.is_file():
+            return None
+        stat = os.stat(path)
+        with open(sidecar_path) as sidecar:
+            header = json.loads(sidecar.readline())
+            if (header["size"], header["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+                logging.info("The index of %s is out of date", path)
+                return None
+            records = []
+            for line in sidecar:
+                _, offset, length, id_001 = line.rstrip("\n").split("\t", 3)
+                records.append((int(offset), int(length), json.loads(id_001)))
+        return cls(path, header["size"], header["mtime_ns"], records, header["unparsed_bytes"])
+
+    def save(self):
+        sidecar_path = self.get_sidecar_path(self.path)
+        with open(sidecar_path, "w") as sidecar:
+            header = {
+                "size": self.size,
+                "mtime_ns": self.mtime_ns,
+                "unparsed_bytes": self.unparsed_bytes,
+            }
+            sidecar.write(f"{json.dumps(header)}\n")
+            for ordinal, (offset, length, id_001) in enumerate(self.records):
+                sidecar.write(f"{ordinal}\t{offset}\t{length}\t{json.dumps(id_001)}\n")
+        logging.info("Wrote the index of %s to %s", self.path, sidecar_path)
+
+    def get_part(self, first_record: int = 0, number_of_records: Optional[int] = None) -> dict:
+        """The part of the file from the record with the ordinal first_record, for use with
+        MARCReaderWrapper.process_single_file. The part runs to the end of the file, or
+        has number_of_records records"""
+        if first_record and not first_record < len(self.records):
+            raise TransformationProcessError(
+                "",
+                f"There is no record {first_record} in {self.path.name}",
+                f"{len(self.records)} records",
+            )
+        last_record = len(self.records)
+        if number_of_records is not None:
+            last_record = min(first_record + number_of_records, last_record)
+        start = self.records[first_record][0] if self.records else 0
+        part = new_range(start, first_record)
+        part["records"] = last_record - first_record
+        if last_record == len(self.records):
+            part["end"] = self.size
+            part["unparsed_bytes"] = self.unparsed_bytes
+        else:
+            part["end"] = self.records[last_record][0]
+        return part
+
+
+def get_record_aligned_ranges(
+    path,
+    number_of_ranges: int,
+    read_001s: bool = False,
+    write_index: bool = False,
+    first_record: int = 0,
+    number_of_records: Optional[int] = None,
+) -> list:
+    """Splits a MARC21 file, or the part of it from first_record, into up to
+    number_of_ranges byte ranges of about the same size, each starting at the start of a
+    record. The records are found in the index of the file, which is read from its sidecar
+    if it has an up to date one, and built otherwise.
+
+    If a record length is not valid, the rest of the file can not be walked. It is then
+    left in the last range, and counted in its unparsed_bytes.
+
+    Args:
+        path (Path): The file to split
+        number_of_ranges (int): The number of ranges to split the file into
+        read_001s (bool): Also read the 001 of each record. Defaults to False
+        write_index (bool): Write the index of the file to its sidecar if it was built.
+            Defaults to False
+        first_record (int): The ordinal of the first record to split from. Defaults to 0
+        number_of_records (Optional[int]): The number of records to split. Defaults to
+            None (to the end of the file)
+
+    Returns:
+        list: A dict per range, with the start and end byte offsets of the range, the
+        index in the file of its first record, its number of records and unparsed bytes
+        and, if read_001s, the 001 of each of its records (None if it has none).
+        Empty ranges are left out
+    """
+    marc_index = MarcFileIndex.get(path, write_index)
+    part = marc_index.get_part(first_record, number_of_records)
+    part_size = part["end"] - part["start"]
+    ranges = [new_range(part["start"], first_record)]
+    for ordinal in range(first_record, first_record + part["records"]):
+        offset, _, id_001 = marc_index.records[ordinal]
+        if (
+            ranges[-1]["records"]
+            and len(ranges) < number_of_ranges
+            and offset - part["start"] >= part_size * len(ranges) // number_of_ranges
+        ):
+            ranges[-1]["end"] = offset
+            ranges.append(new_range(offset, ordinal))
+        if read_001s:
+            ranges[-1]["001s"].append(id_001)
+        ranges[-1]["records"] += 1
+    ranges[-1]["unparsed_bytes"] = part["unparsed_bytes"]
+    ranges[-1]["end"] = part["end"]
+    return [r for r in ranges if r["end"] > r["start"]]
+
+
+def get_record_range(file_def: FileDefinition) -> dict:
+    """The records of the file to read, from the first_record and number_of_records of its
+    FileDefinition, as keyword arguments for get_record_aligned_ranges. Empty if the whole
+    file is read"""
+    if not file_def.first_record and file_def.number_of_records is None:
+        return {}
+    if file_def.marc_file_format == MarcFileFormat.marcxml:
+        raise TransformationProcessError(
+            "",
+            "first_record and number_of_records can only be set for MARC21 files",
+            file_def.file_name,
+        )
+    return {
+        "first_record": file_def.first_record,
+        "number_of_records": file_def.number_of_records,
+    }
+
+
+def get_marcxml_part(path, read_001s: bool = False) -> dict:
+    """A MARCXML file as one part, like the parts from get_record_aligned_ranges. MARCXML
+    files are not split, as records can only be found by parsing the file, so the file is
+    read once to count its records and, if read_001s, read their 001s"""
+    part = new_range(0, 0)
+    with open(path, "rb") as marcxml_file:
+        for record in MARCXMLReader(marcxml_file):
+            part["records"] += 1
+            if read_001s:
+                part["001s"].append(record["001"].data if record and "001" in record else None)
+    part["end"] = os.path.getsize(path)
+    return part
+
+
+def new_range(start: int, first_index: int) -> dict:
+    return {
+        "start": start,
+        "end": start,
+        "first_index": first_index,
+        "records": 0,
+        "unparsed_bytes": 0,
+        "001s": [],
+    }
+
+
+def get_001(marc: bytes) -> Optional[str]:
+    """Reads the 001 of a MARC21 record from the directory, without parsing the record"""
+    try:
+        base_address = int(marc[12:17])
+        for entry in range(24, base_address - 12, 12):
+            if marc[entry : entry + 3] == b"001":
+                length = int(marc[entry + 3 : entry + 7])
+                start = base_address + int(marc[entry + 7 : entry + 12])
+                return marc[start : start + length - 1].decode("utf-8", "replace")
+    except ValueError:
+        pass
+    return None
+
+
 def report_failed_parsing(
     reader, source_file, failed_bibs_file, idx, migration_report: MigrationReport
 ):
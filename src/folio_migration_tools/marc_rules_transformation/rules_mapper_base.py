@@ -27,6 +27,7 @@ from folio_migration_tools.library_configuration import (
 )
 from folio_migration_tools.mapper_base import MapperBase
 from folio_migration_tools.marc_rules_transformation.hrid_handler import HRIDHandler
+from folio_migration_tools.marc_rules_transformation.mapping_plan import MappingPlan
 
 
 class RulesMapperBase(MapperBase):
@@ -50,6 +51,7 @@ class RulesMapperBase(MapperBase):
         self.conditions = conditions
         self.item_json_schema = ""
         self.mappings: dict = {}
+        self.mapping_plan: MappingPlan = MappingPlan({}, conditions)
         self.schema_properties = None
         if hasattr(self.task_configuration, "hrid_handling"):
             self.hrid_handler = HRIDHandler(
@@ -74,6 +76,18 @@ class RulesMapperBase(MapperBase):
             )
             self.last_batch_time = time.time()
 
+    def compile_mapping_plan(self):
+        """Compiles the mapping rules into the mapping plan. Call this again after changing
+        the mapping rules in place"""
+        if memoized_conditions := getattr(self.task_configuration, "memoized_conditions", []):
+            # The plan binds the condition functions, so they are memoized before compiling
+            self.conditions.memoize_conditions(
+                memoized_conditions, self.task_configuration.condition_memo_size
+            )
+            logging.info("Memoizing the conditions %s", ", ".join(memoized_conditions))
+        self.mapping_plan = MappingPlan(self.mappings, self.conditions)
+        logging.info("Compiled %s mappings into the mapping plan", len(self.mapping_plan.rules))
+
     @abstractmethod
     def get_legacy_ids(self, marc_record: Record, idx: int):
         raise NotImplementedError()
@@ -183,6 +197,8 @@ class RulesMapperBase(MapperBase):
         condition_types: List[str] = None,
         parameter: dict = None,
     ):
+        if not condition_types and (rule := self.mapping_plan.get(mapping)):
+            return rule.get_subfield_values(legacy_id, marc_field, False)
         values: List[str] = []
         if mapping.get("subfield") and (custom_delimiters := mapping.get("subFieldDelimiter")):
             delimiter_map = {sub_f: " " for sub_f in mapping.get("subfield")}
@@ -231,6 +247,8 @@ class RulesMapperBase(MapperBase):
         mapping,
         marc_field,
     ):
+        if rule := self.mapping_plan.get(mapping):
+            return rule.get_value(legacy_id, marc_field)
         stripped_conds = mapping["rules"][0]["conditions"][0]["type"].split(",")
         condition_types = list(map(str.strip, stripped_conds))
         parameter = mapping["rules"][0]["conditions"][0].get("parameter", {})
@@ -53,6 +53,7 @@ class BibsRulesMapper(RulesMapperBase):
         logging.info("Fetching mapping rules from the tenant")
         rules_endpoint = "/mapping-rules/marc-bib"
         self.mappings = self.folio_client.folio_get_single_object(rules_endpoint)
+        self.compile_mapping_plan()
         logging.info("Fetching valid language codes...")
         self.language_codes = list(self.fetch_language_codes())
         self.instance_relationships: dict = {}
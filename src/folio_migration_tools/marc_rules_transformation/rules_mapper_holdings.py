@@ -70,6 +70,7 @@ class RulesMapperHoldings(RulesMapperBase):
         rules_endpoint = "/mapping-rules/marc-holdings"
         self.mappings = self.folio_client.folio_get_single_object(rules_endpoint)
         self.fix_853_bug_in_rules()
+        self.compile_mapping_plan()
 
     def fix_853_bug_in_rules(self):
         f852_mappings = self.mappings["852"]
@@ -71,6 +71,30 @@ class AuthorityTransformer(MigrationTaskBase):
                 ),
             ),
         ] = True
+        memoized_conditions: Annotated[
+            List[str],
+            Field(
+                title="Memoized conditions",
+                description=(
+                    "Names of mapping rule conditions, like trim_punctuation or "
+                    "set_classification_type_id, whose results are remembered and reused for "
+                    "values that repeat across records. Only conditions whose result depends "
+                    "on the value and the parameter alone can be memoized. The hits and misses "
+                    "are counted in the migration report"
+                ),
+            ),
+        ] = []
+        condition_memo_size: Annotated[
+            int,
+            Field(
+                title="Condition memo size",
+                description=(
+                    "The number of results to remember for each memoized condition. "
+                    "The least recently used results are forgotten first"
+                ),
+                ge=1,
+            ),
+        ] = 10000
 
     @staticmethod
     def get_object_type() -> FOLIONamespaces:
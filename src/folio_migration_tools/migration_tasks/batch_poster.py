@@ -1,34 +1,90 @@
 import copy
+import gzip
 import json
 import logging
+import os
+import re
+import shutil
 import sys
+import threading
 import time
 import traceback
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
 from datetime import datetime
-from typing import Annotated, List
+from typing import Annotated, Dict, List
 from uuid import uuid4
 
 import httpx
 import i18n
 from folio_uuid.folio_namespaces import FOLIONamespaces
+from folioclient import FolioClient
+from jsonschema import Draft4Validator
+from jsonschema.validators import validator_for
 from pydantic import Field
 
 from folio_migration_tools.custom_exceptions import (
     TransformationProcessError,
     TransformationRecordFailedError,
 )
+from folio_migration_tools.gateway_pool import merge_gateway_stats
 from folio_migration_tools.library_configuration import (
     FileDefinition,
     LibraryConfiguration,
+    RateLimit,
 )
 from folio_migration_tools.migration_report import MigrationReport
 from folio_migration_tools.migration_tasks.migration_task_base import MigrationTaskBase
+from folio_migration_tools.progress_journal import ProgressJournal
+from folio_migration_tools.rate_limiter import RateLimiters
+from folio_migration_tools.request_metrics import RequestMetrics, get_endpoint
+from folio_migration_tools.retry_policy import RetryPolicy
 from folio_migration_tools.task_configuration import AbstractTaskConfiguration
 
 
 def write_failed_batch_to_file(batch, file):
     for record in batch:
-        file.write(f"{json.dumps(record)}\n")
+        file.write(f"{record if isinstance(record, str) else json.dumps(record)}\n")
+
+
+def parse_record(record):
+    """Batches hold the records as serialized JSON. Parses one, when it needs inspecting"""
+    return json.loads(record) if isinstance(record, str) else record
+
+
+def get_reference(record: dict, key: str):
+    """Returns the value of the key in the record. Nested keys are separated by dots"""
+    value = record
+    for part in key.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value or None
+
+
+def add_key(record: str, key: str, value) -> str:
+    """Adds a top level key to a serialized JSON object.
+
+    The key is spliced into the start of the serialized object, unless the object
+    already has the key, in which case the object is parsed and updated.
+
+    Args:
+        record (str): A serialized JSON object
+        key (str): The key to add
+        value: The value to set. Must be JSON serializable
+
+    Returns:
+        str: The serialized JSON object, including the key
+    """
+    record = record.strip()
+    if f'"{key}"' in record or not record.startswith("{") or record[1:].lstrip() == "}":
+        json_rec = json.loads(record)
+        json_rec[key] = value
+        return json.dumps(json_rec)
+    return f"{{{json.dumps(key)}: {json.dumps(value)}, {record[1:].lstrip()}"
 
 
 class BatchPoster(MigrationTaskBase):
@@ -92,6 +148,194 @@ class BatchPoster(MigrationTaskBase):
                 )
             ),
         ] = False
+        concurrent_batches: Annotated[
+            int,
+            Field(
+                description=(
+                    "The number of batches BatchPoster keeps in flight at the same time. "
+                    "While batches are being posted, the next ones are read and parsed from "
+                    "the results file. Defaults to 1 (post one batch at a time)"
+                ),
+                ge=1,
+            ),
+        ] = 1
+        concurrent_single_record_posts: Annotated[
+            int,
+            Field(
+                description=(
+                    "The number of records posted at the same time for object types that "
+                    "are posted one record at a time (Authorities, Organizations, Orders and "
+                    "Extradata). Extradata is posted in stages, so that objects are posted "
+                    "after the objects they depend on. Defaults to 1 (post one record at a "
+                    "time)"
+                ),
+                ge=1,
+            ),
+        ] = 1
+        adaptive_batch_size: Annotated[
+            bool,
+            Field(
+                description=(
+                    "Toggles whether or not BatchPoster should grow or shrink the batch size "
+                    "at runtime, based on response times, request sizes and HTTP 413/5xx "
+                    "responses. batchSize is used as the starting point. Defaults to False"
+                )
+            ),
+        ] = False
+        min_batch_size: Annotated[
+            int,
+            Field(description="The smallest batch size adaptive batch sizing will use", ge=1),
+        ] = 1
+        max_batch_size: Annotated[
+            int,
+            Field(description="The largest batch size adaptive batch sizing will use", ge=1),
+        ] = 1000
+        target_request_seconds: Annotated[
+            float,
+            Field(
+                description=(
+                    "The response time adaptive batch sizing aims for, in seconds. "
+                    "Defaults to 5 seconds"
+                ),
+                gt=0,
+            ),
+        ] = 5.0
+        target_request_bytes: Annotated[
+            int,
+            Field(
+                description=(
+                    "The largest request body adaptive batch sizing aims for, in bytes. "
+                    "Defaults to 5 MB"
+                ),
+                gt=0,
+            ),
+        ] = 5_000_000
+        bisect_failed_batches: Annotated[
+            bool,
+            Field(
+                description=(
+                    "Toggles whether or not BatchPoster should isolate the failing records "
+                    "of a failed batch, by removing records identified in the error message "
+                    "or by splitting the batch in halves until the failing records are found. "
+                    "The rest of the batch gets posted. Defaults to False"
+                )
+            ),
+        ] = False
+        progress_journal: Annotated[
+            bool,
+            Field(
+                description=(
+                    "Toggles whether or not BatchPoster keeps a journal of the parts of the "
+                    "files that are posted. If the task is interrupted, a restart of the task "
+                    "with the same name skips the parts already posted, and reposts the "
+                    "batches that were in flight or had failed records. Defaults to False"
+                )
+            ),
+        ] = False
+        max_retries: Annotated[
+            int,
+            Field(
+                description=(
+                    "The number of times a request is retried after a transient error "
+                    "(HTTP 429, 500, 502, 503, 504 or a connection error). Defaults to 5"
+                ),
+                ge=0,
+            ),
+        ] = 5
+        retry_backoff_seconds: Annotated[
+            float,
+            Field(
+                description=(
+                    "The wait before the first retry, in seconds. The wait doubles for each "
+                    "retry, with some random jitter. A Retry-After header from the server "
+                    "takes precedence. Defaults to 2 seconds"
+                ),
+                ge=0,
+            ),
+        ] = 2.0
+        max_retry_backoff_seconds: Annotated[
+            float,
+            Field(description="The longest wait between two retries, in seconds", ge=0),
+        ] = 60.0
+        max_retry_seconds: Annotated[
+            float,
+            Field(
+                description=(
+                    "The total time, in seconds, spent retrying a single request before "
+                    "giving up. Defaults to 600 seconds"
+                ),
+                ge=0,
+            ),
+        ] = 600.0
+        metrics_interval_seconds: Annotated[
+            float,
+            Field(
+                description=(
+                    "How often, in seconds, the request metrics file in the reports folder "
+                    "is updated while the task runs. Defaults to 30 seconds"
+                ),
+                ge=0,
+            ),
+        ] = 30.0
+        posting_processes: Annotated[
+            int,
+            Field(
+                description=(
+                    "The number of worker processes to post the files with. Each file is "
+                    "split into this many parts at line boundaries, and the parts are "
+                    "posted by the workers, each with its own log, failed records file and "
+                    "progress journal. The results are merged when all parts are posted. "
+                    "Defaults to 1 (post from the task's own process)"
+                ),
+                ge=1,
+            ),
+        ] = 1
+        compress_requests: Annotated[
+            bool,
+            Field(
+                description=(
+                    "Toggles whether or not request bodies are sent gzip-encoded. If FOLIO "
+                    "rejects the first gzip-encoded request, BatchPoster falls back to "
+                    "uncompressed requests for the rest of the task. Defaults to False"
+                )
+            ),
+        ] = False
+        skip_unchanged: Annotated[
+            bool,
+            Field(
+                description=(
+                    "Toggles whether or not records that are already in FOLIO, unchanged, "
+                    "are left out of the batches. The stored versions of the records in each "
+                    "batch are fetched with one query, and compared to the records while "
+                    "ignoring _version, metadata, fields FOLIO generates and empty lists and "
+                    "objects. Only new and changed records are posted. Use together with "
+                    "upsert. Supported for Instances, Holdings and Items. Defaults to False"
+                )
+            ),
+        ] = False
+        rate_limits: Annotated[
+            Dict[str, RateLimit],
+            Field(
+                description=(
+                    "Limits on the requests sent to FOLIO, per FOLIO module, like "
+                    "mod-inventory-storage. Each limit can set requests_per_second, "
+                    "records_per_second and max_concurrent_requests. When posting from "
+                    "several processes, the limits are shared between the processes"
+                )
+            ),
+        ] = {}
+        validate_records: Annotated[
+            bool,
+            Field(
+                description=(
+                    "Toggles whether or not records are validated against the JSON schema of "
+                    "the object type before they are added to a batch. Invalid records are "
+                    "written to the failed records file right away, with the validation "
+                    "errors in the log. Supported for Instances, Holdings and Items. "
+                    "Defaults to False"
+                )
+            ),
+        ] = False
 
     @staticmethod
     def get_object_type() -> FOLIONamespaces:
@@ -119,9 +363,34 @@ class BatchPoster(MigrationTaskBase):
         elif self.task_configuration.upsert and not self.api_info["supports_upsert"]:
             logging.info("Upsert is not supported for this object type. Query parameter will not be set.")
         self.snapshot_id = str(uuid4())
+        self.retry_policy = RetryPolicy(
+            self.task_configuration.max_retries,
+            self.task_configuration.retry_backoff_seconds,
+            self.task_configuration.max_retry_backoff_seconds,
+            self.task_configuration.max_retry_seconds,
+        )
+        self.rate_limiters = RateLimiters(self.task_configuration.rate_limits)
+        self.request_metrics = RequestMetrics(
+            self.folder_structure.request_metrics_path,
+            self.task_configuration.metrics_interval_seconds,
+        )
         self.failed_objects: list = []
         self.batch_size = self.task_configuration.batch_size
         logging.info("Batch size is %s", self.batch_size)
+        self.batch_size_controller = None
+        if self.task_configuration.adaptive_batch_size and self.api_info.get("is_batch"):
+            self.batch_size_controller = AdaptiveBatchSize(
+                self.batch_size,
+                self.task_configuration.min_batch_size,
+                self.task_configuration.max_batch_size,
+                self.task_configuration.target_request_seconds,
+                self.task_configuration.target_request_bytes,
+            )
+            logging.info(
+                "Adaptive batch sizing between %s and %s records",
+                self.batch_size_controller.minimum,
+                self.batch_size_controller.maximum,
+            )
         self.processed = 0
         self.failed_batches = 0
         self.users_created = 0
@@ -131,75 +400,354 @@ class BatchPoster(MigrationTaskBase):
         self.num_failures = 0
         self.num_posted = 0
         self.okapi_headers = self.folio_client.okapi_headers
-        self.http_client = None
+        self.executor = None
+        self.in_flight: dict = {}
+        self.concurrency = 1
+        if self.api_info.get("is_batch"):
+            self.concurrency = self.task_configuration.concurrent_batches
+        else:
+            self.concurrency = self.task_configuration.concurrent_single_record_posts
+        self.journal = None
+        if self.task_configuration.progress_journal:
+            self.journal = ProgressJournal(self.folder_structure.progress_journal_path)
+        self.current_file_name = ""
+        self.row_start = 0
+        self.row_end = 0
+        self.replay_until = 0
+        self.batch_start = (0, 1)
+        self.batch_failures = 0
+        self.batch_replay = False
+        self.failed_rows: list = []
+        self.unacknowledged_start = (0, 1)
+        self.shard_range = None
+        self.accepts_gzip = None
+        self.lock = threading.Lock()
+        self.upsert_counts = {"unchanged": 0, "new": 0, "changed": 0}
+        self.dependency_gate = None
+        self.depends_on = None
+        self.record_validator = None
+        if self.task_configuration.skip_unchanged and not self.api_info.get("query_endpoint"):
+            logging.warning(
+                "skipUnchanged is not supported for %s. All records will be posted",
+                self.task_configuration.object_type,
+            )
 
     def do_work(self):
-        with self.folio_client.get_folio_http_client() as httpx_client:
-            self.http_client = httpx_client
-            try:
-                batch = []
-                if self.task_configuration.object_type == "SRS":
-                    self.create_snapshot()
+        if self.task_configuration.posting_processes > 1 and self.shard_range is None:
+            if self.task_configuration.object_type == "Extradata":
+                logging.info("Extradata is posted from one process, to keep its dependencies")
+            else:
+                self.post_in_shards()
+                return
+        if self.task_configuration.validate_records and not self.record_validator:
+            self.record_validator = self.get_record_validator()
+        # Created up front, so that the posting threads share one client
+        self.get_shared_http_client()
+        if self.concurrency > 1:
+            logging.info(
+                "Keeping up to %s %s in flight",
+                self.concurrency,
+                "batches" if self.api_info.get("is_batch") else "records",
+            )
+            self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            if self.task_configuration.object_type == "SRS" and self.shard_range is None:
+                self.create_snapshot()
+            with open(self.folder_structure.failed_recs_path, "w") as failed_recs_file:
+                for file_def in self.task_configuration.files:
+                    path = self.folder_structure.results_folder / file_def.file_name
+                    self.post_file(path, failed_recs_file, *(self.shard_range or (0, None)))
+                while self.in_flight:
+                    self.collect_posted_batches(failed_recs_file)
+                logging.info("Done posting %s records. ", (self.processed))
+        except Exception as ee:
+            self.shut_down_executor()
+            if self.task_configuration.object_type == "SRS" and self.shard_range is None:
+                self.commit_snapshot()
+            raise ee
+        finally:
+            self.shut_down_executor()
+            if self.journal:
+                self.journal.close()
+
+    def post_in_shards(self):
+        """Posts the files from a pool of worker processes.
+
+        Each file is split into posting_processes parts at line boundaries. Every part is
+        posted by a BatchPoster of its own in a worker process, named after the task and
+        the number of the part, so that a restarted task resumes each part from its own
+        progress journal. All parts of an SRS load share the snapshot of this task. The
+        counters, reports and failed records of the parts are merged into this task.
+        """
+        processes = self.task_configuration.posting_processes
+        shards = []
+        for file_def in self.task_configuration.files:
+            path = self.folder_structure.results_folder / file_def.file_name
+            for shard_range in get_line_aligned_ranges(path, processes):
+                shard_config = self.task_configuration.copy(
+                    update={
+                        "name": f"{self.task_configuration.name}_shard{len(shards) + 1}",
+                        "files": [file_def],
+                        "posting_processes": 1,
+                        "rerun_failed_records": False,
+                        "rate_limits": get_shared_rate_limits(
+                            self.task_configuration.rate_limits, processes
+                        ),
+                    }
+                )
+                shards.append((shard_config, shard_range))
+        logging.info("Posting %s parts from %s processes", len(shards), processes)
+        if self.task_configuration.object_type == "SRS":
+            self.create_snapshot()
+        try:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                futures = [
+                    pool.submit(
+                        post_shard,
+                        shard_config,
+                        self.library_configuration,
+                        shard_range,
+                        self.snapshot_id,
+                    )
+                    for shard_config, shard_range in shards
+                ]
                 with open(self.folder_structure.failed_recs_path, "w") as failed_recs_file:
-                    for file_def in self.task_configuration.files:
-                        path = self.folder_structure.results_folder / file_def.file_name
-                        with open(path) as rows:
-                            logging.info("Running %s", path)
-                            last_row = ""
-                            for self.processed, row in enumerate(rows, start=1):
-                                last_row = row
-                                if row.strip():
-                                    try:
-                                        if self.task_configuration.object_type == "Extradata":
-                                            self.post_extra_data(
-                                                row, self.processed, failed_recs_file
-                                            )
-                                        elif not self.api_info["is_batch"]:
-                                            self.post_single_records(
-                                                row, self.processed, failed_recs_file
-                                            )
-                                        else:
-                                            batch = self.post_record_batch(
-                                                batch, failed_recs_file, row
-                                            )
-                                    except UnicodeDecodeError as unicode_error:
-                                        self.handle_unicode_error(unicode_error, last_row)
-                                    except TransformationProcessError as tpe:
-                                        self.handle_generic_exception(
-                                            tpe,
-                                            last_row,
-                                            batch,
-                                            self.processed,
-                                            failed_recs_file,
-                                        )
-                                        logging.critical("Halting %s", tpe)
-                                        print(f"\n\t{tpe.message}")
-                                        sys.exit(1)
-                                    except TransformationRecordFailedError as exception:
-                                        self.handle_generic_exception(
-                                            exception,
-                                            last_row,
-                                            batch,
-                                            self.processed,
-                                            failed_recs_file,
-                                        )
-                                        batch = []
-
-                    if self.task_configuration.object_type != "Extradata" and any(batch):
-                        try:
-                            self.post_batch(batch, failed_recs_file, self.processed)
-                        except Exception as exception:
-                            self.handle_generic_exception(
-                                exception, last_row, batch, self.processed, failed_recs_file
-                            )
-                    logging.info("Done posting %s records. ", (self.processed))
-            except Exception as ee:
-                if self.task_configuration.object_type == "SRS":
-                    self.commit_snapshot()
-                raise ee
+                    for future in as_completed(futures):
+                        self.merge_shard_results(future.result(), failed_recs_file)
+        except Exception as ee:
+            if self.task_configuration.object_type == "SRS":
+                self.commit_snapshot()
+            raise ee
+        logging.info("Done posting %s records. ", (self.processed))
+
+    def get_shard_results(self) -> dict:
+        """The counters and reports of a part posted by a worker process, to merge"""
+        return {
+            "processed": self.processed,
+            "num_posted": self.num_posted,
+            "num_failures": self.num_failures,
+            "failed_batches": self.failed_batches,
+            "users_created": self.users_created,
+            "users_updated": self.users_updated,
+            "report": self.migration_report.report,
+            "retry_counts": self.retry_policy.retry_counts,
+            "upsert_counts": self.upsert_counts,
+            "request_metrics": self.request_metrics.snapshot()["endpoints"],
+            "gateway_stats": self.gateway_pool.stats if self.gateway_pool else {},
+            "failed_recs_path": str(self.folder_structure.failed_recs_path),
+        }
+
+    def merge_shard_results(self, results: dict, failed_recs_file):
+        """Adds the results of a part posted by a worker process to the results of the task
+
+        Args:
+            results (dict): The results, from get_shard_results
+            failed_recs_file: File to append the failed records of the part to
+        """
+        for counter in [
+            "processed",
+            "num_posted",
+            "num_failures",
+            "failed_batches",
+            "users_created",
+            "users_updated",
+        ]:
+            setattr(self, counter, getattr(self, counter) + results[counter])
+        for blurb_id, measures in results["report"].items():
+            for measure, number in measures.items():
+                if measure != "blurb_id":
+                    self.migration_report.add(blurb_id, measure, number)
+        for retry_key, retry_count in results["retry_counts"].items():
+            self.retry_policy.retry_counts[retry_key] = (
+                self.retry_policy.retry_counts.get(retry_key, 0) + retry_count
+            )
+        self.request_metrics.merge(results["request_metrics"])
+        for key, count in results["upsert_counts"].items():
+            self.upsert_counts[key] += count
+        if self.gateway_pool:
+            merge_gateway_stats(self.gateway_pool.stats, results["gateway_stats"])
+        with open(results["failed_recs_path"]) as shard_failed_recs_file:
+            shutil.copyfileobj(shard_failed_recs_file, failed_recs_file)
+        os.remove(results["failed_recs_path"])
+        logging.info(
+            "Part posted. Total rows: %s Total posted: %s Total failed: %s",
+            self.processed,
+            self.num_posted,
+            self.num_failures,
+        )
+
+    def post_file(self, path, failed_recs_file, start=0, end=None):
+        """Posts the rows of one results file, or of the byte range from start to end.
+
+        The file is read as bytes, so that the byte offsets of each row are known. When
+        the progress journal says a range of rows is already posted, the range is skipped.
+
+        Args:
+            path (Path): The results file to post
+            failed_recs_file: File to write failed records to
+            start (int): The byte offset of the first row to post. Defaults to 0
+            end (int, optional): The byte offset to stop posting at. Defaults to the end
+        """
+        batch = []
+        self.current_file_name = path.name
+        self.processed = 0
+        self.row_end = start
+        self.replay_until = 0
+        self.unacknowledged_start = (start, 1)
+        if self.journal:
+            self.journal.start_file(path)
+        if self.task_configuration.object_type == "Extradata" and self.executor:
+            self.post_extra_data_in_stages(path, failed_recs_file)
+            return
+        with open(path, "rb") as rows:
+            logging.info("Running %s", path)
+            rows.seek(start)
+            last_row = ""
+            while end is None or self.row_end < end:
+                done_range = self.journal and self.journal.get_done_range(path.name, self.row_end)
+                if done_range:
+                    self.skip_done_range(rows, done_range)
+                    continue
+                line = rows.readline()
+                if not line:
+                    break
+                self.processed += 1
+                self.track_row(path.name, len(line))
+                try:
+                    row = line.decode("utf-8")
+                    last_row = row
+                    if row.strip():
+                        if self.task_configuration.object_type == "Extradata":
+                            self.post_extra_data(row, self.processed, failed_recs_file)
+                        elif not self.api_info["is_batch"]:
+                            self.post_single_records(row, self.processed, failed_recs_file)
+                        else:
+                            batch = self.post_record_batch(batch, failed_recs_file, row)
+                    if not self.api_info.get("is_batch"):
+                        self.acknowledge_single_rows(failed_recs_file)
+                except UnicodeDecodeError as unicode_error:
+                    self.handle_unicode_error(unicode_error, line)
+                except TransformationProcessError as tpe:
+                    self.handle_generic_exception(
+                        tpe,
+                        last_row,
+                        batch,
+                        self.processed,
+                        failed_recs_file,
+                    )
+                    logging.critical("Halting %s", tpe)
+                    print(f"\n\t{tpe.message}")
+                    sys.exit(1)
+                except TransformationRecordFailedError as exception:
+                    self.handle_failed_batch(
+                        exception,
+                        last_row,
+                        batch,
+                        self.processed,
+                        failed_recs_file,
+                    )
+                    batch = []
+            if self.api_info.get("is_batch") and any(batch):
+                try:
+                    self.dispatch_batch(batch, failed_recs_file, self.processed)
+                except TransformationRecordFailedError as exception:
+                    self.handle_failed_batch(
+                        exception, last_row, batch, self.processed, failed_recs_file
+                    )
+                except Exception as exception:
+                    self.handle_generic_exception(
+                        exception, last_row, batch, self.processed, failed_recs_file
+                    )
+            elif not self.api_info.get("is_batch"):
+                while self.in_flight:
+                    self.collect_single_records(failed_recs_file)
+                self.acknowledge_single_rows(failed_recs_file, force=True)
+
+    def track_row(self, file_name, row_length):
+        """Keeps track of the byte range of the current row, and whether it was in flight
+        when an earlier run of the task was interrupted"""
+        self.row_start = self.row_end
+        self.row_end += row_length
+        pending_range = self.journal and self.journal.get_pending_range(file_name, self.row_start)
+        if pending_range:
+            self.replay_until = max(self.replay_until, pending_range["end"])
+
+    def skip_done_range(self, rows, done_range):
+        logging.info(
+            "Skipping rows %s to %s of %s. Already posted in an earlier run",
+            done_range["first_row"],
+            done_range["last_row"],
+            self.current_file_name,
+        )
+        self.migration_report.add(
+            "GeneralStatistics",
+            i18n.t("Rows skipped since they were posted in an earlier run"),
+            done_range["last_row"] - done_range["first_row"] + 1,
+        )
+        self.row_end = done_range["end"]
+        self.processed = done_range["last_row"]
+        self.unacknowledged_start = (self.row_end, self.processed + 1)
+        rows.seek(self.row_end)
+
+    def current_batch_span(self):
+        return (
+            self.current_file_name,
+            self.batch_start[0],
+            self.row_end,
+            self.batch_start[1],
+            self.processed,
+        )
+
+    def mark_batch_done(self, span, failed_recs_file, failures=0):
+        """Journals the range of the batch as done. Ranges with failed records are left
+        pending, so that a restart of the task posts them again"""
+        if self.journal and not failures:
+            failed_recs_file.flush()
+            self.journal.mark_done(*span)
+
+    def acknowledge_single_rows(self, failed_recs_file, force=False):
+        """Journals the rows posted one by one, every 50 rows.
+
+        When records are posted concurrently, only the rows before the first record still
+        in flight are journaled. Rows that failed are left out of the journaled ranges.
+        """
+        start, first_row = self.unacknowledged_start
+        end, last_row = self.row_end, self.processed
+        if self.in_flight:
+            end, last_row = min(
+                (row_start, num_records - 1)
+                for _, num_records, row_start in self.in_flight.values()
+            )
+        if self.journal and end > start and (force or last_row - first_row + 1 >= 50):
+            failed_recs_file.flush()
+            failed_rows = sorted(r for r in self.failed_rows if r[0] < end)
+            self.failed_rows = [r for r in self.failed_rows if r[0] >= end]
+            for failed_start, failed_end, failed_row in failed_rows:
+                self.mark_rows_done(start, failed_start, first_row, failed_row - 1)
+                start, first_row = failed_end, failed_row + 1
+            self.mark_rows_done(start, end, first_row, last_row)
+            self.unacknowledged_start = (end, last_row + 1)
+
+    def mark_rows_done(self, start, end, first_row, last_row):
+        if end > start:
+            self.journal.mark_done(self.current_file_name, start, end, first_row, last_row)
 
     def post_record_batch(self, batch, failed_recs_file, row):
-        json_rec = json.loads(row.split("\t")[-1])
+        """Adds the row to the batch, and posts the batch once it is full.
+
+        The records are kept as the serialized JSON read from the file, and are spliced
+        into the request body as they are. They are only parsed if a key has to be
+        replaced.
+
+        Args:
+            batch (list): The records of the batch being filled
+            failed_recs_file: File to write failed records to
+            row (str): The row from the results file
+
+        Returns:
+            list: The batch to continue filling
+        """
+        record = row.split("\t")[-1].strip()
         if (
             self.task_configuration.object_type in ["Instances", "Holdings", "Items"]
             and not self.task_configuration.use_safe_inventory_endpoints
@@ -207,23 +755,344 @@ class BatchPoster(MigrationTaskBase):
             self.migration_report.add_general_statistics(
                 i18n.t("Set _version to -1 to enable upsert")
             )
-            json_rec["_version"] = -1
+            record = add_key(record, "_version", -1)
         if self.task_configuration.object_type == "SRS":
-            json_rec["snapshotId"] = self.snapshot_id
+            record = add_key(record, "snapshotId", self.snapshot_id)
+        parsed_record = None
+        if self.record_validator or self.processed == 1:
+            parsed_record = json.loads(record)
         if self.processed == 1:
-            logging.info(json.dumps(json_rec, indent=True))
-        batch.append(json_rec)
-        if len(batch) == int(self.batch_size):
-            self.post_batch(batch, failed_recs_file, self.processed)
+            logging.info(json.dumps(parsed_record, indent=True))
+        if not batch:
+            self.batch_start = (self.row_start, self.processed)
+            self.batch_failures = 0
+            self.batch_replay = False
+        self.batch_replay = self.batch_replay or self.row_start < self.replay_until
+        if self.record_validator and not self.is_valid(parsed_record, record, failed_recs_file):
+            self.batch_failures += 1
+            return batch
+        batch.append(record)
+        if len(batch) >= int(self.batch_size):
+            self.dispatch_batch(batch, failed_recs_file, self.processed)
             batch = []
         return batch
 
+    def get_record_validator(self):
+        """Fetches the JSON schema of the object type, and builds a validator for it. FOLIO's
+        schemas are validated as draft 4, unless they name another draft"""
+        schema_getters = {
+            "Instances": self.folio_client.get_instance_json_schema,
+            "Holdings": self.folio_client.get_holdings_schema,
+            "Items": self.folio_client.get_item_schema,
+        }
+        get_schema = schema_getters.get(self.task_configuration.object_type)
+        if not get_schema:
+            logging.warning(
+                "validateRecords is not supported for %s. Records will not be validated",
+                self.task_configuration.object_type,
+            )
+            return None
+        logging.info("Fetching the %s schema", self.task_configuration.object_type)
+        schema = get_schema()
+        return validator_for(schema, default=Draft4Validator)(schema)
+
+    def is_valid(self, parsed_record: dict, record: str, failed_recs_file) -> bool:
+        """Validates the record, and writes it to the failed records file if it is invalid
+
+        Args:
+            parsed_record (dict): The record to validate
+            record (str): The record as serialized JSON, to write to the failed records file
+            failed_recs_file: File to write failed records to
+
+        Returns:
+            bool: Whether the record is valid
+        """
+        errors = list(self.record_validator.iter_errors(parsed_record))
+        if not errors:
+            return True
+        logging.error(
+            "Record failed schema validation\t%s\t%s",
+            parsed_record.get("id", ""),
+            "; ".join(f"{get_error_path(error)}: {error.message}" for error in errors),
+        )
+        self.migration_report.add_general_statistics(
+            i18n.t("Records that failed schema validation")
+        )
+        for error in errors:
+            self.migration_report.add("SchemaValidation", get_error_category(error))
+        self.num_failures += 1
+        write_failed_batch_to_file([record], failed_recs_file)
+        self.report_failed_records([parsed_record])
+        return False
+
+    def dispatch_batch(self, batch, failed_recs_file, num_records):
+        """Posts the batch, or hands it over to the executor when posting concurrently.
+
+        When posting concurrently, this waits for a slot to free up before submitting
+        the batch, so that no more than concurrent_batches requests are in flight.
+        Responses are always handled on the calling thread.
+
+        Args:
+            batch (list): The records to post
+            failed_recs_file: File to write failed records to
+            num_records (int): The number of rows read so far
+        """
+        if self.dependency_gate:
+            num_withheld = len(batch)
+            batch = self.wait_for_dependencies(batch, failed_recs_file)
+            num_withheld -= len(batch)
+            self.batch_failures += num_withheld
+            if not batch:
+                self.mark_batch_done(
+                    self.current_batch_span(), failed_recs_file, self.batch_failures
+                )
+                return
+        self.record_batch_size(batch)
+        span = self.current_batch_span()
+        query_params = self.query_params
+        if self.batch_replay:
+            query_params = self.get_replay_query_params()
+        if self.journal:
+            self.journal.mark_pending(*span)
+        if not self.executor:
+            num_failures = self.num_failures
+            try:
+                response, batch, request_bytes = self.post_changed_records(batch, query_params)
+                self.handle_batch_response(
+                    response, batch, failed_recs_file, num_records, request_bytes
+                )
+            except TransformationRecordFailedError as exception:
+                self.handle_failed_batch(exception, "", batch, num_records, failed_recs_file)
+            failures = self.batch_failures + self.num_failures - num_failures
+            self.mark_batch_done(span, failed_recs_file, failures)
+            return
+        failures = self.batch_failures
+        while len(self.in_flight) >= self.task_configuration.concurrent_batches:
+            self.collect_posted_batches(failed_recs_file)
+        future = self.executor.submit(self.post_changed_records, batch, query_params)
+        self.in_flight[future] = (batch, num_records, span, failures)
+
+    def wait_for_dependencies(self, batch, failed_recs_file):
+        """Waits until the records the batch refers to are posted or failed, and withholds
+        the records referring to failed ones.
+
+        Used when posting together with the posters of the records this object type
+        depends on, like holdings with instances. While waiting, the responses of the
+        batches in flight are handled.
+
+        Args:
+            batch (list): The records to post
+            failed_recs_file: File to write withheld records to
+
+        Returns:
+            list: The records to post
+        """
+        records = [parse_record(record) for record in batch]
+        if self.depends_on:
+            object_type, key = self.depends_on
+            references = {get_reference(record, key) for record in records} - {None}
+            while not self.dependency_gate.wait(
+                object_type, references, timeout=0 if self.in_flight else None
+            ):
+                self.collect_posted_batches(failed_recs_file)
+            failed = self.dependency_gate.get_failed(object_type, references)
+            if failed:
+                is_withheld = [get_reference(record, key) in failed for record in records]
+                withheld = [r for r, withhold in zip(batch, is_withheld) if withhold]
+                self.withhold_records(withheld, failed_recs_file)
+                batch = [r for r, withhold in zip(batch, is_withheld) if not withhold]
+                records = [rec for rec, withhold in zip(records, is_withheld) if not withhold]
+        self.dependency_gate.dispatch(
+            self.task_configuration.object_type, [record.get("id") for record in records]
+        )
+        return batch
+
+    def withhold_records(self, records, failed_recs_file):
+        for record in records:
+            logging.error(
+                "Record withheld since the record it refers to failed\t%s",
+                parse_record(record).get("id", ""),
+            )
+        self.migration_report.add(
+            "GeneralStatistics",
+            i18n.t("Records withheld since the record they refer to failed"),
+            len(records),
+        )
+        self.num_failures += len(records)
+        write_failed_batch_to_file(records, failed_recs_file)
+        self.report_failed_records(records)
+
+    def acknowledge_records(self, records):
+        """Tells the dependency gate, if any, that the records are in FOLIO"""
+        if self.dependency_gate:
+            self.dependency_gate.acknowledge(
+                self.task_configuration.object_type,
+                [parse_record(record).get("id") for record in records],
+            )
+
+    def report_failed_records(self, records):
+        """Tells the dependency gate, if any, that the records failed to post"""
+        if self.dependency_gate:
+            ids = [parse_record(record).get("id") for record in records]
+            self.dependency_gate.fail(self.task_configuration.object_type, ids)
+            if None in ids:
+                self.dependency_gate.fail_unidentified(self.task_configuration.object_type)
+
+    def get_replay_query_params(self):
+        """Query parameters for a batch that was in flight when an earlier run was
+        interrupted. Upserting makes reposting it safe, where the endpoint supports it"""
+        if self.api_info["supports_upsert"]:
+            logging.info("Reposting a batch that was in flight in an earlier run, using upsert")
+            return {**self.query_params, "upsert": True}
+        logging.info(
+            "Reposting a batch that was in flight in an earlier run. "
+            "Records that were created in the earlier run will fail"
+        )
+        return self.query_params
+
+    def collect_posted_batches(self, failed_recs_file):
+        """Waits for at least one in-flight batch and handles the finished responses.
+
+        Responses are handled in the order they arrive. A failing batch is written to the
+        failed records file on its own, regardless of what else is in flight. Errors raised
+        by a request fail the batch of that request, not the batch being filled. Errors that
+        halt the task are raised once the batch is failed.
+
+        Args:
+            failed_recs_file: File to write failed records to
+        """
+        done, _ = wait(self.in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            batch, num_records, span, failures = self.in_flight.pop(future)
+            num_failures = self.num_failures
+            try:
+                response, batch, request_bytes = future.result()
+                self.handle_batch_response(
+                    response, batch, failed_recs_file, num_records, request_bytes
+                )
+            except TransformationRecordFailedError as exception:
+                self.handle_failed_batch(exception, "", batch, num_records, failed_recs_file)
+            except Exception as exception:
+                self.handle_generic_exception(exception, "", batch, num_records, failed_recs_file)
+                if isinstance(exception, TransformationProcessError):
+                    raise
+            failures += self.num_failures - num_failures
+            self.mark_batch_done(span, failed_recs_file, failures)
+
+    def record_batch_size(self, batch):
+        if self.batch_size_controller:
+            self.migration_report.add("BatchSizes", len(batch))
+
+    def adapt_batch_size(self, response, batch, request_bytes):
+        """Feeds the response into the adaptive batch sizing, if enabled.
+
+        request_bytes is the size of the request body before any compression, since that
+        is what targetRequestBytes limits.
+        """
+        if not self.batch_size_controller:
+            return
+        if response.status_code in [200, 201]:
+            self.batch_size_controller.register_success(
+                len(batch), response.elapsed.total_seconds(), request_bytes
+            )
+        elif response.status_code == 413 or response.status_code >= 500:
+            self.batch_size_controller.register_overload(len(batch))
+        if self.batch_size_controller.batch_size != self.batch_size:
+            logging.info(
+                "Adjusting batch size from %s to %s",
+                self.batch_size,
+                self.batch_size_controller.batch_size,
+            )
+            self.batch_size = self.batch_size_controller.batch_size
+
+    def repost_in_smaller_batches(self, batch, failed_recs_file, num_records):
+        logging.info(
+            "Request with %s records was too large. Reposting in batches of %s",
+            len(batch),
+            self.batch_size,
+        )
+        for smaller_batch in chunks(batch, int(self.batch_size)):
+            self.record_batch_size(smaller_batch)
+            try:
+                self.post_batch(smaller_batch, failed_recs_file, num_records)
+            except TransformationRecordFailedError as exception:
+                self.handle_failed_batch(
+                    exception, "", smaller_batch, num_records, failed_recs_file
+                )
+
+    def shut_down_executor(self):
+        if self.executor:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+            self.in_flight = {}
+
     def post_extra_data(self, row: str, num_records: int, failed_recs_file):
+        response = self.send_extra_data(row)
+        self.handle_single_record_response(response, row, num_records, failed_recs_file)
+
+    def send_extra_data(self, row: str):
         (object_name, data) = row.split("\t")
         endpoint = self.get_extradata_endpoint(self.task_configuration, object_name, data)
         url = f"{self.folio_client.okapi_url}/{endpoint}"
         body = data
-        response = self.post_objects(url, body)
+        return self.post_objects(url, body, object_name)
+
+    def post_extra_data_in_stages(self, path, failed_recs_file):
+        """Posts an extradata file concurrently, one stage at a time.
+
+        Each stage is one pass over the file, posting the rows of the object types in that
+        stage concurrently. A stage is finished before the next one starts, so that
+        objects are posted after the objects they depend on, like instructors after
+        course listings. The journal marks the file as posted once all stages are done,
+        if no rows failed.
+
+        Args:
+            path (Path): The extradata file to post
+            failed_recs_file: File to write failed records to
+        """
+        done_range = self.journal and self.journal.get_done_range(path.name, 0)
+        if done_range:
+            logging.info("Skipping %s. Already posted in an earlier run", path)
+            self.migration_report.add(
+                "GeneralStatistics",
+                i18n.t("Rows skipped since they were posted in an earlier run"),
+                done_range["last_row"],
+            )
+            return
+        stage = 0
+        last_stage = 0
+        num_records = 0
+        while stage <= last_stage:
+            logging.info("Posting stage %s of the extradata in %s", stage + 1, path)
+            with open(path, encoding="utf-8") as rows:
+                for num_records, row in enumerate(rows, start=1):
+                    if not row.strip():
+                        continue
+                    row_stage = get_extradata_stage(row.split("\t")[0])
+                    last_stage = max(last_stage, row_stage)
+                    if row_stage == stage:
+                        self.submit_single_record(
+                            failed_recs_file, row, num_records, self.send_extra_data, row
+                        )
+            while self.in_flight:
+                self.collect_single_records(failed_recs_file)
+            stage += 1
+        self.processed = num_records
+        self.row_end = path.stat().st_size
+        if self.failed_rows:
+            # Not journaled, so that a restart of the task posts the file again
+            self.failed_rows = []
+            return
+        self.acknowledge_single_rows(failed_recs_file, force=True)
+
+    def handle_single_record_response(
+        self, response, row, num_records, failed_recs_file, row_start=None
+    ):
+        """Counts the posted record, or writes it to the failed records file.
+
+        Records that fail since their id already exists in FOLIO are not written to the
+        failed records file, since they are already loaded.
+        """
         if response.status_code == 201:
             self.num_posted += 1
         elif response.status_code == 422:
@@ -231,11 +1100,11 @@ class BatchPoster(MigrationTaskBase):
             error_msg = json.loads(response.text)["errors"][0]["message"]
             logging.error("Row %s\tHTTP %s\t %s", num_records, response.status_code, error_msg)
             if "id value already exists" not in json.loads(response.text)["errors"][0]["message"]:
-                failed_recs_file.write(row)
+                self.write_failed_row(row, num_records, row_start, failed_recs_file)
         else:
             self.num_failures += 1
             logging.error("Row %s\tHTTP %s\t%s", num_records, response.status_code, response.text)
-            failed_recs_file.write(row)
+            self.write_failed_row(row, num_records, row_start, failed_recs_file)
         if num_records % 50 == 0:
             logging.info(
                 "%s records posted successfully. %s failed",
@@ -243,6 +1112,12 @@ class BatchPoster(MigrationTaskBase):
                 self.num_failures,
             )
 
+    def write_failed_row(self, row, num_records, row_start, failed_recs_file):
+        failed_recs_file.write(row)
+        if self.journal:
+            row_start = self.row_start if row_start is None else row_start
+            self.failed_rows.append((row_start, row_start + len(row.encode("utf-8")), num_records))
+
     @staticmethod
     def get_extradata_endpoint(
         task_configuration: TaskConfiguration, object_name: str, string_object: str
@@ -277,36 +1152,218 @@ class BatchPoster(MigrationTaskBase):
             raise TypeError("This record type supports batch processing, use post_batch method")
         api_endpoint = self.api_info.get("api_endpoint")
         url = f"{self.folio_client.okapi_url}{api_endpoint}"
-        response = self.post_objects(url, row)
-        if response.status_code == 201:
-            self.num_posted += 1
-        elif response.status_code == 422:
-            self.num_failures += 1
-            error_msg = json.loads(response.text)["errors"][0]["message"]
-            logging.error("Row %s\tHTTP %s\t %s", num_records, response.status_code, error_msg)
-            if "id value already exists" not in json.loads(response.text)["errors"][0]["message"]:
-                failed_recs_file.write(row)
-        else:
-            self.num_failures += 1
-            logging.error("Row %s\tHTTP %s\t%s", num_records, response.status_code, response.text)
-            failed_recs_file.write(row)
-        if num_records % 50 == 0:
-            logging.info(
-                "%s records posted successfully. %s failed",
-                self.num_posted,
-                self.num_failures,
+        if not self.executor:
+            response = self.post_objects(url, row)
+            self.handle_single_record_response(response, row, num_records, failed_recs_file)
+            return
+        self.submit_single_record(failed_recs_file, row, num_records, self.post_objects, url, row)
+
+    def submit_single_record(self, failed_recs_file, row, num_records, send, *args):
+        """Sends the record from the thread pool, once fewer than concurrency are in flight"""
+        while len(self.in_flight) >= self.concurrency:
+            self.collect_single_records(failed_recs_file)
+        future = self.executor.submit(send, *args)
+        self.in_flight[future] = (row, num_records, self.row_start)
+
+    def collect_single_records(self, failed_recs_file):
+        """Waits for at least one record in flight and handles the finished responses"""
+        done, _ = wait(self.in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            row, num_records, row_start = self.in_flight.pop(future)
+            self.handle_single_record_response(
+                future.result(), row, num_records, failed_recs_file, row_start
             )
 
-    def post_objects(self, url, body):
-        if self.http_client and not self.http_client.is_closed:
-            return self.http_client.post(
-                url, data=body.encode("utf-8"), headers=self.folio_client.okapi_headers
+    def post_objects(self, url, body, retry_key=""):
+        return self.post_content(
+            url, body.encode("utf-8"), retry_key or self.task_configuration.object_type, 1
+        )
+
+    def post_content(self, url, content: bytes, retry_key, num_records, params=None):
+        """Posts the request body, gzip-encoded if compress_requests is on.
+
+        Whether FOLIO accepts gzip-encoded bodies is found out from the first response.
+        If it is HTTP 400 or 415, the request is sent again uncompressed, and so are the
+        requests that follow.
+
+        Args:
+            url (str): The url to post to
+            content (bytes): The request body
+            retry_key (str): What to count the retries as
+            num_records (int): The number of records in the request
+            params (dict, optional): Query parameters
+
+        Returns:
+            httpx.Response: The response
+        """
+        endpoint = get_endpoint("POST", url)
+        # Posting again after a connection error could create the records twice, unless
+        # the records are upserted
+        idempotent = bool((params or {}).get("upsert"))
+        if self.task_configuration.compress_requests and self.accepts_gzip is not False:
+            compressed = gzip.compress(content, compresslevel=6)
+            response = self.send_request(
+                lambda: self.send_post(url, compressed, params, {"content-encoding": "gzip"}),
+                retry_key,
+                endpoint,
+                len(compressed),
+                num_records,
+                len(content) - len(compressed),
+                idempotent,
             )
+            if self.accepts_gzip or response.status_code not in [400, 415]:
+                if not self.accepts_gzip:
+                    logging.info("FOLIO accepts gzip-encoded requests")
+                    self.accepts_gzip = True
+                return response
+            logging.warning(
+                "FOLIO rejected a gzip-encoded request with HTTP %s. "
+                "Sending uncompressed requests from now on",
+                response.status_code,
+            )
+            self.accepts_gzip = False
+        return self.send_request(
+            lambda: self.send_post(url, content, params),
+            retry_key,
+            endpoint,
+            len(content),
+            num_records,
+            idempotent=idempotent,
+        )
+
+    def send_post(self, url, content: bytes, params=None, headers=None):
+        return self.get_shared_http_client().post(
+            url,
+            content=content,
+            headers={**self.folio_client.okapi_headers, **(headers or {})},
+            params=params,
+        )
+
+    def send_request(
+        self,
+        send,
+        retry_key,
+        endpoint,
+        request_bytes=0,
+        num_records=0,
+        bytes_saved=0,
+        idempotent=True,
+    ):
+        """Sends the request through the retry policy, and records the metrics of each attempt.
+
+        Each attempt waits for the rate limit of the FOLIO module behind the endpoint.
+
+        Args:
+            send: Sends the request, and returns the response
+            retry_key (str): What to count the retries as
+            endpoint (str): What to record the metrics as
+            request_bytes (int): The size of the request body
+            num_records (int): The number of records in the request
+            bytes_saved (int): The bytes saved by compressing the request body
+            idempotent (bool): Whether the request can be sent again after a connection
+                error. Defaults to True
+
+        Returns:
+            httpx.Response: The response from the retry policy
+        """
+        attempts = []
+
+        def measured_send():
+            with self.rate_limiters.limit(endpoint.split(" ", 1)[-1], num_records):
+                started = time.monotonic()
+                retry = bool(attempts)
+                attempts.append(started)
+                try:
+                    response = send()
+                except httpx.TransportError as error:
+                    self.request_metrics.record(
+                        endpoint,
+                        time.monotonic() - started,
+                        request_bytes,
+                        num_records,
+                        error=type(error).__name__,
+                        retry=retry,
+                        bytes_saved=bytes_saved,
+                    )
+                    raise
+                self.request_metrics.record(
+                    endpoint,
+                    time.monotonic() - started,
+                    request_bytes,
+                    num_records,
+                    status_code=response.status_code,
+                    retry=retry,
+                    bytes_saved=bytes_saved,
+                )
+                return response
+
+        return self.retry_policy.send(measured_send, retry_key, idempotent)
+
+    def handle_failed_batch(self, exception, last_row, batch, num_records, failed_recs_file):
+        error_text = get_error_text(exception.data_value)
+        if (
+            self.task_configuration.bisect_failed_batches
+            and len(batch) > 1
+            and is_record_level_failure(exception, batch, error_text)
+        ):
+            self.failed_batches += 1
+            self.isolate_failed_records(batch, failed_recs_file, num_records, error_text)
         else:
-            return httpx.post(
-                url, headers=self.okapi_headers, data=body.encode("utf-8"), timeout=None
+            self.handle_generic_exception(
+                exception, last_row, batch, num_records, failed_recs_file
             )
 
+    def isolate_failed_records(self, batch, failed_recs_file, num_records, error_text):
+        """Finds the records that made the batch fail and posts the rest of it.
+
+        Records identified in the error message are failed right away. If the message
+        does not point out any record, the batch is split in halves. Parts that fail
+        again with errors in the records are isolated the same way, until single records
+        remain. Parts that fail for other reasons, like server errors, are failed whole.
+
+        Args:
+            batch (list): The records of the failed batch
+            failed_recs_file: File to write failed records to
+            num_records (int): The number of rows read so far
+            error_text (str): The error message returned for the batch
+        """
+        if len(batch) == 1:
+            self.fail_isolated_records(batch, failed_recs_file, error_text)
+            return
+        offending = find_records_in_error(batch, error_text)
+        if offending:
+            self.fail_isolated_records(offending, failed_recs_file, error_text)
+            offending_records = {id(record) for record in offending}
+            parts = [[r for r in batch if id(r) not in offending_records]]
+        else:
+            middle = len(batch) // 2
+            parts = [batch[:middle], batch[middle:]]
+        for part in filter(None, parts):
+            try:
+                self.post_batch(part, failed_recs_file, num_records)
+            except TransformationRecordFailedError as exception:
+                part_error_text = get_error_text(exception.data_value)
+                if is_record_level_failure(exception, part, part_error_text):
+                    self.isolate_failed_records(
+                        part, failed_recs_file, num_records, part_error_text
+                    )
+                else:
+                    self.handle_generic_exception(
+                        exception, "", part, num_records, failed_recs_file
+                    )
+
+    def fail_isolated_records(self, records, failed_recs_file, error_text):
+        for record in records:
+            logging.error("Record failed\t%s\t%s", parse_record(record).get("id", ""), error_text)
+        self.migration_report.add(
+            "GeneralStatistics",
+            i18n.t("Failed records isolated from failed batches"),
+            len(records),
+        )
+        self.num_failures += len(records)
+        write_failed_batch_to_file(records, failed_recs_file)
+        self.report_failed_records(records)
+
     def handle_generic_exception(self, exception, last_row, batch, num_records, failed_recs_file):
         logging.error("%s", exception)
         self.migration_report.add("Details", i18n.t("Generic exceptions (see log for details)"))
@@ -314,6 +1371,7 @@ class BatchPoster(MigrationTaskBase):
         self.failed_batches += 1
         self.num_failures += len(batch)
         write_failed_batch_to_file(batch, failed_recs_file)
+        self.report_failed_records(batch)
         logging.info("Resetting batch...Number of failed batches: %s", self.failed_batches)
         batch = []
         if self.failed_batches > 50000:
@@ -323,23 +1381,36 @@ class BatchPoster(MigrationTaskBase):
 
     def handle_unicode_error(self, unicode_error, last_row):
         self.migration_report.add("Details", i18n.t("Encoding errors"))
+        if self.dependency_gate:
+            self.dependency_gate.fail_unidentified(self.task_configuration.object_type)
         logging.info("=========ERROR==============")
         logging.info(
             "%s Posting failed. Encoding error reading file",
             unicode_error,
         )
         logging.info(
-            "Failing row, either the one shown here or the next row in %s",
-            self.task_configuration.file.file_name,
+            "Failing row %s in %s",
+            self.processed,
+            self.current_file_name,
         )
         logging.info(last_row)
         logging.info("=========Stack trace==============")
-        traceback.logging.info_exc()
-        logging.info("=======================", flush=True)
+        logging.info(traceback.format_exc())
+        logging.info("=======================")
+
+    def post_batch(self, batch, failed_recs_file, num_records, query_params=None):
+        response, request_bytes = self.do_post(batch, query_params)
+        self.handle_batch_response(response, batch, failed_recs_file, num_records, request_bytes)
 
-    def post_batch(self, batch, failed_recs_file, num_records, recursion_depth=0):
-        response = self.do_post(batch)
+    def handle_batch_response(
+        self, response, batch, failed_recs_file, num_records, request_bytes=0
+    ):
+        if response is None:
+            # Every record in the batch was unchanged, so nothing was posted
+            return
+        self.adapt_batch_size(response, batch, request_bytes)
         if response.status_code == 201:
+            self.acknowledge_records(batch)
             logging.info(
                 (
                     "Posting successful! Total rows: %s Total failed: %s "
@@ -363,7 +1434,11 @@ class BatchPoster(MigrationTaskBase):
                     "%s users in batch failed to load",
                     json_report.get("failedRecords", 0),
                 )
-                write_failed_batch_to_file(batch, failed_recs_file)
+                failed_users = find_failed_users(batch, json_report.get("failedUsers", []))
+                if self.task_configuration.bisect_failed_batches and failed_users:
+                    write_failed_batch_to_file(failed_users, failed_recs_file)
+                else:
+                    write_failed_batch_to_file(batch, failed_recs_file)
             if json_report.get("failedUsers", []):
                 logging.error("Errormessage: %s", json_report.get("error", []))
                 for failed_user in json_report.get("failedUsers"):
@@ -402,30 +1477,13 @@ class BatchPoster(MigrationTaskBase):
             # Likely a json parsing error
             logging.error(response.text)
             raise TransformationProcessError("", "HTTP 400. Something is wrong. Quitting")
-        elif self.task_configuration.object_type == "SRS" and response.status_code >= 500:
-            logging.info(
-                "Post failed. Size: %s Waiting 30s until reposting. Number of tries: %s of 5",
-                get_req_size(response),
-                recursion_depth,
-            )
-            logging.info(response.text)
-            time.sleep(30)
-            if recursion_depth > 4:
-                raise TransformationRecordFailedError(
-                    "",
-                    f"HTTP {response.status_code}\t"
-                    f"Request size: {get_req_size(response)}"
-                    f"{datetime.utcnow().isoformat()} UTC\n",
-                    response.text,
-                )
-            else:
-                self.post_batch(batch, failed_recs_file, num_records, recursion_depth + 1)
         elif (
             response.status_code == 413 and "DB_ALLOW_SUPPRESS_OPTIMISTIC_LOCKING" in response.text
         ):
             logging.error(response.text)
             raise TransformationProcessError("", response.text, "")
-
+        elif response.status_code == 413 and self.batch_size_controller and len(batch) > 1:
+            self.repost_in_smaller_batches(batch, failed_recs_file, num_records)
         else:
             try:
                 logging.info(response.text)
@@ -443,21 +1501,93 @@ class BatchPoster(MigrationTaskBase):
                 resp,
             )
 
-    def do_post(self, batch):
+    def post_changed_records(self, batch, query_params=None):
+        """Posts the batch, leaving out the unchanged records if skip_unchanged is on
+
+        Returns:
+            tuple: The response, or None if every record was unchanged, the records that
+            were posted and the size of the uncompressed request body
+        """
+        if self.task_configuration.skip_unchanged and self.api_info.get("query_endpoint"):
+            batch = self.remove_unchanged_records(batch)
+            if not batch:
+                logging.info("All records in the batch are unchanged. Nothing to post")
+                return None, batch, 0
+        response, request_bytes = self.do_post(batch, query_params)
+        return response, batch, request_bytes
+
+    def do_post(self, batch, query_params=None):
+        """Posts the batch
+
+        Returns:
+            tuple: The response, and the size of the uncompressed request body
+        """
         path = self.api_info["api_endpoint"]
         url = self.folio_client.okapi_url + path
-        if self.api_info["object_name"] == "users":
-            payload = {self.api_info["object_name"]: list(batch), "totalRecords": len(batch)}
-        elif self.api_info["total_records"]:
-            payload = {"records": list(batch), "totalRecords": len(batch)}
-        else:
-            payload = {self.api_info["object_name"]: batch}
-        if self.http_client and not self.http_client.is_closed:
-            return self.http_client.post(
-                url, json=payload, headers=self.folio_client.okapi_headers, params=self.query_params
+        body = get_batch_body(self.api_info, batch).encode("utf-8")
+        response = self.post_content(
+            url,
+            body,
+            self.task_configuration.object_type,
+            len(batch),
+            query_params or self.query_params,
+        )
+        return response, len(body)
+
+    def remove_unchanged_records(self, batch: list) -> list:
+        """Leaves out the records that are stored in FOLIO as they are in the batch. The
+        records left out count as posted
+
+        Args:
+            batch (list): The records of the batch
+
+        Returns:
+            list: The new and changed records of the batch
+        """
+        records = [parse_record(record) for record in batch]
+        ids = [record["id"] for record in records if record.get("id")]
+        stored_records = {}
+        for id_chunk in chunks(ids, 50):
+            stored_records.update(
+                (stored_record["id"], stored_record)
+                for stored_record in self.get_stored_records(id_chunk)
             )
-        else:
-            return httpx.post(url, headers=self.okapi_headers, json=payload, params=self.query_params, timeout=None)
+        changed_records = []
+        unchanged_records = []
+        counts = {"unchanged": 0, "new": 0, "changed": 0}
+        for record, parsed_record in zip(batch, records):
+            stored_record = stored_records.get(parsed_record.get("id"))
+            if stored_record is None:
+                counts["new"] += 1
+                changed_records.append(record)
+            elif is_unchanged(parsed_record, stored_record):
+                counts["unchanged"] += 1
+                unchanged_records.append(record)
+            else:
+                counts["changed"] += 1
+                changed_records.append(record)
+        with self.lock:
+            for key, count in counts.items():
+                self.upsert_counts[key] += count
+        self.acknowledge_records(unchanged_records)
+        return changed_records
+
+    def get_stored_records(self, ids: list) -> list:
+        """Fetches the records with these ids from FOLIO, with one CQL query"""
+        url = self.folio_client.okapi_url + self.api_info["query_endpoint"]
+        params = {"query": f"id==({' or '.join(ids)})", "limit": len(ids)}
+        response = self.send_request(
+            lambda: self.send_get(url, params),
+            self.task_configuration.object_type,
+            get_endpoint("GET", url),
+        )
+        response.raise_for_status()
+        return response.json()[self.api_info["object_name"]]
+
+    def send_get(self, url, params=None):
+        return self.get_shared_http_client().get(
+            url, headers=self.folio_client.okapi_headers, params=params
+        )
 
     def wrap_up(self):
         logging.info("Done. Wrapping up")
@@ -481,7 +1611,43 @@ class BatchPoster(MigrationTaskBase):
         self.migration_report.set("GeneralStatistics", f"Records processed {run}", self.processed)
         self.migration_report.set("GeneralStatistics", f"Records posted {run}", self.num_posted)
         self.migration_report.set("GeneralStatistics", f"Failed to post {run}", self.num_failures)
+        if self.batch_size_controller:
+            logging.info("Last adaptive batch size was %s", self.batch_size)
+            self.migration_report.set(
+                "GeneralStatistics", i18n.t("Last adaptive batch size"), self.batch_size
+            )
+        for retry_key, retry_count in self.retry_policy.retry_counts.items():
+            self.migration_report.add("Retries", retry_key, retry_count)
+        self.request_metrics.add_to_report(self.migration_report)
+        self.request_metrics.write()
+        for module, seconds in self.rate_limiters.get_seconds_waited().items():
+            self.migration_report.set(
+                "GeneralStatistics",
+                i18n.t("Seconds waited for the rate limit of %{module}", module=module),
+                round(seconds),
+            )
+        if self.gateway_pool:
+            for base_url, counts in self.gateway_pool.stats.items():
+                for key, measure in [
+                    ("requests", "Requests sent to gateway %{url}"),
+                    ("failures", "Failed requests to gateway %{url}"),
+                    ("ejections", "Times gateway %{url} was ejected"),
+                ]:
+                    self.migration_report.set(
+                        "GeneralStatistics", i18n.t(measure, url=base_url), counts[key]
+                    )
+        if self.task_configuration.skip_unchanged and self.api_info.get("query_endpoint"):
+            for key, measure in [
+                ("unchanged", "Unchanged records skipped"),
+                ("new", "New records posted"),
+                ("changed", "Changed records posted"),
+            ]:
+                self.migration_report.add(
+                    "UnchangedRecords", i18n.t(measure), self.upsert_counts[key]
+                )
         self.rerun_run()
+        if self.journal:
+            self.journal.remove()
         with open(self.folder_structure.migration_reports_file, "w+") as report_file:
             self.migration_report.write_migration_report(
                 f"{self.task_configuration.object_type} loading report",
@@ -489,6 +1655,7 @@ class BatchPoster(MigrationTaskBase):
                 self.start_datetime,
             )
         self.clean_out_empty_logs()
+        self.close_shared_http_client()
 
     def rerun_run(self):
         if self.task_configuration.rerun_failed_records and (self.num_failures > 0):
@@ -498,15 +1665,38 @@ class BatchPoster(MigrationTaskBase):
             )
             try:
                 self.task_configuration.batch_size = 1
+                self.task_configuration.adaptive_batch_size = False
                 self.task_configuration.files = [
                     FileDefinition(file_name=str(self.folder_structure.failed_recs_path.name))
                 ]
                 temp_report = copy.deepcopy(self.migration_report)
                 temp_start = self.start_datetime
+                temp_metrics = self.request_metrics
+                temp_validator = self.record_validator
+                temp_http_client = self.shared_http_client
+                temp_gateway_pool = self.gateway_pool
+                temp_dependency_gate = self.dependency_gate
+                temp_depends_on = self.depends_on
+                rerun_path = self.folder_structure.failed_recs_path
                 self.task_configuration.rerun_failed_records = False
-                self.__init__(self.task_configuration, self.library_configuration, self.folio_client)
+                self.__init__(
+                    self.task_configuration, self.library_configuration, self.folio_client
+                )
+                self.shared_http_client = temp_http_client
+                # The shared client sends through this pool, and its stats cover both runs
+                self.gateway_pool = temp_gateway_pool
+                # Records referring to records that failed again are withheld again
+                self.dependency_gate = temp_dependency_gate
+                self.depends_on = temp_depends_on
+                if self.folder_structure.failed_recs_path == rerun_path:
+                    # Named in the same second as the file being rerun, which it would empty
+                    self.folder_structure.failed_recs_path = rerun_path.with_name(
+                        f"{rerun_path.stem}_rerun{rerun_path.suffix}"
+                    )
                 self.performing_rerun = True
                 self.migration_report = temp_report
+                self.request_metrics = temp_metrics
+                self.record_validator = temp_validator
                 self.start_datetime = temp_start
                 self.do_work()
                 self.wrap_up()
@@ -531,12 +1721,13 @@ class BatchPoster(MigrationTaskBase):
         }
         try:
             url = f"{self.folio_client.okapi_url}/source-storage/snapshots"
-            if self.http_client and not self.http_client.is_closed:
-                res = self.http_client.post(
+
+            def send():
+                return self.get_shared_http_client().post(
                     url, json=snapshot, headers=self.folio_client.okapi_headers
                 )
-            else:
-                res = httpx.post(url, headers=self.okapi_headers, json=snapshot, timeout=None)
+
+            res = self.send_request(send, "Snapshots", get_endpoint("POST", url), idempotent=False)
             res.raise_for_status()
             logging.info("Posted Snapshot to FOLIO: %s", json.dumps(snapshot, indent=4))
             get_url = f"{self.folio_client.okapi_url}/source-storage/snapshots/{self.snapshot_id}"
@@ -544,10 +1735,9 @@ class BatchPoster(MigrationTaskBase):
             while not getted:
                 logging.info("Sleeping while waiting for the snapshot to get created")
                 time.sleep(5)
-                if self.http_client and not self.http_client.is_closed:
-                    res = self.http_client.get(get_url, headers=self.folio_client.okapi_headers)
-                else:
-                    res = httpx.get(get_url, headers=self.okapi_headers, timeout=None)
+                res = self.get_shared_http_client().get(
+                    get_url, headers=self.folio_client.okapi_headers
+                )
                 if res.status_code == 200:
                     getted = True
                 else:
@@ -560,12 +1750,13 @@ class BatchPoster(MigrationTaskBase):
         snapshot = {"jobExecutionId": self.snapshot_id, "status": "COMMITTED"}
         try:
             url = f"{self.folio_client.okapi_url}/source-storage/snapshots/{self.snapshot_id}"
-            if self.http_client and not self.http_client.is_closed:
-                res = self.http_client.put(
+
+            def send():
+                return self.get_shared_http_client().put(
                     url, json=snapshot, headers=self.folio_client.okapi_headers
                 )
-            else:
-                res = httpx.put(url, headers=self.okapi_headers, json=snapshot, timeout=None)
+
+            res = self.send_request(send, "Snapshots", get_endpoint("PUT", url))
             res.raise_for_status()
             logging.info("Posted Committed snapshot to FOLIO: %s", json.dumps(snapshot, indent=4))
         except Exception:
@@ -589,6 +1780,7 @@ def get_api_info(object_type: str, use_safe: bool = True):
         },
         "Items": {
             "object_name": "items",
+            "query_endpoint": "/item-storage/items",
             "api_endpoint": (
                 "/item-storage/batch/synchronous"
                 if use_safe
@@ -601,6 +1793,7 @@ def get_api_info(object_type: str, use_safe: bool = True):
         },
         "Holdings": {
             "object_name": "holdingsRecords",
+            "query_endpoint": "/holdings-storage/holdings",
             "api_endpoint": (
                 "/holdings-storage/batch/synchronous"
                 if use_safe
@@ -613,6 +1806,7 @@ def get_api_info(object_type: str, use_safe: bool = True):
         },
         "Instances": {
             "object_name": "instances",
+            "query_endpoint": "/instance-storage/instances",
             "api_endpoint": (
                 "/instance-storage/batch/synchronous"
                 if use_safe
@@ -674,6 +1868,281 @@ def get_api_info(object_type: str, use_safe: bool = True):
         sys.exit(1)
 
 
+def post_shard(
+    task_config: BatchPoster.TaskConfiguration,
+    library_config: LibraryConfiguration,
+    shard_range: tuple,
+    snapshot_id: str,
+) -> dict:
+    """Posts one part of a file from a worker process, with a FOLIO client of its own
+
+    Args:
+        task_config (BatchPoster.TaskConfiguration): The configuration of the part
+        library_config (LibraryConfiguration): The library configuration of the task
+        shard_range (tuple): The byte range of the file to post
+        snapshot_id (str): The SRS snapshot of the task
+
+    Returns:
+        dict: The results to merge into the task, from get_shard_results
+    """
+    with FolioClient(
+        library_config.okapi_url,
+        library_config.tenant_id,
+        library_config.okapi_username,
+        library_config.okapi_password,
+    ) as folio_client:
+        poster = BatchPoster(task_config, library_config, folio_client)
+        poster.shard_range = shard_range
+        poster.snapshot_id = snapshot_id
+        poster.do_work()
+        poster.close_shared_http_client()
+        if poster.journal:
+            poster.journal.remove()
+        return poster.get_shard_results()
+
+
+def get_shared_rate_limits(rate_limits: Dict[str, RateLimit], processes: int) -> dict:
+    """Divides the rate limits between the processes posting at the same time"""
+    return {
+        module: RateLimit(
+            requests_per_second=rate_limit.requests_per_second / processes,
+            records_per_second=rate_limit.records_per_second / processes,
+            max_concurrent_requests=-(-rate_limit.max_concurrent_requests // processes),
+        )
+        for module, rate_limit in rate_limits.items()
+    }
+
+
+def get_line_aligned_ranges(path, number_of_ranges: int) -> list:
+    """Splits the file into up to number_of_ranges byte ranges of about the same size,
+    each starting at the start of a line
+
+    Args:
+        path (Path): The file to split
+        number_of_ranges (int): The number of ranges to split the file into
+
+    Returns:
+        list: (start, end) byte offsets of the ranges. Empty ranges are left out
+    """
+    size = os.path.getsize(path)
+    boundaries = [0]
+    with open(path, "rb") as rows:
+        for index in range(1, number_of_ranges):
+            target = max(size * index // number_of_ranges, boundaries[-1])
+            if target == 0:
+                boundaries.append(0)
+                continue
+            # Step back one byte, so that a target at the start of a line stays there
+            rows.seek(target - 1)
+            rows.readline()
+            boundaries.append(min(rows.tell(), size))
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
+
+# Fields that FOLIO sets on stored records, as paths of keys, that are left out when
+# comparing records
+SERVER_GENERATED_FIELDS = {
+    ("_version",),
+    ("metadata",),
+    ("effectiveCallNumberComponents",),
+    ("effectiveShelvingOrder",),
+    ("effectiveLocationId",),
+    ("statusUpdatedDate",),
+    ("status", "date"),
+}
+
+
+def normalize_record(value, path: tuple = ()):
+    """The record without the fields FOLIO sets, and without empty lists and objects,
+    since FOLIO stores those as defaults for the fields a record leaves out"""
+    if isinstance(value, dict):
+        return {
+            key: normalize_record(item, path + (key,))
+            for key, item in value.items()
+            if path + (key,) not in SERVER_GENERATED_FIELDS and item not in ([], {})
+        }
+    if isinstance(value, list):
+        return [normalize_record(item, path) for item in value]
+    return value
+
+
+def is_unchanged(record: dict, stored_record: dict) -> bool:
+    """Compares a record to the version stored in FOLIO, leaving out the fields FOLIO sets"""
+    return normalize_record(record) == normalize_record(stored_record)
+
+
+# Extradata object types, and the object type they refer to, that has to be posted first
+EXTRADATA_DEPENDENCIES = {
+    "course": "courselisting",
+    "instructor": "courselisting",
+    "interfaceCredential": "interfaces",
+    "feefineaction": "account",
+}
+
+
+def get_extradata_stage(object_name: str) -> int:
+    """Returns the stage to post the extradata object type in. Objects without
+    dependencies are posted in the first stage, 0."""
+    if object_name not in EXTRADATA_DEPENDENCIES:
+        return 0
+    return 1 + get_extradata_stage(EXTRADATA_DEPENDENCIES[object_name])
+
+
+def get_batch_body(api_info: dict, batch: list) -> str:
+    """Builds the request body by splicing the serialized records into the envelope
+
+    Args:
+        api_info (dict): The API info of the object type, from get_api_info
+        batch (list): The records, as serialized JSON
+
+    Returns:
+        str: The request body
+    """
+    records = ",".join(
+        record if isinstance(record, str) else json.dumps(record) for record in batch
+    )
+    if api_info["object_name"] == "users":
+        return f'{{"users": [{records}], "totalRecords": {len(batch)}}}'
+    elif api_info["total_records"]:
+        return f'{{"records": [{records}], "totalRecords": {len(batch)}}}'
+    else:
+        return f'{{{json.dumps(api_info["object_name"])}: [{records}]}}'
+
+
+def get_error_path(error) -> str:
+    """The field a schema validation error is in, like holdingsStatements[1].statement"""
+    path = ""
+    for part in error.absolute_path:
+        if isinstance(part, int):
+            path += f"[{part}]"
+        else:
+            path += f".{part}" if path else part
+    return path or "(record)"
+
+
+def get_error_category(error) -> str:
+    """The field and the failed keyword of a schema validation error, without array indexes
+    or values, for counting the errors in the report. Missing and unexpected properties
+    are named"""
+    path = re.sub(r"\[\d+\]", "[]", get_error_path(error))
+    if error.validator in ["required", "additionalProperties"]:
+        return f"{path}: {error.message}"
+    return f"{path}: {error.validator}"
+
+
+def get_error_text(data_value) -> str:
+    return data_value if isinstance(data_value, str) else getattr(data_value, "text", "")
+
+
+def find_records_in_error(batch: list, error_text: str) -> list:
+    """Returns the records whose id is named in the error message or, if no id is, the
+    records whose hrid is. Values only count as named when they stand on their own, so
+    that short hrids like "12" do not match inside other ids, hrids or numbers"""
+    if not error_text:
+        return []
+    records = [parse_record(record) for record in batch]
+    for key in ["id", "hrid"]:
+        named = [
+            record
+            for record, parsed_record in zip(batch, records)
+            if is_named_in(str(parsed_record.get(key) or ""), error_text)
+        ]
+        if named:
+            return named
+    return []
+
+
+def is_named_in(value: str, text: str) -> bool:
+    return bool(value) and bool(re.search(rf"(?<![\w.-]){re.escape(value)}(?![\w-]|\.\w)", text))
+
+
+def get_status_code(exception: TransformationRecordFailedError) -> int:
+    """The HTTP status of a failed batch, from the message handle_batch_response raises"""
+    match = re.match(r"HTTP (\d+)", str(exception.message))
+    return int(match[1]) if match else 0
+
+
+def is_record_level_failure(
+    exception: TransformationRecordFailedError, batch: list, error_text: str
+) -> bool:
+    """Whether the batch failed because of some of its records, so that isolating them
+    lets the rest be posted. That is, FOLIO answered HTTP 422, or named the records"""
+    return get_status_code(exception) == 422 or bool(find_records_in_error(batch, error_text))
+
+
+def find_failed_users(batch: list, failed_users: list) -> list:
+    """Returns the users in the batch that mod-user-import reported as failed"""
+    failed_keys = {
+        (failed_user.get("username", ""), failed_user.get("externalSystemId", ""))
+        for failed_user in failed_users
+    }
+    return [
+        user
+        for user in batch
+        if (
+            parse_record(user).get("username", ""),
+            parse_record(user).get("externalSystemId", ""),
+        )
+        in failed_keys
+    ]
+
+
+class AdaptiveBatchSize:
+    """Grows or shrinks the batch size based on how the server handles the requests.
+
+    Keeps moving averages of the time and the request bytes spent per record, and aims
+    for the batch size that keeps requests within both the latency and the size budget.
+    Each adjustment is limited to halving or growing by a quarter, to avoid oscillation.
+    HTTP 413 and 5xx responses halve the size of the batch that was rejected.
+    """
+
+    smoothing = 0.3
+
+    def __init__(
+        self,
+        initial: int,
+        minimum: int,
+        maximum: int,
+        target_seconds: float,
+        target_bytes: int,
+    ):
+        self.minimum = min(minimum, maximum)
+        self.maximum = maximum
+        self.target_seconds = target_seconds
+        self.target_bytes = target_bytes
+        self.batch_size = self.clamp(initial)
+        self.seconds_per_record = 0.0
+        self.bytes_per_record = 0.0
+
+    def clamp(self, batch_size: float) -> int:
+        return int(max(self.minimum, min(self.maximum, batch_size)))
+
+    def register_success(self, num_records: int, elapsed_seconds: float, request_bytes: int):
+        if not num_records:
+            return
+        self.seconds_per_record = self.moving_average(
+            self.seconds_per_record, elapsed_seconds / num_records
+        )
+        self.bytes_per_record = self.moving_average(
+            self.bytes_per_record, request_bytes / num_records
+        )
+        ideal = min(
+            self.target_seconds / max(self.seconds_per_record, 1e-9),
+            self.target_bytes / max(self.bytes_per_record, 1e-9),
+        )
+        largest_step = max(self.batch_size + 1, self.batch_size * 1.25)
+        self.batch_size = self.clamp(max(self.batch_size * 0.5, min(largest_step, ideal)))
+
+    def register_overload(self, num_records: int):
+        self.batch_size = self.clamp(min(self.batch_size, num_records // 2))
+
+    def moving_average(self, average: float, value: float) -> float:
+        if not average:
+            return value
+        return average + self.smoothing * (value - average)
+
+
 def chunks(records, number_of_chunks):
     """Yield successive n-sized chunks from lst.
 
@@ -698,8 +2167,12 @@ def get_human_readable(size, precision=2):
 
 
 def get_req_size(response: httpx.Response):
-    size = response.request.method
-    size += str(response.request.url)
-    size += "\r\n".join(f"{k}{v}" for k, v in response.request.headers.items())
-    size += response.request.content.decode("utf-8") or ""
-    return get_human_readable(len(size.encode("utf-8")))
+    size = len(response.request.content)
+    if response.request.headers.get("content-encoding") == "gzip":
+        # The last four bytes of a gzip stream hold the uncompressed size
+        uncompressed_size = int.from_bytes(response.request.content[-4:], "little")
+        return (
+            f"{get_human_readable(size)} "
+            f"(gzip, saved {get_human_readable(uncompressed_size - size)})"
+        )
+    return get_human_readable(size)
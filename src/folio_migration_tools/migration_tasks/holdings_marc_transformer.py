@@ -113,6 +113,60 @@ class HoldingsMarcTransformer(MigrationTaskBase):
                 ),
             ),
         ] = False
+        transformation_processes: Annotated[
+            int,
+            Field(
+                title="Transformation processes",
+                description=(
+                    "The number of worker processes to transform the files with. Each file is "
+                    "split into this many parts at record boundaries, and the parts are "
+                    "transformed by the workers, each with its own log and result files. The "
+                    "results are merged when all parts are transformed. Each part gets a "
+                    "range of HRIDs sized by its number of records, so records that fail can "
+                    "leave gaps in the HRIDs. Defaults to 1 (transform from the task's own "
+                    "process)"
+                ),
+                ge=1,
+            ),
+        ] = 1
+        index_marc_files: Annotated[
+            bool,
+            Field(
+                title="Index MARC files",
+                description=(
+                    "Write an index of the records in each MARC file, with the byte offset, "
+                    "length and 001 of every record, to a sidecar next to the file, named "
+                    "after the file with .idx added. The index is used to split the files "
+                    "between the transformation processes without reading the files again, "
+                    "for as long as the files are not changed, and to read the records from "
+                    "the first_record of a file"
+                ),
+            ),
+        ] = False
+        memoized_conditions: Annotated[
+            List[str],
+            Field(
+                title="Memoized conditions",
+                description=(
+                    "Names of mapping rule conditions, like trim_punctuation or "
+                    "set_classification_type_id, whose results are remembered and reused for "
+                    "values that repeat across records. Only conditions whose result depends "
+                    "on the value and the parameter alone can be memoized. The hits and misses "
+                    "are counted in the migration report"
+                ),
+            ),
+        ] = []
+        condition_memo_size: Annotated[
+            int,
+            Field(
+                title="Condition memo size",
+                description=(
+                    "The number of results to remember for each memoized condition. "
+                    "The least recently used results are forgotten first"
+                ),
+                ge=1,
+            ),
+        ] = 10000
         legacy_id_marc_path: Annotated[
             str,
             Field(
@@ -226,6 +280,7 @@ class HoldingsMarcTransformer(MigrationTaskBase):
             self.instance_id_map,
             self.boundwith_relationship_map,
         )
+        self.mapper.hrid_handler.http_client = self.get_shared_http_client()
         if (
             self.task_configuration.reset_hrid_settings
             and self.task_configuration.update_hrid_settings
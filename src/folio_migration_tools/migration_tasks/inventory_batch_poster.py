@@ -0,0 +1,180 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Annotated, List
+
+import i18n
+from folio_uuid.folio_namespaces import FOLIONamespaces
+from pydantic import Field
+
+from folio_migration_tools.dependency_gate import DependencyGate
+from folio_migration_tools.library_configuration import (
+    FileDefinition,
+    LibraryConfiguration,
+)
+from folio_migration_tools.migration_report import MigrationReport
+from folio_migration_tools.migration_tasks.batch_poster import BatchPoster
+from folio_migration_tools.migration_tasks.migration_task_base import MigrationTaskBase
+
+# The object types posted by the task, with the object type and the key each refers to
+INVENTORY_DEPENDENCIES = {
+    "Instances": None,
+    "SRS": ("Instances", "externalIdsHolder.instanceId"),
+    "Holdings": ("Instances", "instanceId"),
+    "Items": ("Holdings", "holdingsRecordId"),
+}
+
+
+class InventoryBatchPoster(MigrationTaskBase):
+    """Posts instances, their SRS records, holdings and items at the same time.
+
+    Each object type is posted by a BatchPoster of its own, in a thread of its own. A
+    batch of SRS records or holdings is posted once the instances it refers to are
+    posted, and a batch of items once its holdings are posted. Records referring to
+    records that failed to post are withheld, and written to the failed records file of
+    their object type. The SRS records are posted in one snapshot, created when the
+    posting starts and committed when the task wraps up.
+
+    The failed records are rerun when the task wraps up, one object type at a time, in
+    the order of INVENTORY_DEPENDENCIES. Records are then withheld if the records they
+    refer to failed again.
+    """
+
+    class TaskConfiguration(BatchPoster.TaskConfiguration):
+        object_type: Annotated[
+            str, Field(description="Not used. The object types follow from the files")
+        ] = "Inventory"
+        files: Annotated[
+            List[FileDefinition], Field(description="Not used. Use the files per object type")
+        ] = []
+        instance_files: Annotated[
+            List[FileDefinition],
+            Field(description="The results files with the instances to post"),
+        ] = []
+        srs_files: Annotated[
+            List[FileDefinition],
+            Field(description="The results files with the SRS records of the instances to post"),
+        ] = []
+        holdings_files: Annotated[
+            List[FileDefinition],
+            Field(description="The results files with the holdings to post"),
+        ] = []
+        item_files: Annotated[
+            List[FileDefinition],
+            Field(description="The results files with the items to post"),
+        ] = []
+
+    @staticmethod
+    def get_object_type() -> FOLIONamespaces:
+        return FOLIONamespaces.other
+
+    def __init__(
+        self,
+        task_config: TaskConfiguration,
+        library_config: LibraryConfiguration,
+        folio_client,
+        use_logging: bool = True,
+    ):
+        super().__init__(library_config, task_config, folio_client, use_logging)
+        self.migration_report = MigrationReport()
+        if task_config.posting_processes > 1:
+            logging.info("Inventory is posted from one process, to keep its dependencies")
+        self.dependency_gate = DependencyGate()
+        self.posters = {}
+        for object_type, files in [
+            ("Instances", task_config.instance_files),
+            ("SRS", task_config.srs_files),
+            ("Holdings", task_config.holdings_files),
+            ("Items", task_config.item_files),
+        ]:
+            if not files:
+                continue
+            settings = task_config.dict(include=set(BatchPoster.TaskConfiguration.__fields__))
+            settings.update(
+                name=f"{task_config.name}_{object_type.lower()}",
+                migration_task_type="BatchPoster",
+                object_type=object_type,
+                files=files,
+                posting_processes=1,
+            )
+            poster_config = BatchPoster.TaskConfiguration(**settings)
+            poster = BatchPoster(poster_config, library_config, folio_client, use_logging=False)
+            poster.dependency_gate = self.dependency_gate
+            dependency = INVENTORY_DEPENDENCIES[object_type]
+            if dependency and dependency[0] in self.posters:
+                poster.depends_on = dependency
+            self.posters[object_type] = poster
+        logging.info("Posting %s at the same time", ", ".join(self.posters))
+
+    def do_work(self):
+        errors = {}
+        try:
+            with ThreadPoolExecutor(max_workers=len(self.posters) or 1) as executor:
+                futures = {
+                    object_type: executor.submit(self.post_object_type, object_type, poster)
+                    for object_type, poster in self.posters.items()
+                }
+                # Every object type is waited for, so that one failing poster does not
+                # leave the others posting after the task has given up
+                for object_type, future in futures.items():
+                    try:
+                        future.result()
+                    except BaseException as error:
+                        logging.error("Posting %s failed: %s", object_type, error)
+                        errors[object_type] = error
+        finally:
+            if errors:
+                self.wrap_up_failed_posting(errors)
+        if errors:
+            raise next(iter(errors.values()))
+
+    def post_object_type(self, object_type: str, poster: BatchPoster):
+        complete = False
+        try:
+            poster.do_work()
+            complete = True
+        finally:
+            # The records of a poster that did not get through its files may not have
+            # been dispatched, so records referring to them are withheld
+            self.dependency_gate.finish(object_type, complete)
+            logging.info("Done posting %s", object_type)
+
+    def wrap_up_failed_posting(self, errors: dict):
+        """Commits the SRS snapshot and writes the report, since the task halts before it
+        is wrapped up. A BatchPoster commits its own snapshot when it fails with an
+        exception"""
+        if "SRS" in self.posters and not isinstance(errors.get("SRS"), Exception):
+            try:
+                self.posters["SRS"].commit_snapshot()
+            except SystemExit:
+                # Logged by commit_snapshot. The error the posting failed with is raised
+                pass
+        self.set_statistics()
+        self.write_report()
+
+    def set_statistics(self):
+        for object_type, poster in self.posters.items():
+            self.migration_report.set(
+                "GeneralStatistics",
+                i18n.t("%{object_type}: records processed", object_type=object_type),
+                poster.processed,
+            )
+            self.migration_report.set(
+                "GeneralStatistics",
+                i18n.t("%{object_type}: failed to post", object_type=object_type),
+                poster.num_failures,
+            )
+
+    def write_report(self):
+        with open(self.folder_structure.migration_reports_file, "w+") as report_file:
+            self.migration_report.write_migration_report(
+                i18n.t("Inventory loading report"), report_file, self.start_datetime
+            )
+
+    def wrap_up(self):
+        logging.info("Done. Wrapping up")
+        self.set_statistics()
+        # In dependency order, so that records are rerun after the records they refer to
+        for poster in self.posters.values():
+            poster.wrap_up()
+        self.write_report()
+        self.clean_out_empty_logs()
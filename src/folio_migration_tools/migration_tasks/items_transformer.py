@@ -197,7 +197,11 @@ class ItemsTransformer(MigrationTaskBase):
             and self.task_configuration.update_hrid_settings
         ):
             hrid_handler = HRIDHandler(
-                self.folio_client, HridHandling.default, self.mapper.migration_report, True
+                self.folio_client,
+                HridHandling.default,
+                self.mapper.migration_report,
+                True,
+                self.get_shared_http_client(),
             )
             hrid_handler.reset_item_hrid_counter()
 
@@ -0,0 +1,242 @@
+import json
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Annotated, List
+
+import i18n
+from folio_uuid.folio_namespaces import FOLIONamespaces
+from pydantic import Field
+
+from folio_migration_tools.custom_exceptions import TransformationProcessError
+from folio_migration_tools.library_configuration import (
+    FileDefinition,
+    LibraryConfiguration,
+)
+from folio_migration_tools.migration_report import MigrationReport
+from folio_migration_tools.migration_tasks.batch_poster import get_api_info
+from folio_migration_tools.migration_tasks.migration_task_base import MigrationTaskBase
+from folio_migration_tools.retry_policy import RetryPolicy
+from folio_migration_tools.task_configuration import AbstractTaskConfiguration
+
+# The number of ids fetched per request when listing the ids stored in FOLIO
+ID_PAGE_SIZE = 1000
+
+
+class LoadReconciler(MigrationTaskBase):
+    """Checks that the records in the results files are in FOLIO.
+
+    The ids of the records are read from the files in chunks, and each chunk is looked
+    up in FOLIO with one CQL query. Several chunks are looked up at the same time. The
+    ids that are not in FOLIO are written to a file, and the records themselves to a
+    results file that BatchPoster can post.
+
+    Optionally, the ids of all the records of the object type stored in FOLIO are listed,
+    in 16 ranges at the same time, and the ids that are not in the files are written to
+    a file of extra ids.
+    """
+
+    class TaskConfiguration(AbstractTaskConfiguration):
+        name: str
+        migration_task_type: str
+        object_type: Annotated[
+            str,
+            Field(description="The type of the records: Instances, Holdings or Items"),
+        ]
+        files: Annotated[
+            List[FileDefinition],
+            Field(description="The results files with the records to look up in FOLIO"),
+        ]
+        chunk_size: Annotated[
+            int,
+            Field(
+                description=(
+                    "The number of ids looked up with each query. Defaults to 100, which "
+                    "keeps the query URLs below 4 kB"
+                ),
+                ge=1,
+            ),
+        ] = 100
+        concurrent_requests: Annotated[
+            int,
+            Field(
+                description="The number of queries sent at the same time. Defaults to 4",
+                ge=1,
+            ),
+        ] = 4
+        find_extra_ids: Annotated[
+            bool,
+            Field(
+                description=(
+                    "Toggles whether or not to list the ids of all the records of the object "
+                    "type in FOLIO, and write the ids that are not in the files to a file. "
+                    "This includes records loaded from other files. Defaults to False"
+                )
+            ),
+        ] = False
+
+    @staticmethod
+    def get_object_type() -> FOLIONamespaces:
+        return FOLIONamespaces.other
+
+    def __init__(
+        self,
+        task_config: TaskConfiguration,
+        library_config: LibraryConfiguration,
+        folio_client,
+        use_logging: bool = True,
+    ):
+        super().__init__(library_config, task_config, folio_client, use_logging)
+        self.migration_report = MigrationReport()
+        self.api_info = get_api_info(task_config.object_type)
+        if not self.api_info.get("query_endpoint"):
+            raise TransformationProcessError(
+                "", f"Reconciling {task_config.object_type} is not supported"
+            )
+        self.retry_policy = RetryPolicy()
+        self.http_client = None
+        self.in_flight: dict = {}
+        self.local_ids: set = set()
+        self.counts = {"in_files": 0, "found": 0, "missing": 0, "extra": 0, "duplicates": 0}
+        file_template = self.folder_structure.file_template
+        results_folder = self.folder_structure.results_folder
+        self.missing_ids_path = results_folder / f"missing_ids{file_template}.txt"
+        self.missing_records_path = results_folder / f"missing_records{file_template}.json"
+        self.extra_ids_path = results_folder / f"extra_ids{file_template}.txt"
+
+    def do_work(self):
+        self.http_client = self.get_shared_http_client()
+        with ThreadPoolExecutor(
+            max_workers=self.task_configuration.concurrent_requests
+        ) as executor, open(self.missing_ids_path, "w") as missing_ids_file, open(
+            self.missing_records_path, "w"
+        ) as missing_records_file:
+            for file_def in self.task_configuration.files:
+                path = self.folder_structure.results_folder / file_def.file_name
+                logging.info("Looking up the records in %s", path)
+                for chunk in self.read_chunks(path):
+                    while len(self.in_flight) >= self.task_configuration.concurrent_requests:
+                        self.collect_lookups(missing_ids_file, missing_records_file)
+                    future = executor.submit(self.get_stored_ids, [i for i, _ in chunk])
+                    self.in_flight[future] = chunk
+            while self.in_flight:
+                self.collect_lookups(missing_ids_file, missing_records_file)
+            if self.task_configuration.find_extra_ids:
+                self.write_extra_ids(executor)
+        logging.info(
+            "%s of %s records are in FOLIO. %s are missing",
+            self.counts["found"],
+            self.counts["in_files"],
+            self.counts["missing"],
+        )
+
+    def read_chunks(self, path):
+        """Yields the ids and rows of the records in the file, chunk_size at a time"""
+        chunk = []
+        with open(path, encoding="utf-8") as rows:
+            for row in rows:
+                if not row.strip():
+                    continue
+                record_id = json.loads(row.split("\t")[-1])["id"]
+                self.counts["in_files"] += 1
+                if self.task_configuration.find_extra_ids:
+                    if record_id in self.local_ids:
+                        self.counts["duplicates"] += 1
+                    self.local_ids.add(record_id)
+                chunk.append((record_id, row))
+                if len(chunk) >= self.task_configuration.chunk_size:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+
+    def collect_lookups(self, missing_ids_file, missing_records_file):
+        """Waits for at least one lookup, and writes the records not found in FOLIO"""
+        done, _ = wait(self.in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            chunk = self.in_flight.pop(future)
+            stored_ids = future.result()
+            for record_id, row in chunk:
+                if record_id in stored_ids:
+                    self.counts["found"] += 1
+                else:
+                    self.counts["missing"] += 1
+                    missing_ids_file.write(f"{record_id}\n")
+                    missing_records_file.write(row if row.endswith("\n") else f"{row}\n")
+
+    def get_stored_ids(self, ids: list) -> set:
+        """Returns the ones of the ids that are stored in FOLIO, using one CQL query"""
+        records = self.get_records({"query": f"id==({' or '.join(ids)})", "limit": len(ids)})
+        return {record["id"] for record in records}
+
+    def write_extra_ids(self, executor: ThreadPoolExecutor):
+        """Lists the ids in FOLIO, and writes the ones not in the files"""
+        logging.info("Listing the ids of the %s in FOLIO", self.task_configuration.object_type)
+        with open(self.extra_ids_path, "w") as extra_ids_file:
+            for extra_ids in executor.map(self.get_extra_ids_in_range, "0123456789abcdef"):
+                self.counts["extra"] += len(extra_ids)
+                extra_ids_file.writelines(f"{record_id}\n" for record_id in extra_ids)
+
+    def get_extra_ids_in_range(self, first_digit: str) -> list:
+        """Pages through the ids in FOLIO starting with the hex digit, in id order, and
+        returns the ones not in the files"""
+        extra_ids = []
+        last_id = ""
+        while True:
+            conditions = [
+                f'id>"{last_id}"' if last_id else f'id>="{get_range_bound(first_digit)}"'
+            ]
+            if first_digit != "f":
+                conditions.append(f'id<"{get_range_bound(hex(int(first_digit, 16) + 1)[2:])}"')
+            records = self.get_records(
+                {"query": f"{' and '.join(conditions)} sortBy id", "limit": ID_PAGE_SIZE}
+            )
+            extra_ids.extend(r["id"] for r in records if r["id"] not in self.local_ids)
+            if len(records) < ID_PAGE_SIZE:
+                return extra_ids
+            last_id = records[-1]["id"]
+
+    def get_records(self, params: dict) -> list:
+        url = self.folio_client.okapi_url + self.api_info["query_endpoint"]
+        response = self.retry_policy.send(
+            lambda: self.http_client.get(
+                url, headers=self.folio_client.okapi_headers, params=params
+            ),
+            self.task_configuration.object_type,
+        )
+        response.raise_for_status()
+        return response.json()[self.api_info["object_name"]]
+
+    def wrap_up(self):
+        logging.info("Done. Wrapping up")
+        for key, measure in [
+            ("in_files", "Records in the files"),
+            ("found", "Records found in FOLIO"),
+            ("missing", "Records missing from FOLIO"),
+        ]:
+            self.migration_report.set("GeneralStatistics", i18n.t(measure), self.counts[key])
+        if self.task_configuration.find_extra_ids:
+            self.migration_report.set(
+                "GeneralStatistics",
+                i18n.t("Records in FOLIO that are not in the files"),
+                self.counts["extra"],
+            )
+            self.migration_report.set(
+                "GeneralStatistics",
+                i18n.t("Duplicate ids in the files"),
+                self.counts["duplicates"],
+            )
+        for retry_key, retry_count in self.retry_policy.retry_counts.items():
+            self.migration_report.add("Retries", retry_key, retry_count)
+        logging.info("Ids missing from FOLIO are in %s", self.missing_ids_path)
+        logging.info("Records to repost are in %s", self.missing_records_path)
+        with open(self.folder_structure.migration_reports_file, "w+") as report_file:
+            self.migration_report.write_migration_report(
+                i18n.t("Reconciliation report"), report_file, self.start_datetime
+            )
+        self.clean_out_empty_logs()
+        self.close_shared_http_client()
+
+
+def get_range_bound(first_digit: str) -> str:
+    """Returns the lowest UUID starting with the hex digit"""
+    return f"{first_digit}0000000-0000-0000-0000-000000000000"
@@ -6,7 +6,7 @@ import sys
 import time
 import traceback
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional
 from urllib.error import HTTPError
 
 import i18n
@@ -20,12 +20,14 @@ from folio_migration_tools.library_configuration import (
     FileDefinition,
     FolioRelease,
     LibraryConfiguration,
+    RateLimit,
 )
 from folio_migration_tools.mapping_file_transformation.mapping_file_mapper_base import (
     MappingFileMapperBase,
 )
 from folio_migration_tools.migration_report import MigrationReport
 from folio_migration_tools.migration_tasks.migration_task_base import MigrationTaskBase
+from folio_migration_tools.rate_limiter import RateLimiters
 from folio_migration_tools.task_configuration import AbstractTaskConfiguration
 from folio_migration_tools.transaction_migration.legacy_loan import LegacyLoan
 from folio_migration_tools.transaction_migration.transaction_result import (
@@ -42,6 +44,7 @@ class LoansMigrator(MigrationTaskBase):
         starting_row: Optional[int] = 1
         item_files: Optional[list[FileDefinition]] = []
         patron_files: Optional[list[FileDefinition]] = []
+        rate_limits: Optional[Dict[str, RateLimit]] = {}
 
     @staticmethod
     def get_object_type() -> FOLIONamespaces:
@@ -64,10 +67,13 @@ class LoansMigrator(MigrationTaskBase):
         self.migration_report = MigrationReport()
         self.valid_legacy_loans = []
         super().__init__(library_config, task_configuration, folio_client)
+        self.rate_limiters = RateLimiters(task_configuration.rate_limits)
         self.circulation_helper = CirculationHelper(
             self.folio_client,
             task_configuration.fallback_service_point_id,
             self.migration_report,
+            self.rate_limiters,
+            self.get_shared_http_client(),
         )
         logging.info("Check that SMTP is disabled before migrating loans")
         self.check_smtp_config()
@@ -169,7 +175,8 @@ class LoansMigrator(MigrationTaskBase):
             logging.info("SMTP connection is disabled...")
 
     def do_work(self):
-        with self.folio_client.get_folio_http_client() as self.http_client:
+        with self.get_http_client() as self.http_client:
+            self.http_client.event_hooks["request"].append(self.rate_limiters.event_hook)
             logging.info("Starting")
             starting_index = (
                 self.task_configuration.starting_row - 1
@@ -281,6 +288,7 @@ class LoansMigrator(MigrationTaskBase):
                 i18n.t("Loans migration report"), report_file, self.start_datetime
             )
         self.clean_out_empty_logs()
+        self.close_shared_http_client()
 
     def write_failed_loans_to_file(self):
         csv_columns = [
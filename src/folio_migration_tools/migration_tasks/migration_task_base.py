@@ -1,17 +1,24 @@
 import csv
+import importlib.util
 import json
 import logging
 import os
+import shutil
 import sys
 import time
 from abc import abstractmethod
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timezone
 from genericpath import isfile
 from pathlib import Path
+from typing import Optional
 
 import folioclient
+import httpx
+import i18n
 from folio_uuid.folio_namespaces import FOLIONamespaces
 from folioclient import FolioClient
+from folioclient.FolioClient import HTTPX_TIMEOUT
 
 from folio_migration_tools import library_configuration, task_configuration
 from folio_migration_tools.custom_exceptions import (
@@ -20,13 +27,19 @@ from folio_migration_tools.custom_exceptions import (
 )
 from folio_migration_tools.extradata_writer import ExtradataWriter
 from folio_migration_tools.folder_structure import FolderStructure
+from folio_migration_tools.gateway_pool import GatewayPool, GatewayTransport
 from folio_migration_tools.marc_rules_transformation.marc_file_processor import (
     MarcFileProcessor,
 )
 from folio_migration_tools.marc_rules_transformation.marc_reader_wrapper import (
     MARCReaderWrapper,
+    get_marcxml_part,
+    get_record_aligned_ranges,
+    get_record_range,
 )
 
+HRID_COUNTERS = ["instance_hrid_counter", "holdings_hrid_counter"]
+
 
 class MigrationTaskBase:
     @staticmethod
@@ -63,6 +76,12 @@ class MigrationTaskBase:
 
         self.library_configuration = library_configuration
         self.object_type = self.get_object_type()
+        self.gateway_pool = (
+            GatewayPool(library_configuration.gateway_urls, library_configuration.okapi_url)
+            if library_configuration.gateway_urls
+            else None
+        )
+        self.shared_http_client: Optional[httpx.Client] = None
         try:
             self.folder_structure.setup_migration_file_structure()
             # Initiate Worker
@@ -85,6 +104,49 @@ class MigrationTaskBase:
     def wrap_up(self):
         raise NotImplementedError()
 
+    def get_http_client(self) -> httpx.Client:
+        """Returns an httpx client for FOLIO, with the pool limits, timeouts and HTTP
+        version of the http_client library configuration. If gateway URLs are
+        configured, the requests of the client are spread across them"""
+        http_config = self.library_configuration.http_client
+        if not self.gateway_pool and not http_config:
+            return self.folio_client.get_folio_http_client()
+        http_config = http_config or library_configuration.HttpClientConfiguration()
+        http2 = http_config.http2
+        if http2 and not importlib.util.find_spec("h2"):
+            logging.warning("The h2 package is not installed. Falling back to HTTP/1.1")
+            http2 = False
+        transport: httpx.BaseTransport = httpx.HTTPTransport(
+            verify=self.folio_client.ssl_verify,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=http_config.max_connections,
+                max_keepalive_connections=http_config.max_keepalive_connections,
+                keepalive_expiry=http_config.keepalive_expiry,
+            ),
+        )
+        if self.gateway_pool:
+            transport = GatewayTransport(self.gateway_pool, transport)
+        return httpx.Client(
+            timeout=httpx.Timeout(
+                HTTPX_TIMEOUT, connect=http_config.connect_timeout, read=http_config.read_timeout
+            ),
+            verify=self.folio_client.ssl_verify,
+            base_url=self.folio_client.okapi_url,
+            transport=transport,
+        )
+
+    def get_shared_http_client(self) -> httpx.Client:
+        """Returns the httpx client the task and its helpers share, so that their
+        requests reuse the same open connections. The client is created on first use"""
+        if not self.shared_http_client or self.shared_http_client.is_closed:
+            self.shared_http_client = self.get_http_client()
+        return self.shared_http_client
+
+    def close_shared_http_client(self):
+        if self.shared_http_client and not self.shared_http_client.is_closed:
+            self.shared_http_client.close()
+
     def clean_out_empty_logs(self):
         if (
             self.folder_structure.data_issue_file_path.is_file()
@@ -252,9 +314,15 @@ class MigrationTaskBase:
             elapsed_formatted = "{0:.4g}".format(elapsed)
             logging.info(f"{num_processed:,} records processed. Recs/sec: {elapsed_formatted} ")
 
-    def do_work_marc_transformer(
-        self,
-    ):
+    def do_work_marc_transformer(self, part: Optional[dict] = None):
+        """Transforms the MARC files of the task, or one part of a file
+
+        Args:
+            part (Optional[dict]): The part of a file to transform, from
+                get_record_aligned_ranges, with its FileDefinition added. Defaults to None
+                (all files, from a pool of worker processes if transformation_processes
+                is more than 1)
+        """
         logging.info("Starting....")
         if self.folder_structure.failed_marc_recs_file.is_file():
             os.remove(self.folder_structure.failed_marc_recs_file)
@@ -263,13 +331,230 @@ class MigrationTaskBase:
             self.processor = MarcFileProcessor(
                 self.mapper, self.folder_structure, created_records_file
             )
-            for file_def in self.task_configuration.files:
+            if part:
                 MARCReaderWrapper.process_single_file(
-                    file_def,
+                    part["file_def"],
                     self.processor,
                     self.folder_structure.failed_marc_recs_file,
                     self.folder_structure,
+                    part,
                 )
+            elif getattr(self.task_configuration, "transformation_processes", 1) > 1:
+                self.transform_marc_in_shards(created_records_file)
+            else:
+                for file_def in self.task_configuration.files:
+                    part = None
+                    if record_range := get_record_range(file_def):
+                        # The records are reached through the index of the file
+                        path = self.folder_structure.legacy_records_folder / file_def.file_name
+                        write_index = getattr(self.task_configuration, "index_marc_files", False)
+                        [part] = get_record_aligned_ranges(
+                            path, 1, write_index=write_index, **record_range
+                        )
+                    MARCReaderWrapper.process_single_file(
+                        file_def,
+                        self.processor,
+                        self.folder_structure.failed_marc_recs_file,
+                        self.folder_structure,
+                        part,
+                    )
+
+    def transform_marc_in_shards(self, created_records_file):
+        """Transforms the MARC files from a pool of worker processes.
+
+        Each file is split into transformation_processes parts at record boundaries. Every
+        part is transformed by a task of its own in a worker process, named after the task
+        and the number of the part, with its own mapper, log and result files. Each part is
+        given a range of HRIDs of its own, sized by the records in it. When the 001s are
+        preserved, each part also gets the 001s of earlier parts that recur in it, so that
+        duplicate 001s are caught across parts. The results of the parts are merged into
+        this task in file order, and records whose legacy IDs were all taken by an earlier
+        part are left out, as they would have been by a single process.
+        """
+        processes = self.task_configuration.transformation_processes
+        hrid_handler = self.mapper.hrid_handler
+        preserve_001s = (
+            self.task_configuration.hrid_handling == library_configuration.HridHandling.preserve001
+        )
+        counter_name = (
+            "holdings_hrid_counter"
+            if self.object_type == FOLIONamespaces.holdings
+            else "instance_hrid_counter"
+        )
+        hrid_counters = {counter: getattr(hrid_handler, counter) for counter in HRID_COUNTERS}
+        seen_001s: set = set()
+        shards = []
+        for file_def in self.task_configuration.files:
+            path = self.folder_structure.legacy_records_folder / file_def.file_name
+            record_range = get_record_range(file_def)
+            if file_def.marc_file_format == library_configuration.MarcFileFormat.marcxml:
+                # MARCXML files are not split. Each is transformed whole, in a part of its own
+                parts = [get_marcxml_part(path, preserve_001s)]
+            else:
+                parts = get_record_aligned_ranges(
+                    path,
+                    processes,
+                    preserve_001s,
+                    self.task_configuration.index_marc_files,
+                    **record_range,
+                )
+            for part in parts:
+                part["file_def"] = file_def
+                shard_config = self.task_configuration.copy(
+                    update={
+                        "name": f"{self.task_configuration.name}_shard{len(shards) + 1}",
+                        "files": [file_def],
+                        "transformation_processes": 1,
+                        "reset_hrid_settings": False,
+                        "update_hrid_settings": False,
+                    }
+                )
+                start_counters = dict(hrid_counters)
+                # Records that can not be walked take at least five bytes each
+                unparsed_records = part["unparsed_bytes"] // 5
+                if preserve_001s:
+                    known_001s, duplicates, without_001s = get_001_statistics(
+                        part.pop("001s"), seen_001s
+                    )
+                    hrid_counters[counter_name] += without_001s + duplicates + unparsed_records
+                    # preserve_001_as_hrid steps the instance counter once more for each
+                    # duplicate 001
+                    hrid_counters["instance_hrid_counter"] += duplicates + unparsed_records
+                else:
+                    part.pop("001s")
+                    known_001s = set()
+                    hrid_counters[counter_name] += part["records"] + unparsed_records
+                shards.append(
+                    (shard_config, part, start_counters, dict(hrid_counters), known_001s)
+                )
+        logging.info("Transforming %s parts from %s processes", len(shards), processes)
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = [
+                pool.submit(
+                    transform_marc_shard,
+                    type(self),
+                    shard_config,
+                    self.library_configuration,
+                    part,
+                    start_counters,
+                    known_001s,
+                )
+                for shard_config, part, start_counters, _, known_001s in shards
+            ]
+            # Merged in file order, so that the first record with a legacy ID keeps it
+            for future, (shard_config, _, _, end_counters, _) in zip(futures, shards):
+                results = future.result()
+                for counter in HRID_COUNTERS:
+                    if results["hrid_counters"][counter] > end_counters[counter]:
+                        raise TransformationProcessError(
+                            "",
+                            f"{shard_config.name} used more HRIDs than it was given. "
+                            "Run the task with transformationProcesses set to 1",
+                            counter,
+                        )
+                    setattr(hrid_handler, counter, results["hrid_counters"][counter])
+                self.merge_marc_shard_results(results, created_records_file)
+        logging.info("Done transforming %s records", self.processor.records_count)
+
+    def get_marc_shard_results(self) -> dict:
+        """The counters, reports and result files of a part transformed by a worker process"""
+        return {
+            "records_count": self.processor.records_count,
+            "failed_records_count": self.processor.failed_records_count,
+            "id_map": list(self.mapper.id_map.values()),
+            "report": self.mapper.migration_report.report,
+            "parsed_records": self.mapper.parsed_records,
+            "mapped_folio_fields": self.mapper.mapped_folio_fields,
+            "mapped_legacy_fields": self.mapper.mapped_legacy_fields,
+            "hrid_counters": {
+                counter: getattr(self.mapper.hrid_handler, counter) for counter in HRID_COUNTERS
+            },
+            "created_objects_path": str(self.folder_structure.created_objects_path),
+            "srs_records_path": str(self.folder_structure.srs_records_path),
+            "failed_marc_recs_path": str(self.folder_structure.failed_marc_recs_file),
+            "extradata_path": str(self.folder_structure.transformation_extra_data_path),
+        }
+
+    def merge_marc_shard_results(self, results: dict, created_records_file):
+        """Adds the results of a part transformed by a worker process to the results of the
+        task. Records whose legacy IDs are all in the legacy ID map already are left out.
+
+        Args:
+            results (dict): The results, from get_marc_shard_results
+            created_records_file: File to append the created records of the part to
+        """
+        report = self.mapper.migration_report
+        processor = self.processor
+        processor.records_count += results["records_count"]
+        processor.failed_records_count += results["failed_records_count"]
+        records: dict = {}
+        for id_tuple in results["id_map"]:
+            records.setdefault(id_tuple[1], []).append(tuple(id_tuple))
+        dropped_ids = set()
+        for folio_id, id_tuples in records.items():
+            new_id_tuples = [t for t in id_tuples if t[0] not in processor.legacy_ids]
+            for _ in range(len(id_tuples) - len(new_id_tuples)):
+                report.add_general_statistics(i18n.t("Duplicate MARC record identifiers "))
+            if not new_id_tuples:
+                legacy_ids = "-".join(t[0] for t in id_tuples)
+                TransformationRecordFailedError(
+                    legacy_ids,
+                    "Duplicate recod identifier(s). See logs. Record Failed",
+                    legacy_ids,
+                ).log_it()
+                report.add_general_statistics(
+                    i18n.t("Failed records. No unique record identifiers in legacy record")
+                )
+                report.add_general_statistics(
+                    i18n.t("Records that failed transformation. Check log for details")
+                )
+                processor.failed_records_count += 1
+                dropped_ids.add(folio_id)
+            for id_tuple in new_id_tuples:
+                processor.legacy_ids.add(id_tuple[0])
+                self.mapper.id_map[id_tuple[0]] = id_tuple
+        for blurb_id, measures in results["report"].items():
+            for measure, number in measures.items():
+                if measure != "blurb_id":
+                    report.add(blurb_id, measure, number)
+        self.mapper.parsed_records += results["parsed_records"]
+        for mapped_fields, shard_mapped_fields in [
+            (self.mapper.mapped_folio_fields, results["mapped_folio_fields"]),
+            (self.mapper.mapped_legacy_fields, results["mapped_legacy_fields"]),
+        ]:
+            for field_name, counts in shard_mapped_fields.items():
+                totals = mapped_fields.setdefault(field_name, [0] * len(counts))
+                for index, count in enumerate(counts):
+                    totals[index] += count
+        if dropped := copy_shard_results(
+            results["created_objects_path"],
+            created_records_file,
+            dropped_ids,
+            lambda record: record["id"],
+        ):
+            report.add("GeneralStatistics", i18n.t("Inventory records written to disk"), -dropped)
+        if self.task_configuration.create_source_records and (
+            dropped := copy_shard_results(
+                results["srs_records_path"],
+                processor.srs_records_file,
+                dropped_ids,
+                lambda srs_record: next(iter(srs_record["externalIdsHolder"].values())),
+            )
+        ):
+            report.add("GeneralStatistics", i18n.t("SRS records written to disk"), -dropped)
+        for shard_path, path in [
+            (results["failed_marc_recs_path"], self.folder_structure.failed_marc_recs_file),
+            (results["extradata_path"], self.extradata_writer.path_to_file),
+        ]:
+            if os.path.isfile(shard_path):
+                with open(shard_path, "rb") as shard_file, open(path, "ab") as merged_file:
+                    shutil.copyfileobj(shard_file, merged_file)
+                os.remove(shard_path)
+        logging.info(
+            "Part transformed. Total records: %s Total failed: %s",
+            processor.records_count,
+            processor.failed_records_count,
+        )
 
     def load_ref_data_mapping_file(
         self,
@@ -348,3 +633,101 @@ class LevelFilter(logging.Filter):
 
     def filter(self, record):
         return record.levelno == self.level
+
+
+def transform_marc_shard(
+    task_class,
+    task_config: task_configuration.AbstractTaskConfiguration,
+    library_config: library_configuration.LibraryConfiguration,
+    part: dict,
+    hrid_counters: dict,
+    known_001s: set,
+) -> dict:
+    """Transforms one part of a MARC file from a worker process, with a FOLIO client of its own
+
+    Args:
+        task_class: The MigrationTaskBase subclass of the task
+        task_config (AbstractTaskConfiguration): The configuration of the part
+        library_config (LibraryConfiguration): The library configuration of the task
+        part (dict): The part of the file, from get_record_aligned_ranges
+        hrid_counters (dict): The HRID counters to start the part from
+        known_001s (set): 001s of earlier parts that recur in this part
+
+    Returns:
+        dict: The results to merge into the task, from get_marc_shard_results
+    """
+    with FolioClient(
+        library_config.okapi_url,
+        library_config.tenant_id,
+        library_config.okapi_username,
+        library_config.okapi_password,
+    ) as folio_client:
+        task = task_class(task_config, library_config, folio_client)
+        # A forked worker inherits the extradata writer of the task
+        task.extradata_writer.path_to_file = task.folder_structure.transformation_extra_data_path
+        if task.extradata_writer.path_to_file.is_file():
+            os.remove(task.extradata_writer.path_to_file)
+        for counter, value in hrid_counters.items():
+            setattr(task.mapper.hrid_handler, counter, value)
+        task.mapper.hrid_handler.unique_001s.update(known_001s)
+        task.do_work_marc_transformer(part)
+        if task.task_configuration.create_source_records:
+            task.processor.srs_records_file.close()
+        task.extradata_writer.flush()
+        task.close_shared_http_client()
+        task.clean_out_empty_logs()
+        return task.get_marc_shard_results()
+
+
+def get_001_statistics(part_001s: list, seen_001s: set) -> tuple:
+    """Counts the 001s of a part of a MARC file that will be given HRIDs
+
+    Args:
+        part_001s (list): The 001 of each record of the part, None if it has none
+        seen_001s (set): The 001s of the earlier parts. The 001s of the part are added
+
+    Returns:
+        tuple: The 001s of the earlier parts that recur in the part, the number of
+        duplicate 001s and the number of records without a 001
+    """
+    known_001s = set()
+    duplicates = without_001s = 0
+    new_001s: set = set()
+    for value in part_001s:
+        if value is None:
+            without_001s += 1
+        elif value in seen_001s:
+            known_001s.add(value)
+            duplicates += 1
+        elif value in new_001s:
+            duplicates += 1
+        else:
+            new_001s.add(value)
+    seen_001s.update(new_001s)
+    return known_001s, duplicates, without_001s
+
+
+def copy_shard_results(path, merged_file, dropped_ids: set, get_id) -> int:
+    """Appends the records of a result file of a part to the merged file, and removes it
+
+    Args:
+        path (str): The result file of the part
+        merged_file: The file to append the records to
+        dropped_ids (set): IDs of records to leave out
+        get_id: Function returning the ID of a record
+
+    Returns:
+        int: The number of records left out
+    """
+    dropped = 0
+    with open(path) as shard_file:
+        if not dropped_ids:
+            shutil.copyfileobj(shard_file, merged_file)
+        else:
+            for line in shard_file:
+                if get_id(json.loads(line)) in dropped_ids:
+                    dropped += 1
+                else:
+                    merged_file.write(line)
+    os.remove(path)
+    return dropped
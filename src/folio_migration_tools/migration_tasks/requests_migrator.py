@@ -3,7 +3,7 @@ import json
 import logging
 import sys
 import time
-from typing import Optional
+from typing import Dict, Optional
 
 import i18n
 from folio_uuid.folio_namespaces import FOLIONamespaces
@@ -15,9 +15,11 @@ from folio_migration_tools.helper import Helper
 from folio_migration_tools.library_configuration import (
     FileDefinition,
     LibraryConfiguration,
+    RateLimit,
 )
 from folio_migration_tools.migration_report import MigrationReport
 from folio_migration_tools.migration_tasks.migration_task_base import MigrationTaskBase
+from folio_migration_tools.rate_limiter import RateLimiters
 from folio_migration_tools.task_configuration import AbstractTaskConfiguration
 from folio_migration_tools.transaction_migration.legacy_request import LegacyRequest
 
@@ -30,6 +32,7 @@ class RequestsMigrator(MigrationTaskBase):
         starting_row: Optional[int] = 1
         item_files: Optional[list[FileDefinition]] = []
         patron_files: Optional[list[FileDefinition]] = []
+        rate_limits: Optional[Dict[str, RateLimit]] = {}
 
     @staticmethod
     def get_object_type() -> FOLIONamespaces:
@@ -45,10 +48,13 @@ class RequestsMigrator(MigrationTaskBase):
         self.migration_report = MigrationReport()
         self.valid_legacy_requests = []
         super().__init__(library_config, task_configuration, folio_client)
+        self.rate_limiters = RateLimiters(task_configuration.rate_limits)
         self.circulation_helper = CirculationHelper(
             self.folio_client,
             "",
             self.migration_report,
+            self.rate_limiters,
+            self.get_shared_http_client(),
         )
         try:
             logging.info("Attempting to retrieve tenant timezone configuration...")
@@ -158,7 +164,11 @@ class RequestsMigrator(MigrationTaskBase):
                 res, legacy_request = self.prepare_legacy_request(legacy_request)
                 if res:
                     if self.circulation_helper.create_request(
-                        self.folio_client, legacy_request, self.migration_report
+                        self.folio_client,
+                        legacy_request,
+                        self.migration_report,
+                        self.rate_limiters,
+                        self.circulation_helper.http_client,
                     ):
                         self.migration_report.add_general_statistics(
                             i18n.t("Successfully migrated requests")
@@ -191,6 +201,7 @@ class RequestsMigrator(MigrationTaskBase):
                 i18n.t("Requests migration report"), report_file, self.start_datetime
             )
         self.clean_out_empty_logs()
+        self.close_shared_http_client()
 
     def write_failed_request_to_file(self):
         csv_columns = [
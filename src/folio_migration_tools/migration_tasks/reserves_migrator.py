@@ -7,7 +7,6 @@ import traceback
 from typing import Dict
 from urllib.error import HTTPError
 
-import httpx
 import i18n
 from folio_uuid.folio_namespaces import FOLIONamespaces
 
@@ -104,6 +103,7 @@ class ReservesMigrator(MigrationTaskBase):
                 i18n.t("Reserves migration report"), report_file, self.start_datetime
             )
         self.clean_out_empty_logs()
+        self.close_shared_http_client()
 
     def write_failed_reserves_to_file(self):
         # POST /coursereserves/courselistings/40a085bd-b44b-42b3-b92f-61894a75e3ce/reserves
@@ -171,13 +171,13 @@ class ReservesMigrator(MigrationTaskBase):
         full_url = f"{self.folio_client.okapi_url}{url}"
         try:
             if verb == "PUT":
-                resp = httpx.put(
+                resp = self.get_shared_http_client().put(
                     full_url,
                     headers=self.folio_client.okapi_headers,
                     json=data_dict,
                 )
             elif verb == "POST":
-                resp = httpx.post(
+                resp = self.get_shared_http_client().post(
                     full_url,
                     headers=self.folio_client.okapi_headers,
                     json=data_dict,
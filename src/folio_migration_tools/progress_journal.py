@@ -0,0 +1,122 @@
+import json
+import logging
+import os
+from pathlib import Path
+
+
+class ProgressJournal:
+    """Durable record of which parts of the posted files FOLIO has acknowledged.
+
+    The journal is a JSON lines file. Each entry covers a byte range of one of the
+    files being posted, and is either pending (sent, but not answered yet, or answered
+    with failed records) or done (answered, and posted). Entries are flushed to disk as
+    they are written, so that a restarted task can skip the ranges that are done, and
+    knows which ranges were in flight or failed when the task was interrupted.
+
+    Ranges of a file are discarded if the file has changed since they were written.
+    """
+
+    def __init__(self, journal_path: Path):
+        self.journal_path = journal_path
+        self.fingerprints: dict = {}
+        self.done: dict = {}
+        self.pending: dict = {}
+        self.load()
+        self.journal_file = open(self.journal_path, "a")
+        if self.journal_file.tell() and not self.ends_with_newline():
+            self.journal_file.write("\n")
+
+    def load(self):
+        if not self.journal_path.is_file():
+            return
+        with open(self.journal_path) as journal_file:
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line may be cut short if the task was killed while writing it
+                    continue
+                file_name = entry["file"]
+                if entry["status"] == "started":
+                    self.fingerprints[file_name] = entry["fingerprint"]
+                    continue
+                ranges = self.done if entry["status"] == "done" else self.pending
+                ranges.setdefault(file_name, {})[entry["start"]] = entry
+        logging.info("Loaded progress journal from %s", self.journal_path)
+
+    def ends_with_newline(self) -> bool:
+        with open(self.journal_path, "rb") as journal_file:
+            journal_file.seek(-1, os.SEEK_END)
+            return journal_file.read(1) == b"\n"
+
+    def start_file(self, path: Path):
+        """Registers the file, and discards its ranges if the file has changed
+
+        Args:
+            path (Path): The file about to be posted
+        """
+        stat = os.stat(path)
+        fingerprint = [stat.st_size, stat.st_mtime_ns]
+        if self.fingerprints.get(path.name, fingerprint) != fingerprint:
+            logging.info("%s has changed since the last run. Posting it from the start", path)
+            self.done.pop(path.name, None)
+            self.pending.pop(path.name, None)
+        if any(self.done.get(path.name, {})):
+            logging.info(
+                "Resuming %s. %s ranges are already posted",
+                path,
+                len(self.done[path.name]),
+            )
+        self.fingerprints[path.name] = fingerprint
+        self.write({"file": path.name, "status": "started", "fingerprint": fingerprint})
+
+    def get_done_range(self, file_name: str, start: int):
+        """Returns the journal entry for a done range starting at this byte offset, if any"""
+        return self.done.get(file_name, {}).get(start)
+
+    def get_pending_range(self, file_name: str, start: int):
+        """Returns the entry for a range starting at this offset that was never answered"""
+        entry = self.pending.get(file_name, {}).get(start)
+        if entry and not self.get_done_range(file_name, start):
+            return entry
+        return None
+
+    def mark_pending(self, file_name: str, start: int, end: int, first_row: int, last_row: int):
+        self.write(
+            {
+                "file": file_name,
+                "status": "pending",
+                "start": start,
+                "end": end,
+                "first_row": first_row,
+                "last_row": last_row,
+            }
+        )
+
+    def mark_done(self, file_name: str, start: int, end: int, first_row: int, last_row: int):
+        self.write(
+            {
+                "file": file_name,
+                "status": "done",
+                "start": start,
+                "end": end,
+                "first_row": first_row,
+                "last_row": last_row,
+            }
+        )
+
+    def write(self, entry: dict):
+        self.journal_file.write(f"{json.dumps(entry)}\n")
+        self.journal_file.flush()
+        os.fsync(self.journal_file.fileno())
+
+    def close(self):
+        if not self.journal_file.closed:
+            self.journal_file.close()
+
+    def remove(self):
+        """Removes the journal once everything is posted, so the next run starts over"""
+        self.close()
+        if self.journal_path.is_file():
+            os.remove(self.journal_path)
+            logging.info("Removed progress journal %s", self.journal_path)
@@ -0,0 +1,169 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from folio_migration_tools.library_configuration import RateLimit
+
+# The FOLIO module behind the first segment of an API path
+FOLIO_MODULES = {
+    "instance-storage": "mod-inventory-storage",
+    "holdings-storage": "mod-inventory-storage",
+    "item-storage": "mod-inventory-storage",
+    "authority-storage": "mod-inventory-storage",
+    "preceding-succeeding-titles": "mod-inventory-storage",
+    "inventory-storage": "mod-inventory-storage",
+    "source-storage": "mod-source-record-storage",
+    "user-import": "mod-user-import",
+    "users": "mod-users",
+    "organizations-storage": "mod-organizations-storage",
+    "organizations": "mod-organizations",
+    "orders": "mod-orders",
+    "coursereserves": "mod-courses",
+    "notes": "mod-notes",
+    "accounts": "mod-feesfines",
+    "feefineactions": "mod-feesfines",
+    "circulation": "mod-circulation",
+}
+
+
+def get_module(url: str) -> str:
+    """Returns the FOLIO module serving the url or path, or an empty string if unknown"""
+    return FOLIO_MODULES.get(urlsplit(url).path.lstrip("/").split("/")[0], "")
+
+
+class TokenBucket:
+    """Hands out tokens at a steady rate, allowing bursts of up to capacity tokens.
+
+    A request for more tokens than there are puts the bucket in debt, and the caller
+    waits until the debt would have been paid off. This lets a request larger than the
+    capacity through, while keeping the average rate.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Optional[Callable[[float], None]] = None,
+    ):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1.0)
+        self.clock = clock
+        self.sleep = sleep or time.sleep
+        self.tokens = self.capacity
+        self.updated = self.clock()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Takes the tokens, and waits until the bucket can afford them
+
+        Returns:
+            float: The number of seconds waited
+        """
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            self.sleep(wait)
+        return wait
+
+
+class RateLimiter:
+    """Limits the requests sent to one FOLIO module.
+
+    Requests per second and records per second are limited with token buckets. The
+    number of requests in flight at the same time is capped with a semaphore. Limits
+    that are 0 are not applied.
+    """
+
+    def __init__(self, rate_limit: RateLimit, sleep: Optional[Callable[[float], None]] = None):
+        self.rate_limit = rate_limit
+        self.request_bucket = (
+            TokenBucket(rate_limit.requests_per_second, sleep=sleep)
+            if rate_limit.requests_per_second
+            else None
+        )
+        self.record_bucket = (
+            TokenBucket(rate_limit.records_per_second, sleep=sleep)
+            if rate_limit.records_per_second
+            else None
+        )
+        self.semaphore = (
+            threading.BoundedSemaphore(rate_limit.max_concurrent_requests)
+            if rate_limit.max_concurrent_requests
+            else None
+        )
+        self.seconds_waited = 0.0
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def limit(self, num_records: int = 1):
+        if self.semaphore:
+            self.semaphore.acquire()
+        try:
+            waited = 0.0
+            if self.request_bucket:
+                waited += self.request_bucket.acquire()
+            if self.record_bucket and num_records:
+                waited += self.record_bucket.acquire(num_records)
+            with self.lock:
+                self.seconds_waited += waited
+            yield
+        finally:
+            if self.semaphore:
+                self.semaphore.release()
+
+
+class RateLimiters:
+    """The rate limiters of a task, one per FOLIO module with a configured rate limit"""
+
+    def __init__(
+        self,
+        rate_limits: Optional[Dict[str, RateLimit]] = None,
+        sleep: Optional[Callable[[float], None]] = None,
+    ):
+        self.limiters = {
+            module: RateLimiter(rate_limit, sleep)
+            for module, rate_limit in (rate_limits or {}).items()
+        }
+        for module, rate_limit in (rate_limits or {}).items():
+            logging.info("Rate limit for %s: %s", module, rate_limit)
+            if module not in FOLIO_MODULES.values():
+                logging.warning(
+                    "No requests are sent to %s, so its rate limit is not applied. "
+                    "Rate limits can be set for %s",
+                    module,
+                    ", ".join(sorted(set(FOLIO_MODULES.values()))),
+                )
+
+    @contextmanager
+    def limit(self, url: str, num_records: int = 1):
+        """Waits until a request to the url is within the limits of its module
+
+        Args:
+            url (str): The url or path of the request
+            num_records (int): The number of records in the request
+        """
+        limiter = self.limiters.get(get_module(url))
+        if not limiter:
+            yield
+            return
+        with limiter.limit(num_records):
+            yield
+
+    def event_hook(self, request: httpx.Request):
+        """Request event hook for httpx clients, that waits for the rate limit of the
+        request's module before it is sent. The concurrency cap is not applied"""
+        with self.limit(str(request.url)):
+            pass
+
+    def get_seconds_waited(self) -> dict:
+        return {module: limiter.seconds_waited for module, limiter in self.limiters.items()}
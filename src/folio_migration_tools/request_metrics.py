@@ -0,0 +1,222 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlsplit
+
+# Upper bounds, in seconds, of the request latency histogram buckets
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0]
+
+
+class RequestMetrics:
+    """Collects latency and throughput metrics for the requests sent to FOLIO, per endpoint.
+
+    For every endpoint, the metrics hold a latency histogram, the number of requests,
+    retries, bytes sent and records posted, and the number of responses per status code
+    or connection error. The metrics are written to a JSON file as they come in, at
+    most once every write_interval_seconds, so that a long running task can be watched
+    while it runs.
+
+    The metrics are safe to update from several threads.
+    """
+
+    def __init__(self, metrics_path: Optional[Path] = None, write_interval_seconds: float = 30.0):
+        self.metrics_path = metrics_path
+        self.write_interval_seconds = write_interval_seconds
+        self.started = time.monotonic()
+        self.last_written = self.started
+        self.endpoints: dict = {}
+        self.lock = threading.Lock()
+
+    def record(
+        self,
+        endpoint: str,
+        seconds: float,
+        bytes_sent: int,
+        num_records: int = 0,
+        status_code: Optional[int] = None,
+        error: str = "",
+        retry: bool = False,
+        bytes_saved: int = 0,
+    ):
+        """Records one request
+
+        Args:
+            endpoint (str): The method and path of the request, like "POST /instance-storage"
+            seconds (float): The time it took to get the response, or the error
+            bytes_sent (int): The size of the request body
+            num_records (int): The number of records in the request. Counted as posted
+                if the response is successful
+            status_code (Optional[int]): The status code of the response, if any
+            error (str): The type of the error, if the request did not get a response
+            retry (bool): Whether the request is a retry of an earlier one
+            bytes_saved (int): The bytes saved by compressing the request body
+        """
+        with self.lock:
+            metrics = self.endpoints.setdefault(endpoint, new_endpoint_metrics())
+            metrics["requests"] += 1
+            metrics["retries"] += int(retry)
+            metrics["bytes_sent"] += bytes_sent
+            metrics["bytes_saved"] += bytes_saved
+            metrics["seconds"] += seconds
+            metrics["max_seconds"] = max(metrics["max_seconds"], seconds)
+            metrics["latency_histogram"][get_bucket(seconds)] += 1
+            outcome = str(status_code) if status_code is not None else error
+            metrics["responses"][outcome] = metrics["responses"].get(outcome, 0) + 1
+            if status_code is not None and 200 <= status_code < 300:
+                metrics["records"] += num_records
+            metrics["last_response"] = time.time()
+            metrics.setdefault("first_request", metrics["last_response"] - seconds)
+        self.write_if_due()
+
+    def merge(self, endpoints: dict):
+        """Adds the metrics of another RequestMetrics, like the one of a worker process
+
+        Args:
+            endpoints (dict): The endpoints of the other metrics' snapshot
+        """
+        with self.lock:
+            for endpoint, other in endpoints.items():
+                metrics = self.endpoints.setdefault(endpoint, new_endpoint_metrics())
+                for key in [
+                    "requests",
+                    "retries",
+                    "records",
+                    "bytes_sent",
+                    "bytes_saved",
+                    "seconds",
+                ]:
+                    metrics[key] += other[key]
+                metrics["max_seconds"] = max(metrics["max_seconds"], other["max_seconds"])
+                metrics["latency_histogram"] = [
+                    a + b for a, b in zip(metrics["latency_histogram"], other["latency_histogram"])
+                ]
+                for outcome, count in other["responses"].items():
+                    metrics["responses"][outcome] = metrics["responses"].get(outcome, 0) + count
+                metrics["first_request"] = min(
+                    metrics.get("first_request", other["first_request"]), other["first_request"]
+                )
+                metrics["last_response"] = max(
+                    metrics.get("last_response", other["last_response"]), other["last_response"]
+                )
+
+    def snapshot(self) -> dict:
+        """Returns the metrics, with the percentiles and rates worked out"""
+        with self.lock:
+            endpoints = json.loads(json.dumps(self.endpoints))
+        for metrics in endpoints.values():
+            active_seconds = metrics["last_response"] - metrics["first_request"]
+            metrics["mean_seconds"] = round(metrics["seconds"] / metrics["requests"], 3)
+            for percentile in [50, 95, 99]:
+                metrics[f"p{percentile}_seconds"] = get_percentile(
+                    metrics["latency_histogram"], percentile
+                )
+            metrics["records_per_second"] = (
+                round(metrics["records"] / active_seconds, 1) if active_seconds > 0 else 0.0
+            )
+        return {
+            "elapsed_seconds": round(time.monotonic() - self.started, 3),
+            "latency_buckets": [*LATENCY_BUCKETS, "+Inf"],
+            "endpoints": endpoints,
+        }
+
+    def write_if_due(self):
+        if time.monotonic() - self.last_written >= self.write_interval_seconds:
+            self.write()
+
+    def write(self):
+        """Writes the metrics to the metrics file, replacing the earlier version"""
+        if not self.metrics_path:
+            return
+        with self.lock:
+            self.last_written = time.monotonic()
+        temp_path = self.metrics_path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(temp_path, "w") as metrics_file:
+            json.dump(self.snapshot(), metrics_file, indent=4)
+        os.replace(temp_path, self.metrics_path)
+
+    def add_to_report(self, migration_report, blurb_id: str = "RequestMetrics"):
+        """Summarises the metrics of each endpoint in a section of the migration report"""
+        for endpoint, metrics in self.snapshot()["endpoints"].items():
+            migration_report.set(blurb_id, f"{endpoint}: requests", metrics["requests"])
+            migration_report.set(blurb_id, f"{endpoint}: retries", metrics["retries"])
+            migration_report.set(blurb_id, f"{endpoint}: bytes sent", metrics["bytes_sent"])
+            if metrics["bytes_saved"]:
+                migration_report.set(
+                    blurb_id, f"{endpoint}: bytes saved by compression", metrics["bytes_saved"]
+                )
+            migration_report.set(blurb_id, f"{endpoint}: records posted", metrics["records"])
+            migration_report.set(
+                blurb_id, f"{endpoint}: records per second", metrics["records_per_second"]
+            )
+            for percentile in [50, 95]:
+                migration_report.set(
+                    blurb_id,
+                    f"{endpoint}: p{percentile} latency (s)",
+                    metrics[f"p{percentile}_seconds"],
+                )
+            for outcome, count in metrics["responses"].items():
+                migration_report.set(blurb_id, f"{endpoint}: {outcome}", count)
+            logging.info(
+                "%s: %s requests, %s records/s, p50 %ss, p95 %ss",
+                endpoint,
+                metrics["requests"],
+                metrics["records_per_second"],
+                metrics["p50_seconds"],
+                metrics["p95_seconds"],
+            )
+
+
+def get_endpoint(method: str, url: str) -> str:
+    """Returns the method and path of the url, with any UUIDs in the path replaced by {id}
+
+    This keeps requests like POST /coursereserves/courselistings/<uuid>/instructors
+    together as one endpoint.
+    """
+    path = re.sub(
+        r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}",
+        "{id}",
+        urlsplit(url).path,
+    )
+    return f"{method} {path}"
+
+
+def new_endpoint_metrics() -> dict:
+    return {
+        "requests": 0,
+        "retries": 0,
+        "records": 0,
+        "bytes_sent": 0,
+        "bytes_saved": 0,
+        "seconds": 0.0,
+        "max_seconds": 0.0,
+        "responses": {},
+        "latency_histogram": [0] * (len(LATENCY_BUCKETS) + 1),
+    }
+
+
+def get_bucket(seconds: float) -> int:
+    return next(
+        (index for index, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound),
+        len(LATENCY_BUCKETS),
+    )
+
+
+def get_percentile(histogram: list, percentile: int) -> float:
+    """Returns the upper bound of the bucket the percentile falls in.
+
+    Latencies in the last, open ended, bucket are reported as the largest bound.
+    """
+    total = sum(histogram)
+    if not total:
+        return 0.0
+    seen = 0
+    for index, count in enumerate(histogram):
+        seen += count
+        if seen * 100 >= total * percentile:
+            return LATENCY_BUCKETS[min(index, len(LATENCY_BUCKETS) - 1)]
+    return LATENCY_BUCKETS[-1]
@@ -0,0 +1,128 @@
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional
+
+import httpx
+
+# Transport errors raised before the request was sent, that are safe to retry for any request
+UNSENT_REQUEST_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class RetryPolicy:
+    """Retries requests that fail for transient reasons.
+
+    Responses with one of the retry status codes, and connection errors, are retried
+    with exponential backoff and jitter. Requests that are not idempotent are only
+    retried after a connection error if the request was never sent, so that FOLIO does
+    not get to create the same records twice. A Retry-After header from the server takes
+    precedence over the backoff. Retries stop after max_retries attempts, or when the
+    next wait would take the total time spent on the request past max_total_seconds.
+
+    The policy is safe to share between threads, and counts the retries per key.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 5,
+        backoff_seconds: float = 2.0,
+        max_backoff_seconds: float = 60.0,
+        max_total_seconds: float = 600.0,
+        retry_status_codes: Optional[list] = None,
+        sleep: Optional[Callable[[float], None]] = None,
+    ):
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.max_total_seconds = max_total_seconds
+        self.retry_status_codes = set(retry_status_codes or [429, 500, 502, 503, 504])
+        self.sleep = sleep or time.sleep
+        self.retry_counts: dict = {}
+        self.lock = threading.Lock()
+
+    def send(
+        self,
+        send_request: Callable[[], httpx.Response],
+        retry_key: str,
+        idempotent: bool = True,
+    ) -> httpx.Response:
+        """Sends the request, and retries it as long as the policy allows
+
+        Args:
+            send_request (Callable[[], httpx.Response]): Sends the request
+            retry_key (str): What to count the retries as, typically the object type
+            idempotent (bool): Whether sending the request twice has the same effect as
+                sending it once. Defaults to True
+
+        Raises:
+            httpx.TransportError: If the last attempt failed with a connection error
+
+        Returns:
+            httpx.Response: The first response that is not retried, or the last one
+        """
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            response = None
+            try:
+                response = send_request()
+                if response.status_code not in self.retry_status_codes:
+                    return response
+                reason = f"HTTP {response.status_code}"
+            except httpx.TransportError as transport_error:
+                if not idempotent and not isinstance(transport_error, UNSENT_REQUEST_ERRORS):
+                    raise
+                error = transport_error
+                reason = type(transport_error).__name__
+            delay = self.get_delay(attempt, response)
+            if (
+                attempt >= self.max_retries
+                or time.monotonic() - started + delay > self.max_total_seconds
+            ):
+                if response is None:
+                    raise error
+                return response
+            attempt += 1
+            self.count_retry(f"{retry_key}: {reason}")
+            logging.info(
+                "%s request failed (%s). Retrying in %.1fs. Attempt %s of %s",
+                retry_key,
+                reason,
+                delay,
+                attempt,
+                self.max_retries,
+            )
+            self.sleep(delay)
+
+    def get_delay(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        retry_after = get_retry_after(response)
+        if retry_after is not None:
+            return retry_after
+        backoff = min(self.max_backoff_seconds, self.backoff_seconds * 2**attempt)
+        return backoff / 2 + random.uniform(0, backoff / 2)  # noqa: S311
+
+    def count_retry(self, key: str):
+        with self.lock:
+            self.retry_counts[key] = self.retry_counts.get(key, 0) + 1
+
+
+def get_retry_after(response: Optional[httpx.Response]) -> Optional[float]:
+    """Returns the number of seconds the Retry-After header asks for, if any"""
+    if response is None or not response.headers.get("retry-after"):
+        return None
+    retry_after = response.headers["retry-after"].strip()
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        # Dates with a -0000 offset are parsed without a time zone
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
@@ -0,0 +1,539 @@
+"""A local stand-in for FOLIO, for measuring the posting and circulation tasks offline.
+
+Run it with ``python -m folio_migration_tools.test_infrastructure.folio_stand_in`` and
+point the okapi_url of the library configuration to it, or start it from a test.
+"""
+import argparse
+import gzip
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+# The collections of the stand-in, and the key holding their records in responses
+COLLECTIONS = {
+    "/instance-storage/instances": "instances",
+    "/holdings-storage/holdings": "holdingsRecords",
+    "/item-storage/items": "items",
+    "/authority-storage/authorities": "authorities",
+    "/source-storage/records": "records",
+    "/source-storage/snapshots": "snapshots",
+    "/users": "users",
+    "/loan-storage/loans": "loans",
+    "/circulation/loans": "loans",
+    "/circulation/requests": "requests",
+    "/organizations/organizations": "organizations",
+    "/orders/composite-orders": "purchaseOrders",
+    "/configurations/entries": "configs",
+    "/smtp-configuration": "smtpConfigurations",
+}
+
+# Collections whose records are identified by another property than id
+ID_KEYS = {"/source-storage/snapshots": "jobExecutionId"}
+
+# Collections that are views of another collection
+SHARED_COLLECTIONS = {"/circulation/loans": "/loan-storage/loans"}
+
+# The batch endpoints, and the collections they store their records in
+BATCH_ENDPOINTS = {
+    "/instance-storage/batch/synchronous": "/instance-storage/instances",
+    "/instance-storage/batch/synchronous-unsafe": "/instance-storage/instances",
+    "/holdings-storage/batch/synchronous": "/holdings-storage/holdings",
+    "/holdings-storage/batch/synchronous-unsafe": "/holdings-storage/holdings",
+    "/item-storage/batch/synchronous": "/item-storage/items",
+    "/item-storage/batch/synchronous-unsafe": "/item-storage/items",
+    "/source-storage/batch/records": "/source-storage/records",
+    "/user-import": "/users",
+}
+
+CQL_CLAUSE = re.compile(r'^([\w.]+)\s*(==|=|<>|>=|<=|>|<)\s*(?:"((?:[^"\\]|\\.)*)"|(\S+))$')
+
+
+class StandInResponse(Exception):
+    """Ends the handling of a request with this response"""
+
+    def __init__(self, status_code: int, body=None):
+        super().__init__(status_code)
+        self.status_code = status_code
+        self.body = body
+
+
+class FolioStandIn:
+    """An in-memory HTTP server answering the FOLIO APIs the posting tasks use.
+
+    It stores what is posted to the batch storage endpoints, /user-import and the
+    source-storage snapshots and records, checks out items by barcode, creates requests,
+    and answers simple CQL queries on its collections. Latency, server errors, HTTP 413
+    and HTTP 422 can be injected, so that throughput and failure handling can be
+    measured reproducibly. Random errors are drawn from a seeded generator, and whether
+    a record is rejected only depends on its id.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        latency_per_record: float = 0.0,
+        error_rate: float = 0.0,
+        error_status_code: int = 503,
+        max_request_bytes: int = 0,
+        invalid_record_rate: float = 0.0,
+        invalid_ids: Iterable[str] = (),
+        seed: int = 0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        """Sets up the stand-in. Call start() to start serving
+
+        Args:
+            latency (float): Seconds to wait before answering each request
+            latency_per_record (float): Seconds to wait per record in a batch
+            error_rate (float): The share of requests answered with error_status_code
+            error_status_code (int): The status code of the injected errors
+            max_request_bytes (int): Larger requests are answered with HTTP 413. 0 means
+                no limit
+            invalid_record_rate (float): The share of record ids answered with HTTP 422
+            invalid_ids (Iterable[str]): Ids of records to answer with HTTP 422
+            seed (int): The seed of the random errors
+            host (str): The host to listen on
+            port (int): The port to listen on. 0 picks a free port
+        """
+        self.latency = latency
+        self.latency_per_record = latency_per_record
+        self.error_rate = error_rate
+        self.error_status_code = error_status_code
+        self.max_request_bytes = max_request_bytes
+        self.invalid_record_rate = invalid_record_rate
+        self.invalid_ids = set(invalid_ids)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.collections: Dict[str, Dict[str, dict]] = {path: {} for path in COLLECTIONS}
+        self.request_counts: Dict[str, int] = {}
+        self.server = ThreadingHTTPServer((host, port), FolioStandInHandler)
+        self.server.daemon_threads = True
+        self.server.stand_in = self
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        logging.info("FOLIO stand-in listening on %s", self.url)
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread:
+            self.thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def add_records(self, path: str, records: Iterable[dict]):
+        """Stores records in a collection, for example the items to check out"""
+        with self.lock:
+            for record in records:
+                self.store(path, dict(record))
+
+    def get_records(self, path: str) -> List[dict]:
+        with self.lock:
+            return list(self.get_collection(path).values())
+
+    def get_collection(self, path: str) -> Dict[str, dict]:
+        return self.collections[SHARED_COLLECTIONS.get(path, path)]
+
+    def store(self, path: str, record: dict) -> dict:
+        id_key = ID_KEYS.get(path, "id")
+        record.setdefault(id_key, str(uuid.uuid4()))
+        stored = self.get_collection(path).get(record[id_key])
+        record["_version"] = (stored or {}).get("_version", 0) + 1
+        self.get_collection(path)[record[id_key]] = record
+        return record
+
+    def is_invalid(self, record: dict) -> bool:
+        record_id = str(record.get("id") or record.get("username", ""))
+        if record_id in self.invalid_ids:
+            return True
+        # Hashing the id keeps the rejected records the same from run to run
+        return zlib.crc32(record_id.encode("utf-8")) / 2**32 < self.invalid_record_rate
+
+    def handle(self, method: str, url: str, body: bytes) -> Tuple[int, object]:
+        """Answers a request to the stand-in
+
+        Args:
+            method (str): The HTTP method
+            url (str): The path and query string of the request
+            body (bytes): The uncompressed request body
+
+        Returns:
+            Tuple[int, object]: The status code, and the JSON body of the response
+        """
+        split_url = urlsplit(url)
+        path = split_url.path.rstrip("/")
+        params = {key: values[0] for key, values in parse_qs(split_url.query).items()}
+        if path.startswith("/authn/"):
+            return self.handle_login(path)
+        with self.lock:
+            key = f"{method} {get_endpoint_template(path)}"
+            self.request_counts[key] = self.request_counts.get(key, 0) + 1
+            injected_error = self.random.random() < self.error_rate
+        try:
+            if self.max_request_bytes and len(body) > self.max_request_bytes:
+                raise StandInResponse(413, f"Request of {len(body)} bytes is too large")
+            content = json.loads(body) if body else None
+            time.sleep(self.latency + self.latency_per_record * count_records(content))
+            if injected_error:
+                raise StandInResponse(self.error_status_code, "Injected error")
+            if path in BATCH_ENDPOINTS and method == "POST":
+                return self.post_batch(path, content, params)
+            if path == "/circulation/check-out-by-barcode" and method == "POST":
+                return self.check_out_by_barcode(content)
+            collection, record_id = split_path(path)
+            if not collection:
+                raise StandInResponse(404, f"No such endpoint: {path}")
+            if method == "GET" and record_id:
+                return self.get_record(collection, record_id)
+            if method == "GET":
+                return self.get_records_by_query(collection, params)
+            if method == "POST" and not record_id:
+                return self.post_record(collection, content)
+            if method == "PUT" and record_id:
+                return self.put_record(collection, record_id, content)
+            if method == "DELETE" and record_id:
+                with self.lock:
+                    self.get_collection(collection).pop(record_id, None)
+                return 204, None
+            raise StandInResponse(405, f"{method} is not supported for {path}")
+        except StandInResponse as response:
+            return response.status_code, response.body
+        except ValueError as error:
+            return 400, str(error)
+
+    def handle_login(self, path: str) -> Tuple[int, object]:
+        if path == "/authn/logout":
+            return 204, None
+        expiration = datetime.now(timezone.utc) + timedelta(days=1)
+        return 201, {
+            "accessTokenExpiration": expiration.isoformat(),
+            "refreshTokenExpiration": expiration.isoformat(),
+        }
+
+    def post_batch(self, path: str, content: dict, params: dict) -> Tuple[int, object]:
+        collection = BATCH_ENDPOINTS[path]
+        records = content[COLLECTIONS[collection]]
+        if path == "/user-import":
+            return self.import_users(records)
+        invalid = [record for record in records if self.is_invalid(record)]
+        if invalid:
+            raise StandInResponse(
+                422,
+                {
+                    "errors": [
+                        {"message": f"Record {record.get('id')} is invalid"} for record in invalid
+                    ]
+                },
+            )
+        with self.lock:
+            existing = [
+                record["id"]
+                for record in records
+                if record.get("id") in self.get_collection(collection)
+            ]
+            if existing and params.get("upsert") != "true":
+                raise StandInResponse(
+                    422, {"errors": [{"message": f"id value already exists: {existing[0]}"}]}
+                )
+            for record in records:
+                self.store(collection, dict(record))
+        if collection == "/source-storage/records":
+            return 201, {"records": records, "errorMessages": [], "totalRecords": len(records)}
+        return 201, None
+
+    def import_users(self, users: List[dict]) -> Tuple[int, object]:
+        """Imports users like mod-user-import, matching existing users on username"""
+        report = {"createdRecords": 0, "updatedRecords": 0, "failedRecords": 0, "failedUsers": []}
+        with self.lock:
+            ids_by_username = {
+                user.get("username"): user["id"] for user in self.collections["/users"].values()
+            }
+            for user in users:
+                if self.is_invalid(user):
+                    report["failedRecords"] += 1
+                    report["failedUsers"].append(
+                        {
+                            "username": user.get("username", ""),
+                            "externalSystemId": user.get("externalSystemId", ""),
+                            "errorMessage": "Invalid user",
+                        }
+                    )
+                    continue
+                user = dict(user)
+                if user.get("username") in ids_by_username:
+                    user["id"] = ids_by_username[user["username"]]
+                    report["updatedRecords"] += 1
+                else:
+                    report["createdRecords"] += 1
+                ids_by_username[user.get("username")] = self.store("/users", user)["id"]
+        report["totalRecords"] = len(users)
+        report["message"] = "Users were imported successfully."
+        return 200, report
+
+    def check_out_by_barcode(self, content: dict) -> Tuple[int, object]:
+        """Checks out an item like mod-circulation, with the messages it answers with"""
+        with self.lock:
+            item = find_record(self.collections["/item-storage/items"], content["itemBarcode"])
+            user = find_record(self.collections["/users"], content["userBarcode"])
+            if not item:
+                raise_validation_error(f"No item with barcode {content['itemBarcode']} exists")
+            if not user:
+                raise_validation_error(
+                    f"Could not find user with matching barcode {content['userBarcode']}"
+                )
+            if any(
+                loan["itemId"] == item["id"] and loan["status"]["name"] == "Open"
+                for loan in self.collections["/loan-storage/loans"].values()
+            ):
+                raise_validation_error("Cannot check out item that already has an open loan")
+            due_date = (
+                content.get("overrideBlocks", {}).get("itemNotLoanableBlock", {}).get("dueDate")
+            )
+            loan = self.store(
+                "/loan-storage/loans",
+                {
+                    "itemId": item["id"],
+                    "userId": user["id"],
+                    "loanDate": content["loanDate"],
+                    "dueDate": due_date or content["loanDate"],
+                    "action": "checkedout",
+                    "status": {"name": "Open"},
+                    "checkoutServicePointId": content.get("servicePointId"),
+                },
+            )
+            item["status"] = {"name": "Checked out"}
+        return 201, loan
+
+    def get_record(self, collection: str, record_id: str) -> Tuple[int, object]:
+        with self.lock:
+            record = self.get_collection(collection).get(record_id)
+        if not record:
+            raise StandInResponse(404, f"{record_id} not found")
+        return 200, record
+
+    def get_records_by_query(self, collection: str, params: dict) -> Tuple[int, object]:
+        matches, sort_key = parse_cql(params.get("query", ""))
+        with self.lock:
+            records = [r for r in self.get_collection(collection).values() if matches(r)]
+        if sort_key:
+            records.sort(key=lambda record: str(get_value(record, sort_key)))
+        offset = int(params.get("offset", 0))
+        limit = int(params.get("limit", 10))
+        return 200, {
+            COLLECTIONS[collection]: records[offset : offset + limit],
+            "totalRecords": len(records),
+        }
+
+    def post_record(self, collection: str, content: dict) -> Tuple[int, object]:
+        if self.is_invalid(content):
+            raise_validation_error(f"Record {content.get('id')} is invalid")
+        with self.lock:
+            record_id = content.get(ID_KEYS.get(collection, "id"))
+            if record_id in self.get_collection(collection):
+                raise_validation_error(f"id value already exists: {record_id}")
+            record = self.store(collection, dict(content))
+        return 201, record
+
+    def put_record(self, collection: str, record_id: str, content: dict) -> Tuple[int, object]:
+        with self.lock:
+            if record_id not in self.get_collection(collection):
+                raise StandInResponse(404, f"{record_id} not found")
+            self.store(collection, {**content, ID_KEYS.get(collection, "id"): record_id})
+        return 204, None
+
+
+class FolioStandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.answer("GET")
+
+    def do_POST(self):
+        self.answer("POST")
+
+    def do_PUT(self):
+        self.answer("PUT")
+
+    def do_DELETE(self):
+        self.answer("DELETE")
+
+    def answer(self, method: str):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        status_code, response_body = self.server.stand_in.handle(method, self.path, body)
+        if response_body is None:
+            content = b""
+        elif isinstance(response_body, str):
+            content = response_body.encode("utf-8")
+        else:
+            content = json.dumps(response_body).encode("utf-8")
+        self.send_response(status_code)
+        if self.path.startswith("/authn/login"):
+            self.send_header("x-okapi-token", "stand-in-token")
+            self.send_header("Set-Cookie", "folioAccessToken=stand-in-token; Path=/")
+        if content:
+            content_type = "text/plain" if isinstance(response_body, str) else "application/json"
+            self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        logging.debug("FOLIO stand-in: " + format, *args)
+
+
+def split_path(path: str) -> Tuple[Optional[str], Optional[str]]:
+    """Splits a path into its collection and record id, if it is in a collection"""
+    if path in COLLECTIONS:
+        return path, None
+    collection, _, record_id = path.rpartition("/")
+    if collection in COLLECTIONS:
+        return collection, record_id
+    return None, None
+
+
+def get_endpoint_template(path: str) -> str:
+    """The path, with any record id replaced by {id}, for counting requests"""
+    collection, record_id = split_path(path)
+    return f"{collection}/{{id}}" if record_id else path
+
+
+def count_records(content) -> int:
+    if isinstance(content, dict):
+        return next((len(value) for value in content.values() if isinstance(value, list)), 1)
+    return 1 if content else 0
+
+
+def find_record(collection: Dict[str, dict], barcode: str) -> Optional[dict]:
+    return next((r for r in collection.values() if r.get("barcode") == barcode), None)
+
+
+def raise_validation_error(message: str):
+    raise StandInResponse(422, {"errors": [{"message": message, "parameters": []}]})
+
+
+def get_value(record: dict, field: str):
+    value = record
+    for key in field.split("."):
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+def parse_cql(query: str) -> Tuple[Callable[[dict], bool], Optional[str]]:
+    """Parses the CQL the tasks use into a record filter and a sort key.
+
+    Supports clauses like field==value, field==(a or b), id>"x" and cql.allRecords=1,
+    joined by and, with an optional sortBy at the end.
+
+    Args:
+        query (str): The CQL query
+
+    Raises:
+        ValueError: If the query uses CQL that is not supported
+
+    Returns:
+        Tuple[Callable[[dict], bool], Optional[str]]: The filter and the sort key
+    """
+    query, _, sort_key = query.partition(" sortBy ")
+    query = query.strip()
+    while query.startswith("(") and query.endswith(")") and " and " in query[1:-1]:
+        query = query[1:-1].strip()
+    clauses = []
+    for clause in re.split(r"\s+and\s+", query) if query else []:
+        clause = clause.strip()
+        while clause.startswith("(") and clause.endswith(")") and "==(" not in clause:
+            clause = clause[1:-1].strip()
+        if clause == "cql.allRecords=1":
+            continue
+        or_match = re.match(r"^([\w.]+)==\((.*)\)$", clause)
+        if or_match:
+            values = {value.strip().strip('"') for value in or_match.group(2).split(" or ")}
+            clauses.append(make_clause(or_match.group(1), "in", values))
+            continue
+        match = CQL_CLAUSE.match(clause)
+        if not match:
+            raise ValueError(f"Unsupported CQL: {clause}")
+        field, operator, quoted, unquoted = match.groups()
+        clauses.append(make_clause(field, operator, quoted if quoted is not None else unquoted))
+    return (lambda record: all(clause(record) for clause in clauses)), sort_key.strip() or None
+
+
+def make_clause(field: str, operator: str, expected) -> Callable[[dict], bool]:
+    comparisons = {
+        "in": lambda value: value in expected,
+        "==": lambda value: value == expected,
+        "=": lambda value: value == expected,
+        "<>": lambda value: value != expected,
+        ">=": lambda value: value >= expected,
+        "<=": lambda value: value <= expected,
+        ">": lambda value: value > expected,
+        "<": lambda value: value < expected,
+    }
+    compare = comparisons[operator]
+
+    def clause(record: dict) -> bool:
+        value = get_value(record, field)
+        if isinstance(value, bool):
+            value = str(value).lower()
+        return value is not None and compare(str(value))
+
+    return clause
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs a local stand-in for FOLIO")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9130)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--latency-per-record", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status-code", type=int, default=503)
+    parser.add_argument("--max-request-bytes", type=int, default=0)
+    parser.add_argument("--invalid-record-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    stand_in = FolioStandIn(
+        latency=args.latency,
+        latency_per_record=args.latency_per_record,
+        error_rate=args.error_rate,
+        error_status_code=args.error_status_code,
+        max_request_bytes=args.max_request_bytes,
+        invalid_record_rate=args.invalid_record_rate,
+        seed=args.seed,
+        host=args.host,
+        port=args.port,
+    )
+    logging.info("FOLIO stand-in listening on %s", stand_in.url)
+    try:
+        stand_in.server.serve_forever()
+    except KeyboardInterrupt:
+        stand_in.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
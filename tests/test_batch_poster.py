@@ -1,8 +1,19 @@
+import gzip
+import json
+import time
 from unittest.mock import Mock
 
+import httpx
+import pytest
 from folio_uuid.folio_namespaces import FOLIONamespaces
+from jsonschema import Draft4Validator
 
-from folio_migration_tools.migration_tasks import batch_poster
+from folio_migration_tools.gateway_pool import GatewayPool
+from folio_migration_tools.library_configuration import (
+    FileDefinition,
+    LibraryConfiguration,
+)
+from folio_migration_tools.migration_tasks import batch_poster, migration_task_base
 from folio_migration_tools.migration_tasks.batch_poster import BatchPoster
 
 
@@ -67,3 +78,936 @@ def test_get_extradata_endpoint_from_task_configuration():
     )
 
     assert endpoint == "otherdata-endpoint/endpoint"
+
+
+def respond(status_code, body=None):
+    """Builds a streamed response, so that httpx sets response.elapsed"""
+    content = json.dumps(body).encode("utf-8") if body is not None else b""
+    return httpx.Response(status_code, stream=httpx.ByteStream(content))
+
+
+def make_batch_poster(tmp_path, object_type, rows, handler, **task_config):
+    """Builds a BatchPoster over a temporary migration folder, posting through handler"""
+    (tmp_path / "mapping_files").mkdir(exist_ok=True)
+    (tmp_path / ".gitignore").touch()
+    iteration_folder = tmp_path / "iterations" / "test"
+    for folder in ["source_data", "results", "reports"]:
+        (iteration_folder / folder).mkdir(parents=True, exist_ok=True)
+    results_file = iteration_folder / "results" / "records.json"
+    if not results_file.exists():
+        results_file.write_text("".join(f"{json.dumps(row)}\n" for row in rows))
+    library_config = LibraryConfiguration(
+        okapi_url="http://okapi",
+        tenant_id="tenant",
+        okapi_username="user",
+        okapi_password="password",
+        base_folder=tmp_path,
+        library_name="Test library",
+        log_level_debug=False,
+        folio_release="ramsons",
+        iteration_identifier="test",
+    )
+    task_config = BatchPoster.TaskConfiguration(
+        name="test_post",
+        migration_task_type="BatchPoster",
+        object_type=object_type,
+        files=[FileDefinition(file_name="records.json")],
+        **task_config,
+    )
+    return BatchPoster(task_config, library_config, make_folio_client(handler), use_logging=False)
+
+
+def make_folio_client(handler):
+    folio_client = Mock()
+    folio_client.okapi_url = "http://okapi"
+    folio_client.okapi_headers = {"x-okapi-token": "token"}
+    folio_client.get_folio_http_client.side_effect = lambda: httpx.Client(
+        transport=httpx.MockTransport(handler)
+    )
+    return folio_client
+
+
+def test_concurrent_batches_handle_out_of_order_failures(tmp_path):
+    records = [{"id": str(i)} for i in range(20)]
+
+    def handler(request: httpx.Request):
+        batch = json.loads(request.content)["instances"]
+        # Let the first batches answer last, so responses arrive out of order
+        time.sleep(0.05 * (5 - int(batch[0]["id"]) // 4))
+        if any(r["id"] == "9" for r in batch):
+            return respond(422, {"errors": [{"message": "Bad record"}]})
+        return respond(201)
+
+    poster = make_batch_poster(
+        tmp_path,
+        "Instances",
+        records,
+        handler,
+        batch_size=4,
+        concurrent_batches=3,
+        rerun_failed_records=False,
+    )
+    poster.do_work()
+
+    assert poster.processed == 20
+    assert poster.num_failures == 4
+    assert poster.failed_batches == 1
+    assert not poster.in_flight
+    with open(poster.folder_structure.failed_recs_path) as failed_file:
+        failed_ids = [json.loads(line)["id"] for line in failed_file]
+    assert failed_ids == ["8", "9", "10", "11"]
+
+
+def test_concurrent_batches_fail_the_batch_whose_request_raised(tmp_path):
+    records = [{"id": str(i)} for i in range(20)]
+
+    def handler(request: httpx.Request):
+        batch = json.loads(request.content)["instances"]
+        if any(r["id"] == "9" for r in batch):
+            raise httpx.ReadTimeout("Timed out", request=request)
+        return respond(201)
+
+    poster = make_batch_poster(
+        tmp_path,
+        "Instances",
+        records,
+        handler,
+        batch_size=4,
+        concurrent_batches=3,
+        rerun_failed_records=False,
+        max_retries=0,
+    )
+    poster.do_work()
+
+    assert poster.num_failures == 4
+    assert poster.failed_batches == 1
+    with open(poster.folder_structure.failed_recs_path) as failed_file:
+        failed_ids = [json.loads(line)["id"] for line in failed_file]
+    assert failed_ids == ["8", "9", "10", "11"]
+
+
+def test_adaptive_batch_size_grows_within_budget():
+    controller = batch_poster.AdaptiveBatchSize(100, 10, 1000, 5.0, 5_000_000)
+    controller.register_success(100, 1.0, 100_000)
+    assert controller.batch_size == 125
+    for _ in range(20):
+        size = controller.batch_size
+        controller.register_success(size, size * 0.01, size * 1000)
+    assert controller.batch_size == 500
+
+
+def test_adaptive_batch_size_respects_byte_budget():
+    controller = batch_poster.AdaptiveBatchSize(100, 10, 1000, 5.0, 1_000_000)
+    controller.register_success(100, 0.1, 2_000_000)
+    assert controller.batch_size == 50
+
+
+def test_adaptive_batch_size_halves_on_overload():
+    controller = batch_poster.AdaptiveBatchSize(100, 30, 1000, 5.0, 1_000_000)
+    controller.register_overload(100)
+    assert controller.batch_size == 50
+    # A stale, larger batch still in flight does not shrink the batch size further
+    controller.register_overload(100)
+    assert controller.batch_size == 50
+    controller.register_overload(50)
+    assert controller.batch_size == 30
+
+
+def test_adaptive_batch_size_reposts_too_large_requests(tmp_path):
+    records = [{"id": str(i)} for i in range(8)]
+    posted_sizes = []
+
+    def handler(request: httpx.Request):
+        batch = json.loads(request.content)["instances"]
+        if len(batch) > 2:
+            return respond(413)
+        posted_sizes.append(len(batch))
+        return respond(201)
+
+    poster = make_batch_poster(
+        tmp_path,
+        "Instances",
+        records,
+        handler,
+        batch_size=8,
+        adaptive_batch_size=True,
+        rerun_failed_records=False,
+    )
+    poster.do_work()
+
+    assert poster.num_failures == 0
+    assert posted_sizes == [2, 2, 2, 2]
+    assert poster.migration_report.report["BatchSizes"][8] == 1
+    assert poster.migration_report.report["BatchSizes"][4] == 2
+    assert poster.migration_report.report["BatchSizes"][2] == 4
+
+
+def test_find_records_in_error():
+    batch = [{"id": "a1", "hrid": "in001"}, {"id": "b2", "hrid": "in002"}]
+    error = "lower(f_unaccent(jsonb ->> 'hrid'::text)) value already exists in table: in002"
+    assert batch_poster.find_records_in_error(batch, error) == [batch[1]]
+    assert batch_poster.find_records_in_error(batch, "Something went wrong") == []
+
+
+def test_find_records_in_error_matches_whole_values():
+    batch = [
+        {"id": "a1", "hrid": "12"},
+        {"id": "b2", "hrid": "123"},
+        {"id": "c3", "hrid": "1234"},
+    ]
+    error = 'HRID value already exists: "123". Row 12.5 of 1234-5'
+    assert batch_poster.find_records_in_error(batch, error) == [batch[1]]
+    # The id is preferred over the hrid
+    assert batch_poster.find_records_in_error(batch, "c3 conflicts with 123") == [batch[2]]
+
+
+def test_bisect_failed_batches_posts_the_good_records(tmp_path):
+    records = [{"id": f"id{i:02}"} for i in range(16)]
+    bad_ids = {"id03", "id12"}
+    posted_ids = []
+
+    def handler(request: httpx.Request):
+        batch = json.loads(request.content)["instances"]
+        if any(r["id"] in bad_ids for r in batch):
+            return respond(422, {"errors": [{"message": "Invalid record"}]})
+        posted_ids.extend(r["id"] for r in batch)
+        return respond(201)
+
+    poster = make_batch_poster(
+        tmp_path,
+        "Instances",
+        records,
+        handler,
+        batch_size=8,
+        bisect_failed_batches=True,
+        rerun_failed_records=False,
+    )
+    poster.do_work()
+
+    assert poster.num_failures == 2
+    assert sorted(posted_ids) == sorted(r["id"] for r in records if r["id"] not in bad_ids)
+    with open(poster.folder_structure.failed_recs_path) as failed_file:
+        assert {json.loads(line)["id"] for line in failed_file} == bad_ids
+
+
+def test_bisect_failed_batches_uses_the_error_message(tmp_path):
+    records = [{"id": f"id{i:02}"} for i in range(8)]
+    requests = []
+
+    def handler(request: httpx.Request):
+        batch = json.loads(request.content)["instances"]
+        requests.append(len(batch))
+        if any(r["id"] == "id05" for r in batch):
+            return respond(422, {"errors": [{"message": "id value already exists: id05"}]})
+        return respond(201)
+
+    poster = make_batch_poster(
+        tmp_path,
+        "Instances",
+        records,
+        handler,
+        batch_size=8,
+        bisect_failed_batches=True,
+        rerun_failed_records=False,
+    )
+    poster.do_work()
+
+    assert requests == [8, 7]
+    assert poster.num_failures == 1
+
+
+def test_bisect_failed_batches_fails_server_errors_whole(tmp_path):
+    records = [{"id": f"id{i:02}"} for i in range(8)]
+    requests = []
+
+    def handler(request: httpx.Request):
+        requests.append(len(json.loads(request.content)["instances"]))
+        return respond(500)
+
+    poster = make_batch_poster(
+        tmp_path,
+        "Instances",
+        records,
+        handler,
+        batch_size=8,
+        bisect_failed_batches=True,
+        rerun_failed_records=False,
+        max_retries=0,
+    )
+    poster.do_work()
+
+    assert requests == [8]
+    assert poster.num_failures == 8
+
+
+def test_restart_skips_posted_batches_and_upserts_the_ones_in_flight(tmp_path):
+    records = [{"id": f"id{i:02}"} for i in range(12)]
+    posted = []
+
+    def crashing_handler(request: httpx.Request):
+        batch = json.loads(request.content)["instances"]
+        if batch[0]["id"] == "id08":
+            raise httpx.ConnectError("VPN dropped", request=request)
+        posted.append(([r["id"] for r in batch], request.url.params["upsert"]))
+        return respond(201)
+
+    poster = make_batch_poster(
+        tmp_path,
+        "Instances",
+        records,
+        crashing_handler,
+        batch_size=4,
+        rerun_failed_records=False,
+        max_retries=0,
+        progress_journal=True,
+    )
+    with pytest.raises(httpx.ConnectError):
+        poster.do_work()
+    assert len(posted) == 2
+
+    def handler(request: httpx.Request):
+        batch = json.loads(request.content)["instances"]
+        posted.append(([r["id"] for r in batch], request.url.params["upsert"]))
+        return respond(201)
+
+    poster = make_batch_poster(
+        tmp_path,
+        "Instances",
+        records,
+        handler,
+        batch_size=4,
+        rerun_failed_records=False,
+        progress_journal=True,
+    )
+    poster.do_work()
+
+    assert posted[2:] == [(["id08", "id09", "id10", "id11"], "true")]
+    assert poster.processed == 12
+    poster.journal.remove()
+    assert not poster.folder_structure.progress_journal_path.exists()
+
+
+def test_restart_reposts_batches_with_failed_records(tmp_path):
+    records = [{"id": f"id{i:02}"} for i in range(12)]
+    posted = []
+
+    def crashing_handler(request: httpx.Request):
+        batch = [r["id"] for r in json.loads(request.content)["instances"]]
+        if "id05" in batch:
+            return respond(422, {"errors": [{"message": "Bad record"}]})
+        if "id08" in batch:
+            raise httpx.ConnectError("VPN dropped", request=request)
+        posted.append(batch)
+        return respond(201)
+
+    def handler(request: httpx.Request):
+        posted.append([r["id"] for r in json.loads(request.content)["instances"]])
+        return respond(201)
+
+    task_config = dict(
+        batch_size=4, rerun_failed_records=False, max_retries=0, progress_journal=True
+    )
+    poster = make_batch_poster(tmp_path, "Instances", records, crashing_handler, **task_config)
+    with pytest.raises(httpx.ConnectError):
+        poster.do_work()
+    poster = make_batch_poster(tmp_path, "Instances", records, handler, **task_config)
+    poster.do_work()
+
+    assert posted == [
+        ["id00", "id01", "id02", "id03"],
+        ["id04", "id05", "id06", "id07"],
+        ["id08", "id09", "id10", "id11"],
+    ]
+
+
+def test_transient_errors_are_retried_for_all_object_types(tmp_path, monkeypatch):
+    monkeypatch.setattr(time, "sleep", lambda seconds: None)
+    records = [{"id": str(i)} for i in range(4)]
+    status_codes = [503, 502, 201]
+
+    def handler(request: httpx.Request):
+        return respond(status_codes.pop(0))
+
+    poster = make_batch_poster(
+        tmp_path, "Items", records, handler, batch_size=4, rerun_failed_records=False
+    )
+    poster.do_work()
+
+    assert poster.num_failures == 0
+    assert poster.retry_policy.retry_counts == {"Items: HTTP 503": 1, "Items: HTTP 502": 1}
+
+
+@pytest.mark.parametrize("upsert", [False, True])
+def test_timed_out_posts_are_only_resent_when_upserting(tmp_path, monkeypatch, upsert):
+    monkeypatch.setattr(time, "sleep", lambda seconds: None)
+    records = [{"id": str(i)} for i in range(4)]
+    requests = []
+
+    def handler(request: httpx.Request):
+        requests.append(request)
+        if len(requests) == 1:
+            raise httpx.ReadTimeout("Timed out", request=request)
+        return respond(201)
+
+    poster = make_batch_poster(
+        tmp_path,
+        "Items",
+        records,
+        handler,
+        batch_size=4,
+        rerun_failed_records=False,
+        upsert=upsert,
+    )
+    if upsert:
+        poster.do_work()
+        assert len(requests) == 2
+        assert poster.num_failures == 0
+    else:
+        with pytest.raises(httpx.ReadTimeout):
+            poster.do_work()
+        assert len(requests) == 1
+
+
+def test_add_key_splices_into_the_serialized_record():
+    assert batch_poster.add_key('{"id": "a1"}', "_version", -1) == '{"_version": -1, "id": "a1"}'
+    assert json.loads(batch_poster.add_key("{}", "snapshotId", "s1")) == {"snapshotId": "s1"}
+    # A record that already has the key gets it replaced, not duplicated
+    replaced = batch_poster.add_key('{"id": "a1", "_version": 3}', "_version", -1)
+    assert json.loads(replaced) == {"id": "a1", "_version": -1}
+
+
+def test_batch_body_is_assembled_without_reparsing(tmp_path):
+    records = [{"id": str(i), "title": "Tab\there"} for i in range(3)]
+    bodies = []
+
+    def handler(request: httpx.Request):
+        bodies.append(json.loads(request.content))
+        return respond(201)
+
+    poster = make_batch_poster(
+        tmp_path, "SRS", records, handler, batch_size=3, rerun_failed_records=False
+    )
+    poster.snapshot_id = "snapshot"
+    poster.create_snapshot = poster.commit_snapshot = lambda: None
+    poster.do_work()
+
+    assert bodies == [
+        {
+            "records": [dict(record, snapshotId="snapshot") for record in records],
+            "totalRecords": 3,
+        }
+    ]
+
+
+def test_request_metrics_are_written_to_the_reports_folder(tmp_path):
+    records = [{"id": str(i)} for i in range(6)]
+
+    def handler(request: httpx.Request):
+        return respond(201)
+
+    poster = make_batch_poster(
+        tmp_path, "Instances", records, handler, batch_size=4, rerun_failed_records=False
+    )
+    poster.do_work()
+    poster.wrap_up()
+
+    with open(poster.folder_structure.request_metrics_path) as metrics_file:
+        endpoints = json.load(metrics_file)["endpoints"]
+    metrics = endpoints["POST /instance-storage/batch/synchronous"]
+    assert metrics["requests"] == 2
+    assert metrics["records"] == 6
+    assert metrics["responses"] == {"201": 2}
+    assert metrics["bytes_sent"] > 0
+
+
+def test_concurrent_single_record_posts(tmp_path):
+    records = [{"id": f"id{i:03}"} for i in range(120)]
+    posted = []
+
+    def handler(request: httpx.Request):
+        record = json.loads(request.content)
+        time.sleep(0.001 * (int(record["id"][2:]) % 7))
+        if record["id"] == "id007":
+            return respond(422, {"errors": [{"message": "id value already exists"}]})
+        if record["id"] == "id042":
+            return respond(422, {"errors": [{"message": "Invalid authority"}]})
+        posted.append(record["id"])
+        return respond(201)
+
+    poster = make_batch_poster(
+        tmp_path,
+        "Authorities",
+        records,
+        handler,
+        batch_size=1,
+        concurrent_single_record_posts=8,
+        rerun_failed_records=False,
+        progress_journal=True,
+    )
+    journaled = []
+    poster.journal.mark_done = lambda *span: journaled.append(span)
+    poster.do_work()
+
+    assert poster.num_posted == 118
+    assert poster.num_failures == 2
+    assert len(posted) == 118
+    assert not poster.in_flight
+    with open(poster.folder_structure.failed_recs_path) as failed_file:
+        assert [json.loads(line)["id"] for line in failed_file] == ["id042"]
+    # The journaled ranges follow each other, and cover the whole file but the failed row
+    assert journaled[0][1] == 0 and journaled[0][3] == 1
+    gaps = []
+    for previous, span in zip(journaled, journaled[1:]):
+        if span[1] != previous[2]:
+            gaps.append((previous[4] + 1, span[3] - 1))
+        else:
+            assert span[3] == previous[4] + 1
+    assert gaps == [(43, 43)]
+    assert journaled[-1][4] == 120
+
+
+def test_get_extradata_stage():
+    assert batch_poster.get_extradata_stage("courselisting") == 0
+    assert batch_poster.get_extradata_stage("notes") == 0
+    assert batch_poster.get_extradata_stage("instructor") == 1
+    assert batch_poster.get_extradata_stage("feefineaction") == 1
+
+
+def test_extradata_is_posted_in_dependency_stages(tmp_path):
+    rows = [
+        ("courselisting", {"id": "cl1"}),
+        ("course", {"id": "c1", "courseListingId": "cl1"}),
+        ("instructor", {"id": "i1", "courseListingId": "cl1"}),
+        ("account", {"id": "a1"}),
+        ("feefineaction", {"id": "f1", "accountId": "a1"}),
+        ("notes", {"id": "n1"}),
+        ("courselisting", {"id": "cl2"}),
+    ]
+    (tmp_path / "iterations" / "test" / "results").mkdir(parents=True)
+    (tmp_path / "iterations" / "test" / "results" / "records.json").write_text(
+        "".join(f"{name}\t{json.dumps(record)}\n" for name, record in rows)
+    )
+    posted = []
+
+    def handler(request: httpx.Request):
+        posted.append(json.loads(request.content)["id"])
+        return respond(201)
+
+    poster = make_batch_poster(
+        tmp_path,
+        "Extradata",
+        [],
+        handler,
+        batch_size=1,
+        concurrent_single_record_posts=4,
+        rerun_failed_records=False,
+    )
+    poster.do_work()
+
+    assert poster.num_posted == 7
+    assert set(posted[:4]) == {"cl1", "a1", "n1", "cl2"}
+    assert set(posted[4:]) == {"c1", "i1", "f1"}
+    assert poster.processed == 7
+
+
+def test_get_line_aligned_ranges(tmp_path):
+    path = tmp_path / "records.json"
+    lines = [f"{json.dumps({'id': str(i) * (i % 5 + 1)})}\n" for i in range(50)]
+    path.write_text("".join(lines))
+    ranges = batch_poster.get_line_aligned_ranges(path, 4)
+
+    assert len(ranges) == 4
+    assert ranges[0][0] == 0 and ranges[-1][1] == path.stat().st_size
+    content = path.read_bytes()
+    parts = [content[start:end] for start, end in ranges]
+    assert b"".join(parts) == content
+    assert all(part.endswith(b"\n") for part in parts)
+    assert batch_poster.get_line_aligned_ranges(path, 100)[-1][1] == path.stat().st_size
+    assert len(batch_poster.get_line_aligned_ranges(path, 100)) <= 50
+
+
+def shard_handler(request: httpx.Request):
+    batch = json.loads(request.content)["instances"]
+    if any(r["id"] == "id13" for r in batch):
+        return respond(422, {"errors": [{"message": "Invalid record"}]})
+    return respond(201)
+
+
+def post_shard_locally(task_config, library_config, shard_range, snapshot_id):
+    poster = BatchPoster(
+        task_config, library_config, make_folio_client(shard_handler), use_logging=False
+    )
+    poster.shard_range = shard_range
+    poster.do_work()
+    return poster.get_shard_results()
+
+
+def test_posting_from_worker_processes(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_poster, "post_shard", post_shard_locally)
+    records = [{"id": f"id{i:02}"} for i in range(40)]
+    poster = make_batch_poster(
+        tmp_path,
+        "Instances",
+        records,
+        shard_handler,
+        batch_size=5,
+        posting_processes=3,
+        rerun_failed_records=False,
+    )
+    poster.do_work()
+
+    assert poster.processed == 40
+    assert poster.failed_batches == 1
+    with open(poster.folder_structure.failed_recs_path) as failed_file:
+        failed_ids = [json.loads(line)["id"] for line in failed_file]
+    assert "id13" in failed_ids
+    assert poster.num_failures == len(failed_ids)
+    metrics = poster.request_metrics.snapshot()["endpoints"]
+    assert metrics["POST /instance-storage/batch/synchronous"]["records"] == 40 - len(failed_ids)
+    assert not list(poster.folder_structure.results_folder.glob("*shard*"))
+
+
+def test_compressed_requests(tmp_path):
+    records = [{"id": str(i), "title": "The same title, again and again"} for i in range(20)]
+    received = []
+
+    def handler(request: httpx.Request):
+        assert request.headers["content-encoding"] == "gzip"
+        received.extend(json.loads(gzip.decompress(request.content))["instances"])
+        return respond(201)
+
+    poster = make_batch_poster(
+        tmp_path,
+        "Instances",
+        records,
+        handler,
+        batch_size=10,
+        compress_requests=True,
+        rerun_failed_records=False,
+    )
+    poster.do_work()
+
+    assert poster.accepts_gzip
+    assert [r["id"] for r in received] == [r["id"] for r in records]
+    metrics = poster.request_metrics.snapshot()["endpoints"]
+    assert metrics["POST /instance-storage/batch/synchronous"]["bytes_saved"] > 0
+
+
+def test_adaptive_batch_size_measures_uncompressed_requests(tmp_path):
+    records = [{"id": str(i), "title": "The same title, again and again"} for i in range(10)]
+    body_sizes = []
+
+    def handler(request: httpx.Request):
+        body_sizes.append(len(gzip.decompress(request.content)))
+        return respond(201)
+
+    poster = make_batch_poster(
+        tmp_path,
+        "Instances",
+        records,
+        handler,
+        batch_size=10,
+        adaptive_batch_size=True,
+        compress_requests=True,
+        rerun_failed_records=False,
+    )
+    poster.batch_size_controller.register_success = Mock()
+    poster.do_work()
+
+    request_bytes = poster.batch_size_controller.register_success.call_args.args[2]
+    assert request_bytes == body_sizes[0]
+
+
+def test_compressed_requests_fall_back_when_rejected(tmp_path):
+    records = [{"id": str(i)} for i in range(20)]
+    encodings = []
+
+    def handler(request: httpx.Request):
+        encodings.append(request.headers.get("content-encoding"))
+        if request.headers.get("content-encoding") == "gzip":
+            return respond(415)
+        json.loads(request.content)
+        return respond(201)
+
+    poster = make_batch_poster(
+        tmp_path,
+        "Instances",
+        records,
+        handler,
+        batch_size=10,
+        compress_requests=True,
+        rerun_failed_records=False,
+    )
+    poster.do_work()
+
+    assert poster.accepts_gzip is False
+    assert encodings == ["gzip", None, None]
+    assert poster.num_failures == 0
+
+
+def test_get_req_size_of_compressed_request():
+    content = gzip.compress(b"x" * 10_000)
+    request = httpx.Request(
+        "POST", "http://okapi/items", content=content, headers={"content-encoding": "gzip"}
+    )
+    response = httpx.Response(201, request=request)
+    assert batch_poster.get_req_size(response).endswith("(gzip, saved 9.72KB)")
+
+
+def test_skip_unchanged_posts_only_new_and_changed_records(tmp_path):
+    records = [{"id": f"id{i}", "title": f"Title {i}"} for i in range(6)]
+    stored = {
+        "id0": {"id": "id0", "title": "Title 0", "_version": 3, "metadata": {"a": "b"}},
+        "id1": {"id": "id1", "title": "Old title", "_version": 1},
+        "id2": {"id": "id2", "title": "Title 2", "_version": 2},
+        "id3": {"id": "id3", "title": "Title 3", "_version": 2},
+    }
+    posted = []
+
+    def handler(request: httpx.Request):
+        if request.method == "GET":
+            assert request.url.path == "/instance-storage/instances"
+            ids = request.url.params["query"][len("id==(") : -1].split(" or ")
+            return respond(200, {"instances": [stored[i] for i in ids if i in stored]})
+        posted.append([r["id"] for r in json.loads(request.content)["instances"]])
+        return respond(201)
+
+    poster = make_batch_poster(
+        tmp_path,
+        "Instances",
+        records,
+        handler,
+        batch_size=3,
+        upsert=True,
+        skip_unchanged=True,
+        rerun_failed_records=False,
+    )
+    poster.do_work()
+    poster.wrap_up()
+
+    # id0, id2 and id3 are stored as they are, id1 has changed, id4 and id5 are new
+    assert posted == [["id1"], ["id4", "id5"]]
+    assert poster.upsert_counts == {"unchanged": 3, "new": 2, "changed": 1}
+    assert poster.migration_report.report["UnchangedRecords"]["Unchanged records skipped"] == 3
+
+
+def test_skip_unchanged_leaves_out_fully_unchanged_batches(tmp_path):
+    records = [{"id": f"id{i}"} for i in range(2)]
+
+    def handler(request: httpx.Request):
+        if request.method == "GET":
+            return respond(200, {"items": records})
+        raise AssertionError("Nothing should be posted")
+
+    poster = make_batch_poster(
+        tmp_path, "Items", records, handler, batch_size=2, skip_unchanged=True
+    )
+    poster.do_work()
+
+    assert poster.upsert_counts["unchanged"] == 2
+    assert poster.num_failures == 0
+
+
+def test_is_unchanged_leaves_out_what_storage_fills_in():
+    record = {"id": "it1", "barcode": "b1", "status": {"name": "Available"}, "notes": []}
+    stored_record = {
+        "id": "it1",
+        "barcode": "b1",
+        "status": {"name": "Available", "date": "2026-10-17T08:00:00.000+00:00"},
+        "statusUpdatedDate": "2026-10-17T08:00:00.000+0000",
+        "yearCaption": [],
+        "administrativeNotes": [],
+        "_version": 2,
+    }
+    assert batch_poster.is_unchanged(record, stored_record)
+    assert not batch_poster.is_unchanged({**record, "barcode": "b2"}, stored_record)
+    assert not batch_poster.is_unchanged(
+        record, {**stored_record, "status": {"name": "Checked out"}}
+    )
+
+
+def test_skip_unchanged_fails_only_the_posted_records(tmp_path):
+    records = [{"id": f"id{i}", "barcode": f"b{i}"} for i in range(4)]
+
+    def handler(request: httpx.Request):
+        if request.method == "GET":
+            return respond(200, {"items": records[:2]})
+        return respond(422, {"errors": [{"message": "Bad record"}]})
+
+    poster = make_batch_poster(
+        tmp_path,
+        "Items",
+        [{**record, "barcode": "new"} if record["id"] == "id3" else record for record in records],
+        handler,
+        batch_size=4,
+        skip_unchanged=True,
+        rerun_failed_records=False,
+    )
+    poster.do_work()
+
+    with open(poster.folder_structure.failed_recs_path) as failed_file:
+        assert [json.loads(line)["id"] for line in failed_file] == ["id2", "id3"]
+    assert poster.num_failures == 2
+
+
+def test_rate_limits_apply_to_the_module_posted_to(tmp_path, monkeypatch):
+    waits = []
+    monkeypatch.setattr(time, "sleep", waits.append)
+    records = [{"id": str(i)} for i in range(30)]
+
+    def handler(request: httpx.Request):
+        return respond(201)
+
+    poster = make_batch_poster(
+        tmp_path,
+        "Instances",
+        records,
+        handler,
+        batch_size=10,
+        rerun_failed_records=False,
+        rate_limits={"mod-inventory-storage": {"records_per_second": 10}},
+    )
+    poster.do_work()
+
+    # The first batch uses up the burst. The next two wait a second each, for 10 records
+    assert len(waits) == 2 and sum(waits) > 1.9
+    assert poster.rate_limiters.get_seconds_waited()["mod-inventory-storage"] > 1.9
+
+
+def test_gateway_urls_spread_the_batches(tmp_path, monkeypatch):
+    records = [{"id": str(i)} for i in range(40)]
+    hosts = []
+
+    def handler(request: httpx.Request):
+        hosts.append(request.url.host)
+        if request.url.host == "gateway2":
+            return respond(503)
+        return respond(201)
+
+    monkeypatch.setattr(
+        migration_task_base.httpx,
+        "HTTPTransport",
+        lambda **kwargs: httpx.MockTransport(handler),
+    )
+    poster = make_batch_poster(
+        tmp_path,
+        "Instances",
+        records,
+        handler,
+        batch_size=10,
+        rerun_failed_records=False,
+        retry_backoff_seconds=0,
+    )
+    poster.folio_client.ssl_verify = True
+    poster.gateway_pool = GatewayPool(
+        ["http://gateway1", "http://gateway2"], "http://okapi", eject_after_failures=1
+    )
+    poster.do_work()
+    poster.wrap_up()
+
+    # gateway2 is ejected on its first 503, and the retry goes to gateway1
+    assert hosts == ["gateway1", "gateway2"] + ["gateway1"] * 3
+    assert poster.processed == 40 and poster.num_failures == 0
+    assert poster.gateway_pool.stats["http://gateway2"]["ejections"] == 1
+    statistics = poster.migration_report.report["GeneralStatistics"]
+    assert statistics["Requests sent to gateway http://gateway1"] == 4
+
+
+def test_gateway_stats_cover_the_rerun_of_failed_records(tmp_path, monkeypatch):
+    records = [{"id": str(i)} for i in range(20)]
+    hosts = []
+
+    def handler(request: httpx.Request):
+        hosts.append(request.url.host)
+        if len(json.loads(request.content)["instances"]) > 1 and hosts.count("gateway1") == 2:
+            return respond(422, {"errors": [{"message": "Bad record"}]})
+        return respond(201)
+
+    monkeypatch.setattr(
+        migration_task_base.httpx,
+        "HTTPTransport",
+        lambda **kwargs: httpx.MockTransport(handler),
+    )
+    poster = make_batch_poster(tmp_path, "Instances", records, handler, batch_size=10)
+    poster.folio_client.ssl_verify = True
+    poster.gateway_pool = GatewayPool(["http://gateway1"], "http://okapi")
+    # Not the timestamped name, which the rerun may get if it starts within the same second
+    results_folder = poster.folder_structure.results_folder
+    poster.folder_structure.failed_recs_path = results_folder / "failed_records_first_run.txt"
+    poster.do_work()
+    poster.wrap_up()
+
+    # Two batches, and the ten records of the failed batch posted one by one
+    assert len(hosts) == 12
+    statistics = poster.migration_report.report["GeneralStatistics"]
+    assert statistics["Requests sent to gateway http://gateway1"] == 12
+
+
+def test_invalid_records_are_failed_before_posting(tmp_path):
+    schema = {
+        "type": "object",
+        "additionalProperties": False,
+        "required": ["id", "title"],
+        "properties": {"id": {"type": "string"}, "title": {"type": "string"}},
+    }
+    records = [{"id": str(i), "title": f"Title {i}"} for i in range(10)]
+    records[3] = {"id": "3"}
+    records[7] = {"id": "7", "title": "Title 7", "legacyId": "b7"}
+    posted = []
+
+    def handler(request: httpx.Request):
+        posted.extend(record["id"] for record in json.loads(request.content)["instances"])
+        return respond(201)
+
+    poster = make_batch_poster(
+        tmp_path,
+        "Instances",
+        records,
+        handler,
+        batch_size=4,
+        rerun_failed_records=False,
+        validate_records=True,
+    )
+    poster.folio_client.get_instance_json_schema.return_value = schema
+    poster.do_work()
+    poster.wrap_up()
+
+    assert posted == ["0", "1", "2", "4", "5", "6", "8", "9"]
+    assert poster.folio_client.get_instance_json_schema.call_count == 1
+    assert poster.num_failures == 2
+    failed = poster.folder_structure.failed_recs_path.read_text().splitlines()
+    assert [json.loads(row)["id"] for row in failed] == ["3", "7"]
+    assert poster.migration_report.report["SchemaValidation"] == {
+        "blurb_id": "SchemaValidation",
+        "(record): 'title' is a required property": 1,
+        "(record): Additional properties are not allowed ('legacyId' was unexpected)": 1,
+    }
+
+
+def test_schema_errors_are_counted_without_indexes_and_values():
+    validator = Draft4Validator(
+        {
+            "type": "object",
+            "properties": {
+                "holdingsStatements": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {"statement": {"type": "string", "minLength": 1}},
+                    },
+                },
+                "sourceType": {"enum": ["folio", "marc"]},
+            },
+        }
+    )
+    record = {"holdingsStatements": [{"statement": "v.1"}, {"statement": ""}], "sourceType": "x"}
+    errors = sorted(validator.iter_errors(record), key=batch_poster.get_error_path)
+
+    assert [batch_poster.get_error_path(error) for error in errors] == [
+        "holdingsStatements[1].statement",
+        "sourceType",
+    ]
+    assert [batch_poster.get_error_category(error) for error in errors] == [
+        "holdingsStatements[].statement: minLength",
+        "sourceType: enum",
+    ]
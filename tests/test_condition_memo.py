@@ -0,0 +1,73 @@
+from types import SimpleNamespace
+
+import pytest
+from pymarc import Field, Subfield
+
+from folio_migration_tools.custom_exceptions import TransformationProcessError
+from folio_migration_tools.marc_rules_transformation.conditions import Conditions
+from folio_migration_tools.marc_rules_transformation.mapping_plan import MappingPlan
+from folio_migration_tools.migration_report import MigrationReport
+
+
+def make_conditions(condition_names, max_size=10):
+    conditions = Conditions.__new__(Conditions)
+    conditions.condition_cache = {}
+    conditions.condition_memo = None
+    conditions.mapper = SimpleNamespace(migration_report=MigrationReport())
+    conditions.memoize_conditions(condition_names, max_size)
+    return conditions
+
+
+def test_results_are_reused_and_counted():
+    conditions = make_conditions(["trim_period"])
+    for value in ["Title. ", "Title. ", "Other.", "Title. "]:
+        assert conditions.get_condition("trim_period", "id", value, {}) == value.strip()[:-1]
+    report = conditions.mapper.migration_report.report["ConditionMemoization"]
+    assert report["trim_period hits"] == 2
+    assert report["trim_period misses"] == 2
+
+
+def test_report_additions_are_replayed():
+    conditions = make_conditions(["set_holdings_type_id"])
+    for _ in range(3):
+        conditions.get_condition("set_holdings_type_id", "id", "x", {})
+    report = conditions.mapper.migration_report.report
+    assert report["HoldingsTypeMapping"]["Condition in rules hit"] == 3
+    assert report["ConditionMemoization"]["set_holdings_type_id hits"] == 2
+
+
+def test_least_recently_used_results_are_forgotten():
+    conditions = make_conditions(["capitalize"], max_size=2)
+    for value in ["a", "b", "a", "c", "a", "b"]:
+        conditions.get_condition("capitalize", "id", value, {})
+    report = conditions.mapper.migration_report.report["ConditionMemoization"]
+    assert (report["capitalize hits"], report["capitalize misses"]) == (2, 4)
+
+
+def test_parameters_are_part_of_the_key():
+    conditions = make_conditions(["char_select"])
+    assert conditions.get_condition("char_select", "id", "abcdef", {"from": 0, "to": 2}) == "ab"
+    assert conditions.get_condition("char_select", "id", "abcdef", {"from": 2, "to": 4}) == "cd"
+
+
+def test_errors_are_not_memoized():
+    conditions = make_conditions(["remove_substring"])
+    for _ in range(2):
+        with pytest.raises(KeyError):
+            conditions.get_condition("remove_substring", "id", "value", {})
+    assert "ConditionMemoization" not in conditions.mapper.migration_report.report
+
+
+def test_conditions_reading_the_marc_field_can_not_be_memoized():
+    with pytest.raises(TransformationProcessError):
+        make_conditions(["trim", "set_publisher_role"])
+
+
+def test_the_mapping_plan_uses_the_memoized_conditions():
+    conditions = make_conditions(["trim"])
+    mapping = {"target": "note", "subfield": ["a"], "rules": [{"conditions": [{"type": "trim"}]}]}
+    plan = MappingPlan({"500": [mapping]}, conditions)
+    marc_field = Field(tag="500", subfields=[Subfield(code="a", value=" A note ")])
+    for _ in range(2):
+        assert plan.get(mapping).get_value("id", marc_field) == "A note"
+    assert conditions.mapper.migration_report.report["ConditionMemoization"]["trim hits"] == 1
@@ -0,0 +1,174 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from folioclient import FolioClient
+
+from folio_migration_tools.circulation_helper import CirculationHelper
+from folio_migration_tools.library_configuration import (
+    FileDefinition,
+    LibraryConfiguration,
+)
+from folio_migration_tools.migration_report import MigrationReport
+from folio_migration_tools.migration_tasks.batch_poster import BatchPoster
+from folio_migration_tools.test_infrastructure.folio_stand_in import (
+    FolioStandIn,
+    parse_cql,
+)
+from folio_migration_tools.transaction_migration.legacy_loan import LegacyLoan
+
+
+@pytest.fixture
+def stand_in():
+    with FolioStandIn() as stand_in:
+        yield stand_in
+
+
+def make_uuid(number):
+    return f"{number:08x}-0000-4000-8000-000000000000"
+
+
+def post_records(tmp_path, stand_in, object_type, rows, **task_config):
+    """Posts the rows to the stand-in with a BatchPoster and a logged in FolioClient"""
+    (tmp_path / "mapping_files").mkdir(exist_ok=True)
+    (tmp_path / ".gitignore").touch()
+    iteration_folder = tmp_path / "iterations" / "test"
+    for folder in ["source_data", "results", "reports"]:
+        (iteration_folder / folder).mkdir(parents=True, exist_ok=True)
+    (iteration_folder / "results" / "records.json").write_text(
+        "".join(f"{json.dumps(row)}\n" for row in rows)
+    )
+    library_config = LibraryConfiguration(
+        okapi_url=stand_in.url,
+        tenant_id="tenant",
+        okapi_username="user",
+        okapi_password="password",
+        base_folder=tmp_path,
+        library_name="Test library",
+        log_level_debug=False,
+        folio_release="ramsons",
+        iteration_identifier="test",
+    )
+    task_config = BatchPoster.TaskConfiguration(
+        name="test_post",
+        migration_task_type="BatchPoster",
+        object_type=object_type,
+        files=[FileDefinition(file_name="records.json")],
+        rerun_failed_records=False,
+        retry_backoff_seconds=0,
+        **task_config,
+    )
+    with FolioClient(stand_in.url, "tenant", "user", "password") as folio_client:
+        poster = BatchPoster(task_config, library_config, folio_client, use_logging=False)
+        poster.do_work()
+        poster.wrap_up()
+    return poster
+
+
+def test_batches_are_stored_and_invalid_records_rejected(tmp_path, stand_in):
+    stand_in.invalid_ids = {make_uuid(7)}
+    rows = [{"id": make_uuid(n), "title": f"Title {n}"} for n in range(20)]
+    poster = post_records(
+        tmp_path, stand_in, "Instances", rows, batch_size=5, bisect_failed_batches=True
+    )
+
+    stored = stand_in.get_records("/instance-storage/instances")
+    assert sorted(r["id"] for r in stored) == [make_uuid(n) for n in range(20) if n != 7]
+    assert poster.num_failures == 1
+    assert stand_in.request_counts["POST /instance-storage/batch/synchronous"] > 4
+
+
+def test_injected_errors_are_retried(tmp_path):
+    with FolioStandIn(error_rate=0.3, seed=1) as stand_in:
+        rows = [{"id": make_uuid(n)} for n in range(50)]
+        poster = post_records(tmp_path, stand_in, "Items", rows, batch_size=5, max_retries=10)
+
+        assert len(stand_in.get_records("/item-storage/items")) == 50
+        assert poster.num_failures == 0
+        assert stand_in.request_counts["POST /item-storage/batch/synchronous"] > 10
+
+
+def test_too_large_requests_are_split(tmp_path):
+    with FolioStandIn(max_request_bytes=1000) as stand_in:
+        rows = [{"id": make_uuid(n), "title": "x" * 50} for n in range(40)]
+        poster = post_records(
+            tmp_path, stand_in, "Holdings", rows, batch_size=20, adaptive_batch_size=True
+        )
+
+        assert len(stand_in.get_records("/holdings-storage/holdings")) == 40
+        assert poster.num_failures == 0
+
+
+def test_user_import_matches_users_on_username(tmp_path, stand_in):
+    stand_in.add_records("/users", [{"id": make_uuid(1), "username": "user1"}])
+    rows = [{"username": f"user{n}", "barcode": str(n)} for n in range(1, 4)]
+    poster = post_records(tmp_path, stand_in, "Users", rows, batch_size=10)
+
+    users = stand_in.get_records("/users")
+    assert len(users) == 3
+    assert (poster.users_created, poster.users_updated) == (2, 1)
+
+
+def test_srs_records_are_posted_in_a_committed_snapshot(tmp_path, stand_in, monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+    rows = [{"id": make_uuid(n), "recordType": "MARC_BIB"} for n in range(3)]
+    poster = post_records(tmp_path, stand_in, "SRS", rows, batch_size=10)
+
+    [snapshot] = stand_in.get_records("/source-storage/snapshots")
+    assert snapshot["jobExecutionId"] == poster.snapshot_id
+    assert snapshot["status"] == "COMMITTED"
+    records = stand_in.get_records("/source-storage/records")
+    assert {r["snapshotId"] for r in records} == {poster.snapshot_id}
+
+
+def test_check_out_by_barcode(stand_in):
+    stand_in.add_records("/item-storage/items", [{"id": make_uuid(1), "barcode": "i1"}])
+    stand_in.add_records("/users", [{"id": make_uuid(2), "barcode": "u1"}])
+    out_date = datetime(2024, 1, 2, 10, 0, tzinfo=timezone.utc)
+
+    def check_out(item_barcode, patron_barcode):
+        loan = LegacyLoan(
+            {
+                "item_barcode": item_barcode,
+                "patron_barcode": patron_barcode,
+                "due_date": (out_date + timedelta(days=30)).isoformat(),
+                "out_date": out_date.isoformat(),
+                "renewal_count": "0",
+                "next_item_status": "",
+                "service_point_id": "sp",
+            },
+            "sp",
+            MigrationReport(),
+        )
+        return helper.check_out_by_barcode(loan)
+
+    with FolioClient(stand_in.url, "tenant", "user", "password") as folio_client:
+        helper = CirculationHelper(folio_client, "sp", MigrationReport())
+        checked_out = check_out("i1", "u1")
+        already_out = check_out("i1", "u1")
+        missing_item = check_out("i2", "u1")
+
+    assert checked_out.was_successful
+    assert checked_out.folio_loan["itemId"] == make_uuid(1)
+    assert "already has an open" in already_out.error_message
+    assert missing_item.migration_report_message == "Item barcode not in FOLIO"
+    assert stand_in.get_records("/circulation/loans") == [checked_out.folio_loan]
+
+
+def test_parse_cql():
+    records = [
+        {"id": "a", "barcode": "1", "status": {"name": "Open"}},
+        {"id": "b", "barcode": "2", "status": {"name": "Closed"}},
+        {"id": "c", "barcode": "3", "status": {"name": "Open"}},
+    ]
+
+    def query(cql):
+        matches, sort_key = parse_cql(cql)
+        return [record["id"] for record in records if matches(record)], sort_key
+
+    assert query("cql.allRecords=1") == (["a", "b", "c"], None)
+    assert query('(barcode=="2")') == (["b"], None)
+    assert query("id==(a or c)") == (["a", "c"], None)
+    assert query('id>"a" and status.name==Open sortBy id') == (["c"], "id")
+    with pytest.raises(ValueError):
+        parse_cql("title all cats")
@@ -0,0 +1,110 @@
+import httpx
+import pytest
+
+from folio_migration_tools.gateway_pool import (
+    GatewayPool,
+    GatewayTransport,
+    merge_gateway_stats,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_choose_round_robin():
+    pool = GatewayPool(["http://a", "http://b/", "http://c"], "http://okapi")
+    assert [pool.choose() for _ in range(6)] == ["http://a", "http://b", "http://c"] * 2
+    assert pool.stats["http://b"]["requests"] == 2
+
+
+def test_failing_gateway_is_ejected_and_comes_back():
+    clock = FakeClock()
+    pool = GatewayPool(
+        ["http://a", "http://b"], "http://okapi", eject_after_failures=2, clock=clock
+    )
+    pool.report("http://a", False)
+    assert "http://a" in [pool.choose() for _ in range(2)]
+    pool.report("http://a", False)
+    assert [pool.choose() for _ in range(4)] == ["http://b"] * 4
+    assert pool.stats["http://a"]["ejections"] == 1
+
+    clock.now = 61
+    assert "http://a" in [pool.choose() for _ in range(2)]
+    # Half open: the first failure after coming back ejects it again
+    pool.report("http://a", False)
+    assert [pool.choose() for _ in range(2)] == ["http://b"] * 2
+    pool.report("http://a", True)
+    assert pool.failures["http://a"] == 0
+
+
+def test_all_ejected_uses_the_one_due_back_first():
+    clock = FakeClock()
+    pool = GatewayPool(
+        ["http://a", "http://b"], "http://okapi", eject_after_failures=1, clock=clock
+    )
+    pool.report("http://a", False)
+    clock.now = 10
+    pool.report("http://b", False)
+    assert pool.choose() == "http://a"
+
+
+def test_a_pool_needs_base_urls():
+    with pytest.raises(ValueError):
+        GatewayPool([], "http://okapi")
+
+
+def test_rewrite_keeps_the_path_and_query():
+    pool = GatewayPool(["https://kong-1.example.org"], "https://folio.example.org/okapi/")
+    assert (
+        pool.rewrite(
+            "https://folio.example.org/okapi/instance-storage/instances?limit=1",
+            "https://kong-1.example.org",
+        )
+        == "https://kong-1.example.org/instance-storage/instances?limit=1"
+    )
+    assert pool.rewrite("https://elsewhere.org/x", "https://kong-1.example.org") == (
+        "https://elsewhere.org/x"
+    )
+
+
+def test_transport_spreads_requests_and_reports_health():
+    hosts = []
+
+    def handler(request: httpx.Request):
+        hosts.append(request.headers["host"])
+        if request.url.host == "b":
+            raise httpx.ConnectError("Connection refused", request=request)
+        if request.url.host == "c":
+            return httpx.Response(502)
+        return httpx.Response(200, json={"path": request.url.path})
+
+    pool = GatewayPool(["http://a", "http://b", "http://c:9130"], "http://okapi")
+    transport = GatewayTransport(pool, httpx.MockTransport(handler))
+    with httpx.Client(transport=transport, base_url="http://okapi") as client:
+        assert client.get("/users").json() == {"path": "/users"}
+        with pytest.raises(httpx.ConnectError):
+            client.get("/users")
+        assert client.get("/users").status_code == 502
+        client.get("http://elsewhere/users")
+
+    assert hosts == ["a", "b", "c:9130", "elsewhere"]
+    assert pool.failures == {"http://a": 0, "http://b": 1, "http://c:9130": 1}
+    assert pool.stats["http://a"] == {"requests": 1, "failures": 0, "ejections": 0}
+
+
+def test_merge_gateway_stats():
+    stats = {"http://a": {"requests": 1, "failures": 0, "ejections": 0}}
+    merge_gateway_stats(
+        stats,
+        {
+            "http://a": {"requests": 2, "failures": 1, "ejections": 0},
+            "http://b": {"requests": 3, "failures": 0, "ejections": 0},
+        },
+    )
+    assert stats["http://a"] == {"requests": 3, "failures": 1, "ejections": 0}
+    assert stats["http://b"]["requests"] == 3
@@ -1,5 +1,8 @@
 import io
 import logging
+from unittest.mock import Mock
+
+import httpx
 
 from folio_migration_tools.helper import Helper
 
@@ -39,3 +42,17 @@ def test_print_mapping_report():
         report_content = migration_report_file.getvalue()
 
         assert "interface_1_name" in report_content
+
+
+def test_borrow_http_client_closes_only_its_own_client():
+    folio_client = Mock()
+    folio_client.get_folio_http_client.side_effect = httpx.Client
+    with Helper.borrow_http_client(folio_client) as own_http_client:
+        assert not own_http_client.is_closed
+    assert own_http_client.is_closed
+
+    with httpx.Client() as http_client:
+        with Helper.borrow_http_client(folio_client, http_client) as borrowed_http_client:
+            assert borrowed_http_client is http_client
+        assert not http_client.is_closed
+    assert folio_client.get_folio_http_client.call_count == 1
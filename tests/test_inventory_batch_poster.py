@@ -0,0 +1,253 @@
+import json
+import threading
+from unittest.mock import Mock
+
+import httpx
+import pytest
+
+from folio_migration_tools.dependency_gate import DependencyGate
+from folio_migration_tools.library_configuration import LibraryConfiguration
+from folio_migration_tools.migration_tasks import batch_poster
+from folio_migration_tools.migration_tasks.inventory_batch_poster import (
+    InventoryBatchPoster,
+)
+
+
+def respond(status_code, body=None):
+    """Builds a streamed response, so that httpx sets response.elapsed"""
+    content = json.dumps(body).encode("utf-8") if body is not None else b""
+    return httpx.Response(status_code, stream=httpx.ByteStream(content))
+
+
+def make_inventory_poster(tmp_path, files, handler, **task_config):
+    (tmp_path / "mapping_files").mkdir(exist_ok=True)
+    (tmp_path / ".gitignore").touch()
+    iteration_folder = tmp_path / "iterations" / "test"
+    for folder in ["source_data", "results", "reports"]:
+        (iteration_folder / folder).mkdir(parents=True, exist_ok=True)
+    for file_name, rows in files.items():
+        (iteration_folder / "results" / file_name).write_text(
+            "".join(f"{json.dumps(row)}\n" for row in rows)
+        )
+    library_config = LibraryConfiguration(
+        okapi_url="http://okapi",
+        tenant_id="tenant",
+        okapi_username="user",
+        okapi_password="password",
+        base_folder=tmp_path,
+        library_name="Test library",
+        log_level_debug=False,
+        folio_release="ramsons",
+        iteration_identifier="test",
+    )
+    folio_client = Mock()
+    folio_client.okapi_url = "http://okapi"
+    folio_client.okapi_headers = {"x-okapi-token": "token"}
+    folio_client.get_folio_http_client.side_effect = lambda: httpx.Client(
+        transport=httpx.MockTransport(handler)
+    )
+    file_settings = {
+        "instances.json": "instance_files",
+        "srs.json": "srs_files",
+        "holdings.json": "holdings_files",
+        "items.json": "item_files",
+    }
+    task_config = InventoryBatchPoster.TaskConfiguration(
+        name="test_inventory",
+        migration_task_type="InventoryBatchPoster",
+        **{file_settings[file_name]: [{"file_name": file_name}] for file_name in files},
+        **{"rerun_failed_records": False, **task_config},
+    )
+    return InventoryBatchPoster(task_config, library_config, folio_client, use_logging=False)
+
+
+def test_items_are_posted_after_their_holdings(tmp_path):
+    instances = [{"id": f"i{n}"} for n in range(20)]
+    holdings = [{"id": f"h{n}", "instanceId": f"i{n}"} for n in range(20)]
+    items = [{"id": f"it{n}", "holdingsRecordId": f"h{n}"} for n in range(20)]
+    posted = set()
+    out_of_order = []
+    lock = threading.Lock()
+
+    def handler(request: httpx.Request):
+        body = json.loads(request.content)
+        object_name, records = next(iter(body.items()))
+        with lock:
+            if object_name == "instances" and "i4" in {r["id"] for r in records}:
+                return respond(422, {"errors": [{"message": "Invalid"}]})
+            for record in records:
+                reference = record.get("instanceId") or record.get("holdingsRecordId")
+                if reference and reference not in posted:
+                    out_of_order.append(record["id"])
+            posted.update(record["id"] for record in records)
+        return respond(201)
+
+    poster = make_inventory_poster(
+        tmp_path,
+        {"instances.json": instances, "holdings.json": holdings, "items.json": items},
+        handler,
+        batch_size=5,
+        concurrent_batches=2,
+    )
+    poster.do_work()
+    poster.wrap_up()
+
+    assert out_of_order == []
+    # The failed batch of instances holds i0 to i4. Their holdings and items are withheld
+    assert posted == {f"{prefix}{n}" for prefix in ["i", "h", "it"] for n in range(5, 20)}
+    assert poster.posters["Holdings"].num_failures == 5
+    assert poster.posters["Items"].num_failures == 5
+    failed_items = poster.posters["Items"].folder_structure.failed_recs_path.read_text()
+    assert {json.loads(row)["id"] for row in failed_items.splitlines()} == {
+        f"it{n}" for n in range(5)
+    }
+    statistics = poster.migration_report.report["GeneralStatistics"]
+    assert statistics["Items: failed to post"] == 5
+
+
+def test_failed_records_are_rerun_in_dependency_order(tmp_path):
+    instances = [{"id": "i1"}, {"id": "i2"}]
+    holdings = [{"id": "h1", "instanceId": "i1"}, {"id": "h2", "instanceId": "i2"}]
+    posted = []
+
+    def handler(request: httpx.Request):
+        records = next(iter(json.loads(request.content).values()))
+        ids = [record["id"] for record in records]
+        if len(ids) > 1 and "i1" in ids or ids == ["i2"]:
+            return respond(422, {"errors": [{"message": "Invalid"}]})
+        posted.extend(ids)
+        return respond(201)
+
+    poster = make_inventory_poster(
+        tmp_path,
+        {"instances.json": instances, "holdings.json": holdings},
+        handler,
+        batch_size=2,
+        rerun_failed_records=True,
+    )
+    poster.do_work()
+    assert posted == []
+    poster.wrap_up()
+
+    # i1 posts when rerun, and so does its holding. i2 fails again, and h2 is withheld
+    assert posted == ["i1", "h1"]
+    failed_holdings = poster.posters["Holdings"].folder_structure.failed_recs_path.read_text()
+    assert [json.loads(row)["id"] for row in failed_holdings.splitlines()] == ["h2"]
+
+
+def test_references_outside_the_load_wait_for_the_poster_to_finish():
+    gate = DependencyGate()
+    gate.dispatch("Holdings", ["h1", "h2"])
+    assert not gate.wait("Holdings", {"h1", "h3"}, timeout=0)
+    gate.acknowledge("Holdings", ["h1"])
+    assert gate.wait("Holdings", {"h1"}, timeout=0)
+    assert not gate.wait("Holdings", {"h1", "h3"}, timeout=0)
+    gate.finish("Holdings")
+    assert gate.wait("Holdings", {"h1", "h3"}, timeout=0)
+    # Records still in flight when the poster finished count as failed
+    assert gate.get_failed("Holdings", {"h1", "h2", "h3"}) == {"h2"}
+    # A record that is posted again keeps its latest outcome
+    gate.acknowledge("Holdings", ["h2"])
+    assert gate.get_failed("Holdings", {"h1", "h2", "h3"}) == set()
+
+
+def test_records_of_an_incomplete_poster_fail_closed():
+    gate = DependencyGate()
+    gate.dispatch("Holdings", ["h1"])
+    gate.acknowledge("Holdings", ["h1"])
+    gate.fail_unidentified("Holdings")
+    gate.finish("Holdings")
+    # h3 may be one of the rows that could not be read, so it is not posted against
+    assert gate.get_failed("Holdings", {"h1", "h3"}) == {"h3"}
+    gate = DependencyGate()
+    gate.finish("Instances", complete=False)
+    assert gate.get_failed("Instances", {"i1"}) == {"i1"}
+
+
+def test_a_halting_poster_lets_the_others_finish(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_poster.time, "sleep", lambda seconds: None)
+    instances = [{"id": f"i{n}"} for n in range(6)]
+    holdings = [{"id": f"h{n}", "instanceId": f"i{n}"} for n in range(6)]
+    srs_records = [{"id": f"s{n}", "externalIdsHolder": {"instanceId": f"i{n}"}} for n in range(6)]
+    posted = []
+    snapshots = []
+    lock = threading.Lock()
+
+    def handler(request: httpx.Request):
+        if "/snapshots" in request.url.path:
+            snapshots.append(request.method)
+            return respond(201 if request.method == "POST" else 200)
+        with lock:
+            posted.extend(r["id"] for r in next(iter(json.loads(request.content).values())))
+        return respond(201)
+
+    monkeypatch.setattr(
+        httpx,
+        "put",
+        lambda url, **kwargs: httpx.Client(transport=httpx.MockTransport(handler)).put(
+            url, json=kwargs["json"]
+        ),
+    )
+    poster = make_inventory_poster(
+        tmp_path,
+        {"instances.json": instances, "srs.json": srs_records, "holdings.json": holdings},
+        handler,
+        batch_size=2,
+    )
+    instances_file = poster.posters["Instances"].folder_structure.results_folder / "instances.json"
+    rows = instances_file.read_text().splitlines()
+    # The poster of the instances halts on the second batch, so i2 to i5 are never posted
+    instances_file.write_text("\n".join(rows[:2] + ["{not json"] + rows[3:]) + "\n")
+    with pytest.raises(json.JSONDecodeError):
+        poster.do_work()
+
+    assert sorted(posted) == ["h0", "h1", "i0", "i1", "s0", "s1"]
+    assert snapshots == ["POST", "GET", "PUT"]
+    assert poster.posters["Holdings"].num_failures == 4
+    assert poster.folder_structure.migration_reports_file.exists()
+
+
+def test_srs_records_are_withheld_when_their_instance_fails(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_poster.time, "sleep", lambda seconds: None)
+    instances = [{"id": f"i{n}"} for n in range(12)]
+    srs_records = [
+        {"id": f"s{n}", "externalIdsHolder": {"instanceId": f"i{n}"}} for n in range(12)
+    ]
+    posted = []
+    snapshots = []
+    lock = threading.Lock()
+
+    def handler(request: httpx.Request):
+        if "/snapshots" in request.url.path:
+            snapshots.append(request.method)
+            return respond(201 if request.method == "POST" else 200)
+        records = next(iter(json.loads(request.content).values()))
+        with lock:
+            if "i7" in {r["id"] for r in records}:
+                return respond(422, {"errors": [{"message": "Invalid"}]})
+            posted.extend(records)
+        return respond(201)
+
+    # The snapshot is committed after the posting, when the client is closed
+    monkeypatch.setattr(
+        httpx,
+        "put",
+        lambda url, **kwargs: httpx.Client(transport=httpx.MockTransport(handler)).put(
+            url, json=kwargs["json"]
+        ),
+    )
+    poster = make_inventory_poster(
+        tmp_path,
+        {"instances.json": instances, "srs.json": srs_records},
+        handler,
+        batch_size=4,
+    )
+    poster.do_work()
+    poster.wrap_up()
+
+    srs_poster = poster.posters["SRS"]
+    posted_srs = [record for record in posted if record["id"].startswith("s")]
+    assert [record["id"] for record in posted_srs] == [f"s{n}" for n in [0, 1, 2, 3, 8, 9, 10, 11]]
+    assert {record["snapshotId"] for record in posted_srs} == {srs_poster.snapshot_id}
+    assert snapshots == ["POST", "GET", "PUT"]
+    assert srs_poster.num_failures == 4
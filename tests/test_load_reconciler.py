@@ -0,0 +1,121 @@
+import json
+import re
+from unittest.mock import Mock
+
+import httpx
+
+from folio_migration_tools.library_configuration import LibraryConfiguration
+from folio_migration_tools.migration_tasks import load_reconciler
+from folio_migration_tools.migration_tasks.load_reconciler import LoadReconciler
+
+
+def make_uuid(number):
+    return f"{number:08x}-0000-4000-8000-000000000000"
+
+
+def make_folio(stored_ids, queries):
+    """Answers the id lookups and id range listings of the instance storage"""
+
+    def handler(request: httpx.Request):
+        query = request.url.params["query"]
+        limit = int(request.url.params["limit"])
+        queries.append(query)
+        if query.startswith("id==("):
+            ids = set(query[5:-1].split(" or "))
+            found = [record_id for record_id in stored_ids if record_id in ids]
+        else:
+            lower = re.search(r'id>=?"([^"]+)"', query).group(1)
+            upper = re.search(r'id<"([^"]+)"', query)
+            found = sorted(
+                record_id
+                for record_id in stored_ids
+                if (record_id >= lower if "id>=" in query else record_id > lower)
+                and (not upper or record_id < upper.group(1))
+            )[:limit]
+        return httpx.Response(200, json={"instances": [{"id": i} for i in found]})
+
+    return handler
+
+
+def make_reconciler(tmp_path, rows, handler, **task_config):
+    (tmp_path / "mapping_files").mkdir(exist_ok=True)
+    (tmp_path / ".gitignore").touch()
+    iteration_folder = tmp_path / "iterations" / "test"
+    for folder in ["source_data", "results", "reports"]:
+        (iteration_folder / folder).mkdir(parents=True, exist_ok=True)
+    (iteration_folder / "results" / "folio_instances.json").write_text(
+        "".join(f"{json.dumps(row)}\n" for row in rows)
+    )
+    library_config = LibraryConfiguration(
+        okapi_url="http://okapi",
+        tenant_id="tenant",
+        okapi_username="user",
+        okapi_password="password",
+        base_folder=tmp_path,
+        library_name="Test library",
+        log_level_debug=False,
+        folio_release="ramsons",
+        iteration_identifier="test",
+    )
+    folio_client = Mock()
+    folio_client.okapi_url = "http://okapi"
+    folio_client.okapi_headers = {"x-okapi-token": "token"}
+    folio_client.get_folio_http_client.side_effect = lambda: httpx.Client(
+        transport=httpx.MockTransport(handler)
+    )
+    task_config = LoadReconciler.TaskConfiguration(
+        name="test_reconcile",
+        migration_task_type="LoadReconciler",
+        object_type="Instances",
+        files=[{"file_name": "folio_instances.json"}],
+        **task_config,
+    )
+    return LoadReconciler(task_config, library_config, folio_client, use_logging=False)
+
+
+def test_missing_records_are_written_for_reposting(tmp_path):
+    rows = [{"id": make_uuid(n), "title": f"Title {n}"} for n in range(25)]
+    stored_ids = {make_uuid(n) for n in range(25) if n % 10 != 3}
+    queries = []
+    reconciler = make_reconciler(
+        tmp_path, rows, make_folio(stored_ids, queries), chunk_size=10, concurrent_requests=2
+    )
+    reconciler.do_work()
+    reconciler.wrap_up()
+
+    assert len(queries) == 3
+    missing = [make_uuid(3), make_uuid(13), make_uuid(23)]
+    assert sorted(reconciler.missing_ids_path.read_text().split()) == missing
+    reposted = [
+        json.loads(row) for row in reconciler.missing_records_path.read_text().splitlines()
+    ]
+    assert sorted(reposted, key=lambda r: r["id"]) == [rows[3], rows[13], rows[23]]
+    statistics = reconciler.migration_report.report["GeneralStatistics"]
+    assert statistics["Records found in FOLIO"] == 22
+    assert statistics["Records missing from FOLIO"] == 3
+
+
+def test_extra_ids_are_listed_by_range(tmp_path, monkeypatch):
+    monkeypatch.setattr(load_reconciler, "ID_PAGE_SIZE", 2)
+    rows = [{"id": make_uuid(n)} for n in range(5)]
+    extra = ["1" + make_uuid(n)[1:] for n in range(3)] + ["f" + make_uuid(9)[1:]]
+    queries = []
+    reconciler = make_reconciler(
+        tmp_path,
+        rows + [rows[0]],
+        make_folio({make_uuid(n) for n in range(5)} | set(extra), queries),
+        find_extra_ids=True,
+    )
+    reconciler.do_work()
+    reconciler.wrap_up()
+
+    assert sorted(reconciler.extra_ids_path.read_text().split()) == extra
+    assert reconciler.counts["duplicates"] == 1
+    assert reconciler.counts["missing"] == 0
+    # The 0 range holds 5 ids, and takes 3 pages. The 1 range holds 3 ids, and takes 2
+    range_queries = [query for query in queries if not query.startswith("id==")]
+    assert len(range_queries) == 3 + 2 + 14
+    assert (
+        'id>="00000000-0000-0000-0000-000000000000" and id<"10000000-0000-0000-0000-000000000000"'
+        " sortBy id"
+    ) in range_queries
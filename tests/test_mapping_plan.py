@@ -0,0 +1,127 @@
+from types import SimpleNamespace
+
+import pytest
+from pymarc import Field, Subfield
+
+from folio_migration_tools.custom_exceptions import TransformationProcessError
+from folio_migration_tools.marc_rules_transformation.conditions import Conditions
+from folio_migration_tools.marc_rules_transformation.mapping_plan import MappingPlan
+from folio_migration_tools.marc_rules_transformation.rules_mapper_base import (
+    RulesMapperBase,
+)
+
+MAPPINGS = {
+    "245": [
+        {
+            "target": "title",
+            "subfield": ["a", "b", "n"],
+            "rules": [{"conditions": [{"type": "remove_ending_punc, trim_period"}]}],
+        },
+        {
+            "target": "indexTitle",
+            "subfield": ["a", "b"],
+            "applyRulesOnConcatenatedData": True,
+            "rules": [{"conditions": [{"type": "trim_punctuation"}]}],
+        },
+    ],
+    "264": [
+        {
+            "entity": [
+                {
+                    "target": "publication.place",
+                    "subfield": ["a"],
+                    "subFieldDelimiter": [{"subfields": ["a"], "value": " ; "}],
+                    "rules": [{"conditions": [{"type": "remove_ending_punc, trim"}]}],
+                },
+                {
+                    "target": "publication.publisher",
+                    "subfield": ["a", "b", "c"],
+                    "subFieldDelimiter": [
+                        {"subfields": ["a", "b"], "value": " : "},
+                        {"subfields": ["c"], "value": ", "},
+                    ],
+                    "rules": [],
+                },
+            ]
+        }
+    ],
+    "500": [
+        {
+            "target": "notes.note",
+            "subfield": ["a"],
+            "rules": [{"conditions": [{"type": "no_such_condition"}]}],
+        }
+    ],
+}
+
+FIELDS = [
+    Field(
+        tag="245",
+        indicators=["1", "0"],
+        subfields=[
+            Subfield(code="a", value="The title :"),
+            Subfield(code="b", value="a subtitle."),
+            Subfield(code="n", value="Part 1."),
+        ],
+    ),
+    Field(
+        tag="264",
+        indicators=[" ", "1"],
+        subfields=[
+            Subfield(code="a", value="New York ;"),
+            Subfield(code="a", value="London :"),
+            Subfield(code="b", value="Publisher,"),
+            Subfield(code="c", value="2015."),
+            Subfield(code="c", value="2015."),
+        ],
+    ),
+]
+
+
+def make_mapper(with_plan: bool):
+    conditions = Conditions.__new__(Conditions)
+    conditions.condition_cache = {}
+    conditions.condition_memo = None
+    mapper = RulesMapperBase.__new__(RulesMapperBase)
+    mapper.task_configuration = SimpleNamespace()
+    mapper.conditions = conditions
+    mapper.mappings = MAPPINGS
+    mapper.mapping_plan = MappingPlan({}, conditions)
+    if with_plan:
+        mapper.compile_mapping_plan()
+    return mapper
+
+
+def get_rules(mapping: dict):
+    return [mapping, *mapping.get("entity", [])]
+
+
+@pytest.mark.parametrize("marc_field", FIELDS, ids=lambda marc_field: marc_field.tag)
+def test_the_plan_maps_fields_like_the_interpreter(marc_field):
+    interpreter = make_mapper(False)
+    compiled = make_mapper(True)
+    for mapping in MAPPINGS[marc_field.tag]:
+        for rule in get_rules(mapping):
+            assert compiled.mapping_plan.get(rule)
+            if rule.get("rules"):
+                assert compiled.get_value_from_condition(
+                    "id", rule, marc_field
+                ) == interpreter.get_value_from_condition("id", rule, marc_field)
+            assert compiled.handle_sub_field_delimiters(
+                "id", rule, marc_field
+            ) == interpreter.handle_sub_field_delimiters("id", rule, marc_field)
+
+
+def test_unknown_conditions_are_left_to_the_interpreter():
+    mapper = make_mapper(True)
+    mapping = MAPPINGS["500"][0]
+    assert mapper.mapping_plan.get(mapping) is None
+    with pytest.raises(TransformationProcessError):
+        mapper.get_value_from_condition(
+            "id", mapping, Field(tag="500", subfields=[Subfield(code="a", value="A note")])
+        )
+
+
+def test_replaced_mappings_are_left_to_the_interpreter():
+    mapper = make_mapper(True)
+    assert mapper.mapping_plan.get(dict(MAPPINGS["245"][0])) is None
@@ -0,0 +1,79 @@
+import glob
+import io
+import tracemalloc
+from unittest.mock import Mock
+
+import pymarc
+import pytest
+
+from folio_migration_tools.library_configuration import FileDefinition, MarcFileFormat
+from folio_migration_tools.marc_rules_transformation.marc_reader_wrapper import (
+    MARCReaderWrapper,
+    MARCXMLReader,
+    get_marcxml_part,
+)
+from folio_migration_tools.migration_report import MigrationReport
+
+RECORD = (
+    '<record xmlns="http://www.loc.gov/MARC21/slim"><leader>00000nam a2200000 a 4500</leader>'
+    '<controlfield tag="001">{id_001}</controlfield>'
+    '<datafield tag="245" ind1="1" ind2="0"><subfield code="a">Title {id_001}</subfield>'
+    "</datafield></record>"
+)
+
+
+@pytest.mark.parametrize("path", sorted(glob.glob("tests/test_data/default/*.xml")))
+def test_records_are_read_like_pymarc_reads_them(path):
+    with open(path, "rb") as marcxml_file:
+        records = list(MARCXMLReader(marcxml_file))
+    assert [r.as_json() for r in records] == [r.as_json() for r in pymarc.parse_xml_to_array(path)]
+
+
+def test_wrapped_and_broken_records():
+    xml = (
+        '<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/"><ListRecords>'
+        "<record><header><identifier>oai:1</identifier></header><metadata>"
+        f'{RECORD.format(id_001="a1")}</metadata></record>'
+        '<record><metadata><record xmlns="http://www.loc.gov/MARC21/slim">'
+        "<controlfield>no tag</controlfield></record></metadata></record>"
+        f'<record><metadata>{RECORD.format(id_001="a3")}</metadata></record>'
+        "</ListRecords></OAI-PMH>"
+    )
+    reader = MARCXMLReader(io.BytesIO(xml.encode()))
+    records = []
+    for record in reader:
+        records.append(record["001"].data if record else reader.current_chunk)
+    assert records[0] == "a1"
+    assert b"no tag" in records[1]
+    assert records[2] == "a3"
+
+
+def test_large_files_are_read_in_constant_memory():
+    xml = (
+        "<collection>" + "".join(RECORD.format(id_001=n) for n in range(20000)) + "</collection>"
+    ).encode()
+    tracemalloc.start()
+    count = sum(1 for _ in MARCXMLReader(io.BytesIO(xml)))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert count == 20000
+    assert peak < len(xml) / 4
+
+
+def test_marcxml_files_are_processed(tmp_path):
+    (tmp_path / "bibs.xml").write_text(
+        f'<collection>{"".join(RECORD.format(id_001=n) for n in range(3))}</collection>'
+    )
+    processor = Mock(mapper=Mock(migration_report=MigrationReport()))
+    MARCReaderWrapper.process_single_file(
+        FileDefinition(file_name="bibs.xml", marc_file_format=MarcFileFormat.marcxml),
+        processor,
+        tmp_path / "failed.mrc",
+        Mock(legacy_records_folder=tmp_path),
+    )
+
+    processed = [(c.args[0], c.args[1]["001"].data) for c in processor.process_record.mock_calls]
+    assert processed == [(0, "0"), (1, "1"), (2, "2")]
+    part = get_marcxml_part(tmp_path / "bibs.xml", read_001s=True)
+    assert (part["records"], part["001s"]) == (3, ["0", "1", "2"])
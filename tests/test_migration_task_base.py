@@ -1,9 +1,25 @@
+import json
 from pathlib import Path
+from unittest.mock import Mock
 
+import httpx
 import pytest
+from pymarc import Field, MARCReader, Record
 
 from folio_migration_tools.custom_exceptions import TransformationProcessError
-from folio_migration_tools.library_configuration import FileDefinition
+from folio_migration_tools.library_configuration import (
+    FileDefinition,
+    HttpClientConfiguration,
+    MarcFileFormat,
+)
+from folio_migration_tools.marc_rules_transformation.marc_reader_wrapper import (
+    MARCReaderWrapper,
+    MarcFileIndex,
+    get_record_aligned_ranges,
+    get_record_range,
+)
+from folio_migration_tools.migration_report import MigrationReport
+from folio_migration_tools.migration_tasks import migration_task_base
 from folio_migration_tools.migration_tasks.migration_task_base import MigrationTaskBase
 
 
@@ -28,3 +44,223 @@ def test_list_source_files_one_file():
             Path("./tests/test_data/default/"),
             [FileDefinition(file_name="isbn_c.xml"), FileDefinition(file_name="isbn_n.xml")],
         )
+
+
+def make_task(http_client_configuration):
+    task = Mock(spec=MigrationTaskBase)
+    task.gateway_pool = None
+    task.shared_http_client = None
+    task.library_configuration = Mock(http_client=http_client_configuration)
+    task.folio_client = Mock(okapi_url="http://okapi", ssl_verify=True)
+    task.get_http_client.side_effect = lambda: MigrationTaskBase.get_http_client(task)
+    return task
+
+
+def test_http_client_uses_the_folio_client_by_default():
+    task = make_task(None)
+    assert MigrationTaskBase.get_http_client(task) is task.folio_client.get_folio_http_client()
+
+
+def test_http_client_configuration_sets_limits_and_timeouts(monkeypatch):
+    transports = []
+
+    def make_transport(**kwargs):
+        transports.append(kwargs)
+        return httpx.MockTransport(lambda request: httpx.Response(200))
+
+    monkeypatch.setattr(migration_task_base.httpx, "HTTPTransport", make_transport)
+    monkeypatch.setattr(migration_task_base.importlib.util, "find_spec", lambda name: None)
+    task = make_task(
+        HttpClientConfiguration(
+            max_connections=8, max_keepalive_connections=4, read_timeout=30, http2=True
+        )
+    )
+    client = MigrationTaskBase.get_shared_http_client(task)
+
+    assert MigrationTaskBase.get_shared_http_client(task) is client
+    assert len(transports) == 1
+    assert transports[0]["limits"] == httpx.Limits(
+        max_connections=8, max_keepalive_connections=4, keepalive_expiry=5.0
+    )
+    # h2 is not installed, so the client falls back to HTTP/1.1
+    assert transports[0]["http2"] is False
+    assert client.timeout == httpx.Timeout(None, read=30)
+    MigrationTaskBase.close_shared_http_client(task)
+    assert client.is_closed
+
+
+def write_marc_file(path, ids_001):
+    with open(path, "wb") as marc_file:
+        for number, id_001 in enumerate(ids_001):
+            record = Record()
+            if id_001 is not None:
+                record.add_field(Field(tag="001", data=id_001))
+            record.add_field(Field(tag="500", indicators=[" ", " "], subfields=[]))
+            record.add_field(Field(tag="008", data="x" * (number % 7)))
+            marc_file.write(record.as_marc())
+
+
+def test_marc_files_are_split_at_record_boundaries(tmp_path):
+    ids_001 = [f"b{n}" if n % 4 else None for n in range(10)]
+    write_marc_file(tmp_path / "bibs.mrc", ids_001)
+    ranges = get_record_aligned_ranges(tmp_path / "bibs.mrc", 3, read_001s=True)
+
+    assert len(ranges) == 3
+    assert ranges[0]["start"] == 0
+    assert ranges[-1]["end"] == (tmp_path / "bibs.mrc").stat().st_size
+    assert [r["001s"] for r in ranges] == [
+        ids_001[r["first_index"] : r["first_index"] + r["records"]] for r in ranges
+    ]
+    with open(tmp_path / "bibs.mrc", "rb") as marc_file:
+        read_001s = []
+        for marc_range in ranges:
+            marc_file.seek(marc_range["start"])
+            reader = MARCReader(marc_file)
+            records = list(MARCReaderWrapper.read_until(reader, marc_range["end"]))
+            assert len(records) == marc_range["records"]
+            read_001s += [r["001"].data if "001" in r else None for r in records]
+    assert read_001s == ids_001
+
+
+def test_marc_files_with_invalid_record_lengths_are_left_in_one_part(tmp_path):
+    write_marc_file(tmp_path / "bibs.mrc", ["b1", "b2", "b3"])
+    with open(tmp_path / "bibs.mrc", "ab") as marc_file:
+        marc_file.write(b"garbage")
+    ranges = get_record_aligned_ranges(tmp_path / "bibs.mrc", 10)
+
+    assert [r["records"] for r in ranges] == [1, 1, 1]
+    assert ranges[-1]["unparsed_bytes"] == 7
+
+
+def test_marc_file_index_is_written_and_read_from_the_sidecar(tmp_path):
+    path = tmp_path / "bibs.mrc"
+    write_marc_file(path, ["b0", None, "b\t2"])
+    with open(path, "ab") as marc_file:
+        marc_file.write(b"garbage")
+    ranges = get_record_aligned_ranges(path, 2, read_001s=True, write_index=True)
+
+    marc_index = MarcFileIndex.load(path)
+    assert marc_index.records == MarcFileIndex.build(path).records
+    assert [id_001 for _, _, id_001 in marc_index.records] == ["b0", None, "b\t2"]
+    assert marc_index.unparsed_bytes == 7
+    assert get_record_aligned_ranges(path, 2, read_001s=True) == ranges
+    assert (tmp_path / "bibs.mrc.idx").read_text().splitlines()[1].startswith("0\t0\t")
+
+
+def test_out_of_date_marc_file_index_is_not_used(tmp_path):
+    path = tmp_path / "bibs.mrc"
+    write_marc_file(path, ["b0", "b1"])
+    MarcFileIndex.build(path).save()
+    write_marc_file(path, ["b0", "b1", "b2"])
+
+    assert MarcFileIndex.load(path) is None
+    assert len(MarcFileIndex.get(path).records) == 3
+
+
+def test_marc_file_index_parts_are_read_from_their_first_record(tmp_path):
+    ids_001 = [f"b{n}" for n in range(6)]
+    write_marc_file(tmp_path / "bibs.mrc", ids_001)
+    marc_index = MarcFileIndex.build(tmp_path / "bibs.mrc")
+    processor = Mock(mapper=Mock(migration_report=MigrationReport()))
+    folder_structure = Mock(legacy_records_folder=tmp_path)
+    file_def = FileDefinition(file_name="bibs.mrc", first_record=2, number_of_records=3)
+    [part] = get_record_aligned_ranges(tmp_path / "bibs.mrc", 1, **get_record_range(file_def))
+    assert part == marc_index.get_part(2, 3)
+    MARCReaderWrapper.process_single_file(
+        file_def, processor, tmp_path / "failed.mrc", folder_structure, part
+    )
+
+    processed = [(c.args[0], c.args[1]["001"].data) for c in processor.process_record.mock_calls]
+    assert processed == [(2, "b2"), (3, "b3"), (4, "b4")]
+    assert marc_index.get_part(4)["end"] == (tmp_path / "bibs.mrc").stat().st_size
+    with pytest.raises(TransformationProcessError):
+        marc_index.get_part(6)
+
+
+def test_record_ranges_are_split_between_processes(tmp_path):
+    write_marc_file(tmp_path / "bibs.mrc", [f"b{n}" for n in range(10)])
+    ranges = get_record_aligned_ranges(
+        tmp_path / "bibs.mrc", 2, read_001s=True, first_record=3, number_of_records=6
+    )
+
+    assert [r["001s"] for r in ranges] == [["b3", "b4", "b5"], ["b6", "b7", "b8"]]
+    assert [r["first_index"] for r in ranges] == [3, 6]
+    assert ranges[-1]["unparsed_bytes"] == 0
+    assert get_record_range(FileDefinition(file_name="bibs.mrc")) == {}
+    with pytest.raises(TransformationProcessError):
+        get_record_range(
+            FileDefinition(
+                file_name="bibs.xml", marc_file_format=MarcFileFormat.marcxml, first_record=1
+            )
+        )
+
+
+def test_001_statistics():
+    seen_001s = {"a", "b"}
+    known_001s, duplicates, without_001s = migration_task_base.get_001_statistics(
+        ["a", "c", None, "c", "d", None], seen_001s
+    )
+    assert known_001s == {"a"}
+    assert (duplicates, without_001s) == (2, 2)
+    assert seen_001s == {"a", "b", "c", "d"}
+
+
+def test_shard_results_leave_out_records_with_taken_legacy_ids(tmp_path):
+    task = Mock(spec=MigrationTaskBase)
+    task.mapper = Mock(
+        id_map={"l1": ("l1", "id1", "h1")},
+        migration_report=MigrationReport(),
+        parsed_records=1,
+        mapped_folio_fields={"title": [1]},
+        mapped_legacy_fields={"245": [1, 1]},
+    )
+    task.processor = Mock(legacy_ids={"l1"}, records_count=1, failed_records_count=0)
+    task.processor.srs_records_file = open(tmp_path / "srs.json", "w")
+    task.task_configuration = Mock(create_source_records=True)
+    task.extradata_writer = Mock(path_to_file=tmp_path / "extradata")
+    task.folder_structure = Mock(failed_marc_recs_file=tmp_path / "failed.mrc")
+    (tmp_path / "shard.json").write_text(
+        "".join(f'{{"id": "{folio_id}"}}\n' for folio_id in ["id1", "id2"])
+    )
+    (tmp_path / "shard_srs.json").write_text(
+        "".join(
+            f'{{"externalIdsHolder": {{"instanceId": "{folio_id}"}}}}\n'
+            for folio_id in ["id1", "id2"]
+        )
+    )
+    (tmp_path / "shard_extradata").write_text("note\t{}\n")
+    report = MigrationReport()
+    report.add("GeneralStatistics", "Inventory records written to disk", 2)
+    report.add("GeneralStatistics", "SRS records written to disk", 2)
+    results = {
+        "records_count": 2,
+        "failed_records_count": 0,
+        "id_map": [["l1", "id1", "h2"], ["l2", "id2", "h3"], ["l1", "id2", "h3"]],
+        "report": report.report,
+        "parsed_records": 2,
+        "mapped_folio_fields": {"title": [2], "notes": [1]},
+        "mapped_legacy_fields": {"245": [2, 2]},
+        "hrid_counters": {},
+        "created_objects_path": str(tmp_path / "shard.json"),
+        "srs_records_path": str(tmp_path / "shard_srs.json"),
+        "failed_marc_recs_path": str(tmp_path / "shard_failed.mrc"),
+        "extradata_path": str(tmp_path / "shard_extradata"),
+    }
+    with open(tmp_path / "instances.json", "w") as created_records_file:
+        MigrationTaskBase.merge_marc_shard_results(task, results, created_records_file)
+    task.processor.srs_records_file.close()
+
+    assert [json.loads(line)["id"] for line in open(tmp_path / "instances.json")] == ["id2"]
+    assert len(open(tmp_path / "srs.json").readlines()) == 1
+    assert (tmp_path / "extradata").read_text() == "note\t{}\n"
+    assert not (tmp_path / "shard.json").exists()
+    assert task.mapper.id_map == {"l1": ("l1", "id1", "h1"), "l2": ("l2", "id2", "h3")}
+    assert task.processor.legacy_ids == {"l1", "l2"}
+    assert (task.processor.records_count, task.processor.failed_records_count) == (3, 1)
+    assert task.mapper.parsed_records == 3
+    assert task.mapper.mapped_folio_fields == {"title": [3], "notes": [1]}
+    assert task.mapper.mapped_legacy_fields == {"245": [3, 3]}
+    statistics = task.mapper.migration_report.report["GeneralStatistics"]
+    assert statistics["Inventory records written to disk"] == 1
+    assert statistics["SRS records written to disk"] == 1
+    assert statistics["Duplicate MARC record identifiers "] == 2
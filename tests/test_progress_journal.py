@@ -0,0 +1,47 @@
+from folio_migration_tools.progress_journal import ProgressJournal
+
+
+def test_done_ranges_survive_a_restart(tmp_path):
+    posted_file = tmp_path / "records.json"
+    posted_file.write_text("a\nb\nc\n")
+    journal = ProgressJournal(tmp_path / "journal.json")
+    journal.start_file(posted_file)
+    journal.mark_pending("records.json", 0, 4, 1, 2)
+    journal.mark_done("records.json", 0, 4, 1, 2)
+    journal.mark_pending("records.json", 4, 6, 3, 3)
+    journal.close()
+
+    restarted = ProgressJournal(tmp_path / "journal.json")
+    restarted.start_file(posted_file)
+    assert restarted.get_done_range("records.json", 0)["end"] == 4
+    assert not restarted.get_pending_range("records.json", 0)
+    assert restarted.get_pending_range("records.json", 4)["last_row"] == 3
+
+
+def test_changed_files_are_posted_from_the_start(tmp_path):
+    posted_file = tmp_path / "records.json"
+    posted_file.write_text("a\nb\n")
+    journal = ProgressJournal(tmp_path / "journal.json")
+    journal.start_file(posted_file)
+    journal.mark_done("records.json", 0, 2, 1, 1)
+    journal.close()
+    posted_file.write_text("a\nb\nc\n")
+
+    restarted = ProgressJournal(tmp_path / "journal.json")
+    restarted.start_file(posted_file)
+    assert not restarted.get_done_range("records.json", 0)
+
+
+def test_truncated_last_entry_is_ignored(tmp_path):
+    journal_path = tmp_path / "journal.json"
+    journal_path.write_text(
+        '{"file": "a", "status": "done", "start": 0, "end": 2, "first_row": 1, "last_row": 1}\n'
+        '{"file": "a", "status": "do'
+    )
+    journal = ProgressJournal(journal_path)
+    assert journal.get_done_range("a", 0)
+    journal.mark_done("a", 2, 4, 2, 2)
+    journal.close()
+    assert ProgressJournal(journal_path).get_done_range("a", 2)
+    journal.remove()
+    assert not journal_path.exists()
@@ -0,0 +1,99 @@
+import threading
+
+import httpx
+
+from folio_migration_tools.library_configuration import RateLimit
+from folio_migration_tools.migration_tasks import batch_poster
+from folio_migration_tools.rate_limiter import (
+    RateLimiter,
+    RateLimiters,
+    TokenBucket,
+    get_module,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_get_module():
+    assert get_module("http://okapi/instance-storage/batch/synchronous") == "mod-inventory-storage"
+    assert get_module("/circulation/check-out-by-barcode") == "mod-circulation"
+    assert get_module("/users?query=barcode==1") == "mod-users"
+    assert get_module("/user-import") == "mod-user-import"
+    assert get_module("/unknown") == ""
+
+
+def test_api_info_endpoints_have_modules():
+    for object_type in ["Instances", "Holdings", "Items", "SRS", "Users", "Authorities"]:
+        for use_safe in [True, False]:
+            api_info = batch_poster.get_api_info(object_type, use_safe)
+            assert get_module(api_info["api_endpoint"])
+
+
+def test_rate_limits_for_unknown_modules_are_warned_about(caplog):
+    RateLimiters({"mod-inventory-storage": RateLimit(), "mod-inventory": RateLimit()})
+    warnings = [r.getMessage() for r in caplog.records if r.levelname == "WARNING"]
+    assert len(warnings) == 1
+    assert warnings[0].startswith("No requests are sent to mod-inventory,")
+
+
+def test_token_bucket_keeps_the_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(10, clock=clock, sleep=clock.sleep)
+    for _ in range(10):
+        assert bucket.acquire() == 0
+    # The burst is used up. Every further token takes a tenth of a second
+    for _ in range(20):
+        bucket.acquire()
+    assert round(clock.now, 6) == 2.0
+
+
+def test_token_bucket_lets_large_requests_through_in_debt():
+    clock = FakeClock()
+    bucket = TokenBucket(100, clock=clock, sleep=clock.sleep)
+    assert bucket.acquire(300) == 2.0
+    assert bucket.acquire(100) == 1.0
+
+
+def test_rate_limiter_caps_concurrent_requests():
+    limiter = RateLimiter(RateLimit(max_concurrent_requests=2))
+    in_flight = []
+    peak = []
+    lock = threading.Lock()
+
+    def request():
+        with limiter.limit():
+            with lock:
+                in_flight.append(1)
+                peak.append(len(in_flight))
+            threading.Event().wait(0.01)
+            with lock:
+                in_flight.pop()
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(peak) == 2
+
+
+def test_rate_limiters_only_limit_configured_modules():
+    clock = FakeClock()
+    limiters = RateLimiters(
+        {"mod-circulation": RateLimit(requests_per_second=1)}, sleep=clock.sleep
+    )
+    for _ in range(3):
+        with limiters.limit("http://okapi/users"):
+            pass
+        limiters.event_hook(httpx.Request("POST", "http://okapi/circulation/requests"))
+    assert limiters.get_seconds_waited()["mod-circulation"] > 0
+    assert set(limiters.get_seconds_waited()) == {"mod-circulation"}
@@ -0,0 +1,50 @@
+import json
+
+from folio_migration_tools.migration_report import MigrationReport
+from folio_migration_tools.request_metrics import (
+    RequestMetrics,
+    get_endpoint,
+    get_percentile,
+)
+
+
+def test_get_endpoint_groups_paths_with_ids():
+    assert (
+        get_endpoint(
+            "POST",
+            "http://okapi/coursereserves/courselistings/"
+            "7e131c38-5384-44ed-9f4a-da6ca2f36498/instructors?upsert=true",
+        )
+        == "POST /coursereserves/courselistings/{id}/instructors"
+    )
+
+
+def test_get_percentile():
+    histogram = [0] * 12
+    histogram[3] = 90  # <= 0.5s
+    histogram[6] = 10  # <= 5s
+    assert get_percentile(histogram, 50) == 0.5
+    assert get_percentile(histogram, 95) == 5.0
+    assert get_percentile([0] * 12, 50) == 0.0
+    assert get_percentile([0] * 11 + [1], 99) == 120.0
+
+
+def test_record_and_summarise(tmp_path):
+    metrics_path = tmp_path / "metrics.json"
+    metrics = RequestMetrics(metrics_path, write_interval_seconds=0)
+    metrics.record("POST /items", 0.2, 1000, 10, status_code=503)
+    metrics.record("POST /items", 0.3, 1000, 10, status_code=201, retry=True)
+    metrics.record("POST /items", 0.01, 1000, 10, error="ConnectError")
+
+    written = json.loads(metrics_path.read_text())["endpoints"]["POST /items"]
+    assert written["requests"] == 3
+    assert written["retries"] == 1
+    assert written["bytes_sent"] == 3000
+    assert written["records"] == 10
+    assert written["responses"] == {"503": 1, "201": 1, "ConnectError": 1}
+    assert sum(written["latency_histogram"]) == 3
+
+    report = MigrationReport()
+    metrics.add_to_report(report)
+    assert report.report["RequestMetrics"]["POST /items: requests"] == 3
+    assert report.report["RequestMetrics"]["POST /items: p50 latency (s)"] == 0.25
@@ -0,0 +1,91 @@
+import time
+
+import httpx
+import pytest
+
+from folio_migration_tools.retry_policy import RetryPolicy, get_retry_after
+
+request = httpx.Request("POST", "http://okapi/item-storage/batch/synchronous")
+
+
+def responses(*status_codes, headers=None):
+    """Returns a send function answering with the status codes, in order"""
+    remaining = list(status_codes)
+
+    def send():
+        status_code = remaining.pop(0)
+        if isinstance(status_code, Exception):
+            raise status_code
+        return httpx.Response(status_code, headers=headers, request=request)
+
+    return send
+
+
+def test_retries_transient_errors_until_success():
+    sleeps = []
+    policy = RetryPolicy(sleep=sleeps.append)
+    response = policy.send(responses(503, 502, 201), "Items")
+    assert response.status_code == 201
+    assert len(sleeps) == 2
+    assert 1 <= sleeps[0] <= 2
+    assert 2 <= sleeps[1] <= 4
+    assert policy.retry_counts == {"Items: HTTP 503": 1, "Items: HTTP 502": 1}
+
+
+def test_does_not_retry_other_errors():
+    policy = RetryPolicy(sleep=lambda s: None)
+    assert policy.send(responses(422), "Items").status_code == 422
+    assert policy.retry_counts == {}
+
+
+def test_gives_up_after_max_retries():
+    policy = RetryPolicy(max_retries=2, sleep=lambda s: None)
+    assert policy.send(responses(504, 504, 504), "Holdings").status_code == 504
+    assert policy.retry_counts == {"Holdings: HTTP 504": 2}
+
+
+def test_caps_total_retry_time():
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        time.sleep(seconds)
+
+    policy = RetryPolicy(backoff_seconds=0.05, max_total_seconds=0.06, sleep=sleep)
+    assert policy.send(responses(503, 503), "SRS").status_code == 503
+    assert len(sleeps) == 1
+
+
+def test_honours_retry_after():
+    sleeps = []
+    policy = RetryPolicy(sleep=sleeps.append)
+    policy.send(responses(429, 201, headers={"Retry-After": "7"}), "Users")
+    assert sleeps == [7.0]
+
+
+def test_retry_after_as_http_date():
+    response = httpx.Response(503, headers={"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})
+    assert get_retry_after(response) == 0.0
+    assert get_retry_after(httpx.Response(503)) is None
+    future = httpx.Response(503, headers={"Retry-After": "Wed, 21 Oct 2099 07:28:00 -0000"})
+    assert get_retry_after(future) > 0
+
+
+def test_retries_and_reraises_connection_errors():
+    policy = RetryPolicy(max_retries=1, sleep=lambda s: None)
+    connect_error = httpx.ConnectError("Connection reset", request=request)
+    assert policy.send(responses(connect_error, 201), "notes").status_code == 201
+    with pytest.raises(httpx.ConnectError):
+        policy.send(responses(connect_error, connect_error), "notes")
+    assert policy.retry_counts == {"notes: ConnectError": 2}
+
+
+def test_does_not_resend_requests_that_are_not_idempotent():
+    policy = RetryPolicy(max_retries=1, sleep=lambda s: None)
+    read_timeout = httpx.ReadTimeout("Timed out", request=request)
+    with pytest.raises(httpx.ReadTimeout):
+        policy.send(responses(read_timeout, 201), "Authorities", idempotent=False)
+    assert policy.send(responses(read_timeout, 201), "Authorities").status_code == 201
+    connect_error = httpx.ConnectError("Connection refused", request=request)
+    sent = policy.send(responses(connect_error, 201), "Authorities", idempotent=False)
+    assert sent.status_code == 201